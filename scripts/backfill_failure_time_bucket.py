@@ -0,0 +1,59 @@
+"""
+Preenche o atributo time_bucket nos itens antigos da tabela de histórico de
+falhas, para que apareçam no GSI time_bucket/timestamp_utc consultado pelo
+processamento. Itens que já possuem time_bucket são ignorados.
+
+Uso (a partir da raiz do repositório):
+    python scripts/backfill_failure_time_bucket.py --table <projeto>-FailureHistory
+    DYNAMODB_ENDPOINT_URL=http://localhost:8000 python scripts/backfill_failure_time_bucket.py --table FailureHistory
+"""
+
+import argparse
+import os
+from datetime import datetime, timezone
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+TIME_BUCKET_FORMAT = "%Y-%m-%d"
+
+
+def time_bucket(timestamp_str: str) -> str:
+    """Partição diária (UTC) de um timestamp ISO 8601."""
+    timestamp = datetime.fromisoformat(timestamp_str)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).strftime(TIME_BUCKET_FORMAT)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", required=True)
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource("dynamodb", endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL"))
+    table = dynamodb.Table(args.table)
+
+    scan_kwargs = {
+        "FilterExpression": Attr("time_bucket").not_exists(),
+        "ProjectionExpression": "machine_id, timestamp_utc",
+    }
+    updated = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            table.update_item(
+                Key={"machine_id": item["machine_id"], "timestamp_utc": item["timestamp_utc"]},
+                UpdateExpression="SET time_bucket = :bucket",
+                ExpressionAttributeValues={":bucket": time_bucket(item["timestamp_utc"])},
+            )
+            updated += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    print(f"time_bucket preenchido em {updated} itens da tabela {args.table}.")
+
+
+if __name__ == "__main__":
+    main()
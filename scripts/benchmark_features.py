@@ -0,0 +1,58 @@
+"""
+Benchmark do cálculo de features: laço Python original x versão vetorizada
+(NumPy/pandas), sobre as janelas produzidas pelo merge colunar.
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_features.py --events 1000000 --machines 500
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "processing"))
+
+from benchmark_merge import generate_events, timed  # noqa: E402
+from data_processing import merge_event_batch  # noqa: E402
+from event_batch import EventBatch  # noqa: E402
+from feature_engineering import calculate_features, calculate_features_vectorized  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--machines", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"Gerando {args.events} eventos para {args.machines} máquinas...")
+    window_batch = merge_event_batch(EventBatch.from_events(generate_events(args.events, args.machines)))
+
+    python_states, vectorized_states = {}, {}
+    python_result, python_seconds = timed(
+        lambda windows: calculate_features(windows, python_states), window_batch
+    )
+    vectorized_result, vectorized_seconds = timed(
+        lambda windows: calculate_features_vectorized(windows, vectorized_states), window_batch
+    )
+
+    identical = all(
+        python_result[machine_id]["vib_media_5h"] == features["vib_media_5h"]
+        and python_result[machine_id]["temp_max_24h"] == features["temp_max_24h"]
+        for machine_id, features in vectorized_result.items()
+    ) and list(python_result) == list(vectorized_result)
+    states_identical = python_states.keys() == vectorized_states.keys() and all(
+        python_states[machine_id]["temp_max_24h_state"] == state["temp_max_24h_state"]
+        and abs(python_states[machine_id]["vib_media_5h"] - state["vib_media_5h"]) < 1e-9
+        for machine_id, state in vectorized_states.items()
+    )
+
+    print(f"Janelas: {len(window_batch)}, máquinas: {len(python_result)}")
+    print(f"Features idênticas: {identical} (estado: {states_identical})")
+    print(f"Python:     {python_seconds:.2f}s ({len(window_batch) / python_seconds:,.0f} janelas/s)")
+    print(f"Vetorizado: {vectorized_seconds:.2f}s ({len(window_batch) / vectorized_seconds:,.0f} janelas/s)")
+    print(f"Speedup:    {python_seconds / vectorized_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
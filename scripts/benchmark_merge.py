@@ -0,0 +1,86 @@
+"""
+Benchmark do merge de eventos de sensores: laço Python original x versão
+vetorizada (pandas/NumPy) x merge colunar (EventBatch -> WindowBatch).
+
+Uso (a partir da raiz do repositório):
+    python scripts/benchmark_merge.py --events 1000000 --machines 500
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "processing"))
+
+from data_processing import (  # noqa: E402
+    merge_event_batch,
+    merge_sensor_events,
+    merge_sensor_events_vectorized,
+)
+from event_batch import EventBatch  # noqa: E402
+
+
+def generate_events(total_events: int, machines: int, seed: int = 42):
+    """Gera eventos sintéticos no mesmo formato publicado pelo simulador."""
+    rng = random.Random(seed)
+    start = datetime(2025, 10, 15, tzinfo=timezone.utc)
+    span_seconds = max(total_events // machines, 60) * 20
+    events = []
+    for _ in range(total_events):
+        timestamp = (start + timedelta(seconds=rng.randrange(span_seconds))).isoformat()
+        event = {
+            "machine_id": f"MACHINE-{rng.randrange(machines):04d}",
+            "timestamp_utc": timestamp,
+        }
+        kind = rng.random()
+        if kind < 0.49:
+            event["temperature_celsius"] = round(rng.uniform(50, 110), 2)
+        elif kind < 0.98:
+            event["vibration_rms"] = round(rng.uniform(1, 12), 2)
+        else:
+            event["codigo_evento"] = "FALHA_DETECTADA"
+        events.append(event)
+    return events
+
+
+def timed(function, events):
+    """Executa a função silenciando os prints e devolve (resultado, segundos)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = function(events)
+        elapsed = time.perf_counter() - started
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--machines", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"Gerando {args.events} eventos para {args.machines} máquinas...")
+    events = generate_events(args.events, args.machines)
+
+    python_result, python_seconds = timed(merge_sensor_events, events)
+    vectorized_result, vectorized_seconds = timed(merge_sensor_events_vectorized, events)
+    batch, build_seconds = timed(EventBatch.from_events, events)
+    window_batch, columnar_seconds = timed(merge_event_batch, batch)
+
+    print(f"Janelas geradas: {len(python_result)}")
+    print(f"Resultados idênticos: {python_result == vectorized_result}")
+    print(f"Python:     {python_seconds:.2f}s ({args.events / python_seconds:,.0f} eventos/s)")
+    print(f"Vetorizado: {vectorized_seconds:.2f}s ({args.events / vectorized_seconds:,.0f} eventos/s)")
+    print(f"Speedup:    {python_seconds / vectorized_seconds:.1f}x")
+    print(
+        f"Colunar:    {columnar_seconds:.2f}s de merge + {build_seconds:.2f}s de montagem do "
+        f"EventBatch ({batch.nbytes / 1e6:.1f} MB, {len(window_batch)} janelas)"
+    )
+
+
+if __name__ == "__main__":
+    main()
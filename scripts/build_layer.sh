@@ -92,7 +92,7 @@ main() {
     
     # 5. Instalação do pandas e dependências
     print_step "Instalando pandas e dependências..."
-    pip install pandas numpy
+    pip install pandas numpy pyarrow
     
     # 6. Criação da estrutura correta para Lambda Layer
     print_step "Criando estrutura de diretórios para Lambda Layer..."
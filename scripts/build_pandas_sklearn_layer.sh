@@ -91,7 +91,7 @@ main() {
     
     # 5. Instalação do pandas, scikit-learn e dependências
     print_step "Instalando pandas, scikit-learn e dependências..."
-    pip install pandas numpy scikit-learn
+    pip install pandas numpy scikit-learn pyarrow
     
     # 6. Criação da estrutura correta para Lambda Layer
     print_step "Criando estrutura de diretórios para Lambda Layer..."
@@ -0,0 +1,85 @@
+"""
+Reconstrói, a partir da listagem do S3, o índice (_index.json) das partições
+diárias de processed/training_data/ e processed/feature_history/ gravadas pelo
+processamento.
+
+Use para partições com índice desatualizado (stale) ou gravadas antes da
+existência do índice. As horas de raw/ não têm _index.json: o índice delas é o
+manifesto de compactação, refeito invocando a Lambda de compactação com
+{"hour": ..., "force": true}.
+
+Uso (a partir da raiz do repositório):
+    python scripts/rebuild_partition_index.py --bucket <bucket> --kind features \\
+        --start 2025-10-01 --end 2025-10-16 --only-stale
+    python scripts/rebuild_partition_index.py --bucket <bucket> --kind history \\
+        --start 2025-10-01 --end 2025-10-16
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "processing"))
+
+from data_access import (  # noqa: E402
+    FEATURE_FILE_EXTENSIONS,
+    FEATURE_HISTORY_PREFIX,
+    FEATURES_TIME_FIELDS,
+    PROCESSED_PREFIX,
+    build_day_prefix,
+    get_partition_index,
+    read_features_from_s3,
+    rebuild_partition_index,
+)
+
+
+def parse_time(value: str) -> datetime:
+    """Lê uma data/hora ISO 8601 (sem fuso, tratada como UTC)."""
+    parsed = datetime.fromisoformat(value)
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed
+
+
+def read_feature_rows(bucket: str, key: str):
+    return list(read_features_from_s3(bucket, key).values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--kind", choices=["features", "history"], required=True)
+    parser.add_argument("--start", required=True, help="Início (inclusivo) das partições")
+    parser.add_argument("--end", required=True, help="Fim (exclusivo) das partições")
+    parser.add_argument(
+        "--only-stale",
+        action="store_true",
+        help="Reconstrói apenas partições sem índice ou com índice desatualizado",
+    )
+    args = parser.parse_args()
+
+    step = timedelta(days=1)
+    current = parse_time(args.start).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = parse_time(args.end)
+    root = PROCESSED_PREFIX if args.kind == "features" else FEATURE_HISTORY_PREFIX
+
+    rebuilt = skipped = 0
+    while current < end:
+        prefix = build_day_prefix(root, current)
+        current += step
+
+        if args.only_stale:
+            index, _ = get_partition_index(args.bucket, prefix)
+            if index is not None and not index.get("stale"):
+                skipped += 1
+                continue
+
+        rebuild_partition_index(
+            args.bucket, prefix, FEATURE_FILE_EXTENSIONS, read_feature_rows, FEATURES_TIME_FIELDS
+        )
+        rebuilt += 1
+
+    print(f"{rebuilt} índice(s) reconstruído(s), {skipped} já completo(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
+import base64
 import boto3
 import json
 import os
 import re
+import time
+import uuid
 from datetime import datetime, timezone
 from urllib.parse import unquote
 
@@ -9,6 +12,12 @@ from urllib.parse import unquote
 S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
 S3_PREFIX_ROOT = os.environ.get('S3_PREFIX_ROOT', 'raw')
 
+# Limites do modo em lote: um objeto S3 é gravado por (sensor_type, hora)
+# sempre que um destes limites é atingido ou ao final da invocação.
+BATCH_MAX_RECORDS = int(os.environ.get('BATCH_MAX_RECORDS', 5000))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', 8 * 1024 * 1024))
+BATCH_MAX_AGE_SECONDS = float(os.environ.get('BATCH_MAX_AGE_SECONDS', 60))
+
 s3_client = boto3.client('s3')
 
 def extract_sensor_type_from_topic(mqtt_topic):
@@ -53,7 +62,8 @@ def generate_s3_key(sensor_type, ingestion_time):
     
     epoch_ms = int(ingestion_time.timestamp() * 1000)
     
-    filename = f"{sensor_type}_reading_{epoch_ms}.jsonl"
+    # Sufixo aleatório evita que duas gravações no mesmo milissegundo se sobrescrevam
+    filename = f"{sensor_type}_reading_{epoch_ms}_{uuid.uuid4().hex[:12]}.jsonl"
     
     s3_key = f"{S3_PREFIX_ROOT}/year={year}/month={month}/day={day}/hour={hour}/{filename}"
     
@@ -67,12 +77,24 @@ def save_telemetry_to_s3(payload, s3_key):
         payload (dict): Payload da mensagem MQTT
         s3_key (str): Chave S3 onde salvar o arquivo
     
+    Returns:
+        bool: True se salvou com sucesso, False caso contrário
+    """
+    jsonl_content = json.dumps(payload, separators=(',', ':'))
+    return put_jsonl_object(jsonl_content, s3_key)
+
+def put_jsonl_object(jsonl_content, s3_key):
+    """
+    Grava um conteúdo JSON Lines (uma ou mais linhas) no S3.
+    
+    Args:
+        jsonl_content (str): Conteúdo já serializado em JSON Lines
+        s3_key (str): Chave S3 onde salvar o arquivo
+    
     Returns:
         bool: True se salvou com sucesso, False caso contrário
     """
     try:
-        jsonl_content = json.dumps(payload, separators=(',', ':'))
-        
         s3_client.put_object(
             Bucket=S3_BUCKET_NAME,
             Key=s3_key,
@@ -88,6 +110,36 @@ def save_telemetry_to_s3(payload, s3_key):
         print(f"Erro ao salvar telemetria no S3: {e}")
         return False
 
+def build_telemetry_record(event, ingestion_time):
+    """
+    Normaliza um evento do IoT Core no payload gravado no Data Lake.
+    
+    Args:
+        event (dict): Evento do IoT Core
+        ingestion_time (datetime): Momento da ingestão em UTC
+    
+    Returns:
+        tuple: (sensor_type, payload)
+    
+    Raises:
+        ValueError: Se o evento não contém o tópico MQTT
+    """
+    mqtt_topic = event.get('mqtt_topic', '')
+    if not mqtt_topic:
+        raise ValueError('Tópico MQTT não encontrado no evento')
+    
+    mqtt_topic = unquote(mqtt_topic)
+    
+    sensor_type = extract_sensor_type_from_topic(mqtt_topic)
+    
+    payload = {k: v for k, v in event.items() if k not in ['mqtt_topic', 'topic']}
+    
+    payload['ingestion_timestamp'] = ingestion_time.isoformat()
+    payload['sensor_type'] = sensor_type
+    payload['mqtt_topic'] = mqtt_topic
+    
+    return sensor_type, payload
+
 def process_iot_event(event):
     """
     Processa um evento do IoT Core e salva a telemetria no S3.
@@ -99,24 +151,15 @@ def process_iot_event(event):
         dict: Resultado do processamento
     """
     try:
-        mqtt_topic = event.get('mqtt_topic', '')
-        if not mqtt_topic:
+        ingestion_time = datetime.now(timezone.utc)
+        try:
+            sensor_type, payload = build_telemetry_record(event, ingestion_time)
+        except ValueError as e:
             return {
                 'statusCode': 400,
-                'body': 'Tópico MQTT não encontrado no evento'
+                'body': str(e)
             }
         
-        mqtt_topic = unquote(mqtt_topic)
-        
-        sensor_type = extract_sensor_type_from_topic(mqtt_topic)
-        
-        payload = {k: v for k, v in event.items() if k not in ['mqtt_topic', 'topic']}
-        
-        ingestion_time = datetime.now(timezone.utc)
-        payload['ingestion_timestamp'] = ingestion_time.isoformat()
-        payload['sensor_type'] = sensor_type
-        payload['mqtt_topic'] = mqtt_topic
-        
         s3_key = generate_s3_key(sensor_type, ingestion_time)
         
         success = save_telemetry_to_s3(payload, s3_key)
@@ -144,18 +187,181 @@ def process_iot_event(event):
             'body': f'Erro interno: {str(e)}'
         }
 
+class TelemetryBatchBuffer:
+    """
+    Acumula registros de telemetria e grava um único objeto JSON Lines por
+    (sensor_type, hora de ingestão), em vez de um objeto por mensagem MQTT.
+    
+    Uma partição é descarregada no S3 quando atinge o número máximo de
+    registros, o tamanho máximo em bytes ou a idade máxima, e todas as
+    partições pendentes são descarregadas em flush_all().
+    """
+
+    def __init__(self, max_records=BATCH_MAX_RECORDS, max_bytes=BATCH_MAX_BYTES,
+                 max_age_seconds=BATCH_MAX_AGE_SECONDS):
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._partitions = {}
+        self.written_keys = []
+        self.failed_record_ids = []
+
+    def add(self, record_id, sensor_type, payload, ingestion_time):
+        """Adiciona um registro ao buffer da sua partição (sensor_type, hora)."""
+        line = json.dumps(payload, separators=(',', ':'))
+        partition_key = (sensor_type, ingestion_time.strftime('%Y%m%d%H'))
+
+        partition = self._partitions.get(partition_key)
+        if partition is None:
+            partition = {
+                'sensor_type': sensor_type,
+                'ingestion_time': ingestion_time,
+                'created_at': time.monotonic(),
+                'lines': [],
+                'record_ids': [],
+                'bytes': 0
+            }
+            self._partitions[partition_key] = partition
+
+        partition['lines'].append(line)
+        partition['record_ids'].append(record_id)
+        partition['bytes'] += len(line) + 1
+
+        if (len(partition['lines']) >= self.max_records
+                or partition['bytes'] >= self.max_bytes):
+            self._flush_partition(partition_key)
+
+        self.flush_expired()
+
+    def flush_expired(self):
+        """Descarrega as partições que ultrapassaram a idade máxima."""
+        now = time.monotonic()
+        expired = [
+            key for key, partition in self._partitions.items()
+            if now - partition['created_at'] >= self.max_age_seconds
+        ]
+        for key in expired:
+            self._flush_partition(key)
+
+    def flush_all(self):
+        """Descarrega todas as partições pendentes."""
+        for key in list(self._partitions):
+            self._flush_partition(key)
+
+    def _flush_partition(self, partition_key):
+        partition = self._partitions.pop(partition_key)
+        s3_key = generate_s3_key(partition['sensor_type'], partition['ingestion_time'])
+        body = '\n'.join(partition['lines']) + '\n'
+
+        if put_jsonl_object(body, s3_key):
+            self.written_keys.append(s3_key)
+        else:
+            self.failed_record_ids.extend(partition['record_ids'])
+
+def extract_batch_records(event):
+    """
+    Extrai os eventos de telemetria de um evento em lote.
+    
+    Suporta uma lista simples de eventos do IoT Core e eventos com 'Records'
+    no formato SQS (body em JSON) ou Kinesis (data em base64).
+    
+    Args:
+        event (dict | list): Evento em lote recebido pela Lambda
+    
+    Returns:
+        list: Tuplas (record_id, evento_iot). evento_iot é None quando o
+              registro não pôde ser decodificado.
+    """
+    if isinstance(event, list):
+        return [(str(index), item) for index, item in enumerate(event)]
+
+    records = []
+    for index, record in enumerate(event.get('Records', [])):
+        record_id = record.get('messageId') or record.get('kinesis', {}).get('sequenceNumber') or str(index)
+        try:
+            if 'kinesis' in record:
+                raw = base64.b64decode(record['kinesis']['data']).decode('utf-8')
+            else:
+                raw = record['body']
+            records.append((record_id, json.loads(raw)))
+        except Exception as e:
+            print(f"Erro ao decodificar registro {record_id}: {e}")
+            records.append((record_id, None))
+    return records
+
+def process_iot_batch(event, buffer=None):
+    """
+    Processa um lote de eventos do IoT Core, gravando um objeto JSON Lines
+    por (sensor_type, hora) em vez de um objeto por mensagem.
+    
+    Args:
+        event (dict | list): Evento em lote (lista, SQS ou Kinesis)
+        buffer (TelemetryBatchBuffer): Buffer opcional (padrão: limites do ambiente)
+    
+    Returns:
+        dict: Resultado do processamento, incluindo 'batchItemFailures' no
+              formato de resposta parcial de lote da Lambda
+    """
+    buffer = buffer or TelemetryBatchBuffer()
+    records = extract_batch_records(event)
+    invalid_record_ids = []
+
+    for record_id, iot_event in records:
+        if not isinstance(iot_event, dict):
+            invalid_record_ids.append(record_id)
+            continue
+        try:
+            ingestion_time = datetime.now(timezone.utc)
+            sensor_type, payload = build_telemetry_record(iot_event, ingestion_time)
+            buffer.add(record_id, sensor_type, payload, ingestion_time)
+        except Exception as e:
+            print(f"Erro ao processar registro {record_id}: {e}")
+            invalid_record_ids.append(record_id)
+
+    buffer.flush_all()
+
+    failed_ids = invalid_record_ids + buffer.failed_record_ids
+    print(
+        f"Lote processado: {len(records)} registros, {len(buffer.written_keys)} objetos "
+        f"gravados, {len(failed_ids)} falhas"
+    )
+
+    return {
+        'statusCode': 200 if not failed_ids else 207,
+        'body': {
+            'message': 'Lote de telemetria processado',
+            'records_received': len(records),
+            'records_failed': len(failed_ids),
+            's3_keys': buffer.written_keys
+        },
+        'batchItemFailures': [{'itemIdentifier': record_id} for record_id in failed_ids]
+    }
+
+def is_batch_event(event):
+    """Indica se o evento recebido é um lote (lista ou 'Records' de SQS/Kinesis)."""
+    return isinstance(event, list) or (isinstance(event, dict) and 'Records' in event)
+
 def handler(event, context):
     """
     Ponto de entrada da Lambda para processamento de telemetria IoT.
     
+    Aceita tanto um evento individual do IoT Core quanto um lote de eventos
+    (lista, SQS ou Kinesis); no segundo caso a telemetria é gravada em lote.
+    
     Args:
-        event (dict): Evento do IoT Core contendo dados de telemetria
+        event (dict | list): Evento do IoT Core contendo dados de telemetria
         context: Contexto da execução Lambda
     
     Returns:
         dict: Resposta da função
     """
     print(f"Iniciando processamento de telemetria...")
+
+    if is_batch_event(event):
+        result = process_iot_batch(event)
+        print(f"Resultado do processamento em lote: {json.dumps(result['body'])}")
+        return result
+
     print(f"Evento recebido: {json.dumps(event, indent=2)}")
     
 
@@ -1,14 +1,33 @@
 import boto3
 import json
 import os
+from datetime import datetime, timezone
 from decimal import Decimal
 
 DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME", "FailureHistory")
+# Partição diária do GSI time_bucket/timestamp_utc usado pelo processamento
+TIME_BUCKET_FORMAT = "%Y-%m-%d"
 
-dynamodb = boto3.resource("dynamodb")
+dynamodb = boto3.resource("dynamodb", endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL"))
 table = dynamodb.Table(DYNAMODB_TABLE_NAME)
 
 
+def build_failure_item(event: dict) -> dict:
+    """
+    Monta o item da tabela de histórico de falhas: chave machine_id +
+    timestamp_utc (normalizado para UTC) e o atributo time_bucket do GSI
+    consultado pelo processamento.
+    """
+    item = json.loads(json.dumps(event), parse_float=Decimal)
+    timestamp = datetime.fromisoformat(item["timestamp_utc"])
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    item["timestamp_utc"] = timestamp.isoformat()
+    item["time_bucket"] = timestamp.strftime(TIME_BUCKET_FORMAT)
+    return item
+
+
 def lambda_handler(event, context):
     """
     Ponto de entrada da Lambda. Recebe um evento de falha do IoT Core
@@ -17,7 +36,7 @@ def lambda_handler(event, context):
     print(f"Recebido evento de falha: {json.dumps(event)}")
 
     try:
-        event = json.loads(json.dumps(event), parse_float=Decimal)
+        event = build_failure_item(event)
         print(f"Inserindo item na tabela {DYNAMODB_TABLE_NAME}: {event}")
 
         response = table.put_item(Item=event)
@@ -0,0 +1,115 @@
+"""
+Módulo de backfill do pipeline de features.
+Reprocessa um intervalo histórico dividindo-o em janelas independentes,
+processadas em paralelo por processos (ProcessPoolExecutor).
+
+Cada janela é idempotente: não usa o checkpoint do SSM, o estado das
+máquinas nem a Feature Store, e grava as features no S3 com chave
+determinística pelo início da janela, a mesma das execuções regulares
+(reprocessar sobrescreve o arquivo). Janelas com arquivos de outra execução
+iniciados dentro delas são ignoradas.
+O estado das features stateful é reconstruído a partir das horas anteriores
+à janela (BACKFILL_WARMUP_HOURS, padrão 24h, o tamanho de temp_max_24h).
+
+Uso (a partir de src/processing, com as mesmas variáveis de ambiente da Lambda):
+    python backfill.py --start 2025-10-01T00:00:00 --end 2025-10-08T00:00:00 --workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from lambda_function import build_config
+from pipeline import FeaturePipeline
+
+# Horas lidas antes de cada janela para reconstruir o estado das features
+BACKFILL_WARMUP_HOURS = int(os.getenv("BACKFILL_WARMUP_HOURS", 24))
+
+
+def split_windows(start: datetime, end: datetime, window_hours: int) -> List[Tuple[datetime, datetime]]:
+    """Divide [start, end) em janelas consecutivas de window_hours horas."""
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + timedelta(hours=window_hours), end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+def _backfill_window(config: Dict, window_start: datetime, window_end: datetime, warmup_hours: int) -> str:
+    """Processa uma janela em um processo de trabalho."""
+    pipeline = FeaturePipeline(**config)
+    return pipeline.run_backfill_window(window_start, window_end, warmup_hours)
+
+
+def run_backfill(
+    config: Dict,
+    start: datetime,
+    end: datetime,
+    max_workers: int = None,
+    warmup_hours: int = BACKFILL_WARMUP_HOURS,
+) -> List[str]:
+    """
+    Reprocessa [start, end) em janelas de config['time_window'] horas.
+
+    Args:
+        config: Configuração do FeaturePipeline (ver lambda_function.build_config).
+        start: Início do intervalo (UTC).
+        end: Fim do intervalo (UTC).
+        max_workers: Número de processos (padrão: número de CPUs).
+        warmup_hours: Horas lidas antes de cada janela para o estado das features.
+
+    Returns:
+        O resultado de cada janela, em ordem cronológica.
+    """
+    # O backfill não lê nem grava o estado persistido das máquinas
+    config = dict(config, state_table=None, state_file=None)
+    windows = split_windows(start, end, config.get("time_window", 1))
+    print(f"Backfill de {len(windows)} janelas entre {start.isoformat()} e {end.isoformat()}.")
+
+    # 'spawn': cada processo cria seus próprios clientes boto3 (não são seguros após fork)
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(_backfill_window, config, window_start, window_end, warmup_hours)
+            for window_start, window_end in windows
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            print(result)
+            results.append(result)
+    return results
+
+
+def _parse_utc(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", required=True, help="Início do intervalo (ISO 8601, UTC)")
+    parser.add_argument("--end", required=True, help="Fim do intervalo (ISO 8601, UTC)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--warmup-hours", type=int, default=BACKFILL_WARMUP_HOURS)
+    args = parser.parse_args()
+
+    run_backfill(
+        build_config(),
+        _parse_utc(args.start),
+        _parse_utc(args.end),
+        max_workers=args.workers,
+        warmup_hours=args.warmup_hours,
+    )
+
+
+if __name__ == "__main__":
+    main()
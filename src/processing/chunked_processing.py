@@ -0,0 +1,224 @@
+"""
+Módulo de processamento em blocos (modo chunked) de janelas grandes.
+Os eventos de sensores são consumidos em blocos de tamanho fixo: cada bloco
+passa pelo merge e suas janelas parciais são combinadas em um WindowStore.
+O cálculo de features percorre o WindowStore em ordem cronológica, também
+em blocos, levando o estado das máquinas de um bloco para o seguinte.
+
+Uma janela (máquina, minuto) pode receber eventos de blocos diferentes
+(ex: temperatura e vibração em arquivos distintos). Enquanto cabem no
+orçamento, as janelas ficam em memória; acima dele, são despejadas (spill)
+em um arquivo SQLite temporário no disco local (/tmp na Lambda).
+
+O resultado é idêntico ao do modo em memória: a leitura mais recente de
+cada campo prevalece, e as janelas são percorridas na mesma ordem de
+sorted() (timestamp da janela, empatado pela ordem de primeira aparição).
+"""
+
+import itertools
+import os
+import sqlite3
+import tempfile
+from typing import Dict, Iterable, Iterator, List
+
+from data_processing import merge_events
+from event_batch import WindowBatch
+from feature_engineering import compute_features, FEATURE_ENGINE_PYTHON, VIB_EMA_ALPHA
+
+# Campos de leitura de uma janela combinados entre blocos
+WINDOW_FIELDS = ("temperatura", "vibracao", "falha")
+DEFAULT_SPILL_DIR = "/tmp"
+
+
+def iter_chunks(events: Iterable, chunk_size: int) -> Iterator[List]:
+    """Agrupa um iterável de eventos em listas de até chunk_size eventos."""
+    iterator = iter(events)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class WindowStore:
+    """
+    Janelas agrupadas de uma execução, combinadas bloco a bloco. Mantém até
+    max_windows_in_memory janelas em memória e despeja as excedentes em um
+    arquivo SQLite em spill_dir, removido em close().
+    """
+
+    def __init__(self, max_windows_in_memory: int, spill_dir: str = DEFAULT_SPILL_DIR):
+        self.max_windows_in_memory = max_windows_in_memory
+        self.spill_dir = spill_dir
+        self.machine_ids = set()
+        self._windows: Dict[str, Dict] = {}
+        self._connection = None
+        self._path = None
+        self._next_seq = 0
+        self._spilled_count = 0
+
+    def __len__(self) -> int:
+        return len(self._windows) + self._spilled_count
+
+    @property
+    def spilled(self) -> bool:
+        return self._connection is not None
+
+    def add(self, grouped_windows: Dict) -> None:
+        """
+        Combina as janelas parciais de um bloco: cada campo não nulo do bloco
+        substitui o valor anterior, como na leitura sequencial dos eventos.
+        """
+        for window_key, window in grouped_windows.items():
+            current = self._windows.get(window_key)
+            if current is None:
+                self._windows[window_key] = dict(window)
+                self.machine_ids.add(window["machine_id"])
+                continue
+            for field in WINDOW_FIELDS:
+                if window.get(field) is not None:
+                    current[field] = window[field]
+
+        if len(self._windows) > self.max_windows_in_memory:
+            self._spill()
+
+    def _open_spill(self) -> None:
+        handle, self._path = tempfile.mkstemp(
+            prefix="windows-", suffix=".sqlite", dir=self.spill_dir
+        )
+        os.close(handle)
+        # check_same_thread=False: no modo em pipeline, o store é criado na
+        # thread de pré-busca e lido na thread principal (nunca ao mesmo tempo)
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        # Arquivo descartável: sem journal nem fsync
+        self._connection.execute("PRAGMA journal_mode = OFF")
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute(
+            "CREATE TABLE windows (window_key TEXT PRIMARY KEY, seq INTEGER, "
+            "machine_id TEXT, timestamp_janela TEXT, temperatura, vibracao, falha)"
+        )
+        self._connection.execute("CREATE INDEX windows_order ON windows (timestamp_janela, seq)")
+        print(f"Orçamento de {self.max_windows_in_memory} janelas em memória excedido. Usando {self._path}.")
+
+    def _spill(self) -> None:
+        """Despeja as janelas em memória no SQLite, combinando com as já despejadas."""
+        if self._connection is None:
+            self._open_spill()
+        rows = []
+        for window_key, window in self._windows.items():
+            rows.append((
+                window_key,
+                self._next_seq,
+                window["machine_id"],
+                window["timestamp_janela"],
+                window.get("temperatura"),
+                window.get("vibracao"),
+                window.get("falha"),
+            ))
+            self._next_seq += 1
+        # seq só é gravado na primeira aparição: preserva a ordem de desempate
+        self._connection.executemany(
+            "INSERT INTO windows VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (window_key) DO UPDATE SET "
+            "temperatura = COALESCE(excluded.temperatura, temperatura), "
+            "vibracao = COALESCE(excluded.vibracao, vibracao), "
+            "falha = COALESCE(excluded.falha, falha)",
+            rows,
+        )
+        self._connection.commit()
+        self._windows = {}
+        self._spilled_count = self._connection.execute("SELECT COUNT(*) FROM windows").fetchone()[0]
+
+    def iter_chronological_chunks(self, chunk_size: int) -> Iterator[Dict]:
+        """
+        Gera as janelas em ordem cronológica, em dicionários de até chunk_size
+        janelas no formato de merge_sensor_events.
+        """
+        if not self.spilled:
+            windows = sorted(self._windows.values(), key=lambda item: item["timestamp_janela"])
+            for offset in range(0, len(windows), chunk_size):
+                yield {
+                    f"{window['machine_id']}_{window['timestamp_janela']}": window
+                    for window in windows[offset:offset + chunk_size]
+                }
+            return
+
+        if self._windows:
+            self._spill()
+        cursor = self._connection.execute(
+            "SELECT window_key, machine_id, timestamp_janela, temperatura, vibracao, falha "
+            "FROM windows ORDER BY timestamp_janela, seq"
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield {
+                window_key: {
+                    "machine_id": machine_id,
+                    "timestamp_janela": timestamp_janela,
+                    "temperatura": temperatura,
+                    "vibracao": vibracao,
+                    "falha": falha,
+                }
+                for window_key, machine_id, timestamp_janela, temperatura, vibracao, falha in rows
+            }
+
+    def close(self) -> None:
+        """Libera as janelas e remove o arquivo de spill."""
+        self._windows = {}
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            os.remove(self._path)
+
+
+def merge_events_chunked(
+    events: Iterable[Dict],
+    engine: str,
+    chunk_size: int,
+    max_windows_in_memory: int,
+    spill_dir: str = DEFAULT_SPILL_DIR,
+) -> WindowStore:
+    """
+    Faz o merge dos eventos bloco a bloco, sem materializar a janela inteira.
+
+    Args:
+        events: Os eventos brutos (ex: o gerador de iter_sensor_events).
+        engine: Engine de merge aplicada a cada bloco (ver merge_events).
+        chunk_size: Número de eventos por bloco.
+        max_windows_in_memory: Janelas mantidas em memória antes do spill.
+        spill_dir: Diretório do arquivo de spill.
+
+    Returns:
+        O WindowStore com as janelas combinadas de todos os blocos.
+    """
+    store = WindowStore(max_windows_in_memory, spill_dir)
+    chunks = 0
+    for chunk in iter_chunks(events, chunk_size):
+        grouped = merge_events(chunk, engine)
+        if isinstance(grouped, WindowBatch):
+            grouped = grouped.to_dict()
+        store.add(grouped)
+        chunks += 1
+    print(f"{len(store)} janelas de tempo combinadas a partir de {chunks} bloco(s) de eventos.")
+    return store
+
+
+def compute_features_chunked(
+    store: WindowStore,
+    previous_machine_states: Dict,
+    engine: str = FEATURE_ENGINE_PYTHON,
+    chunk_size: int = 100_000,
+    alpha: float = VIB_EMA_ALPHA,
+) -> Dict:
+    """
+    Calcula as features percorrendo o WindowStore em blocos cronológicos.
+    O estado de cada máquina (previous_machine_states, atualizado no lugar)
+    passa de um bloco para o seguinte, e a última janela de cada máquina
+    define suas features, como no cálculo em um único bloco.
+    """
+    final_features = {}
+    for windows in store.iter_chronological_chunks(chunk_size):
+        final_features.update(compute_features(windows, previous_machine_states, engine, alpha))
+    return final_features
@@ -0,0 +1,159 @@
+"""
+Módulo de compactação do Data Lake bruto.
+Une os pequenos arquivos *_reading_*.jsonl de uma hora já encerrada em poucos
+arquivos Parquet comprimidos e grava um manifesto, reduzindo milhares de GETs
+por hora a algumas leituras. O manifesto também registra as estatísticas de
+chegada da hora, usadas pelo watermark do pipeline (ver watermark), e é o
+índice da hora: registros, intervalo de tempo de evento e máquinas de cada
+arquivo, usados para podar as leituras sem listar o raw/.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Dict, List
+
+import pandas as pd
+
+from data_access import (
+    COMPACTED_PREFIX,
+    COMPACTED_READ_BATCH_RECORDS,
+    COMPACTION_MANIFEST_FILE,
+    build_hour_prefix,
+    get_compaction_manifest,
+    list_raw_objects,
+    read_jsonl_object,
+    s3_client,
+    summarize_events,
+)
+from watermark import partition_arrival_stats
+
+
+# Máximo de registros por arquivo Parquet gerado
+MAX_RECORDS_PER_FILE = int(os.getenv("COMPACTION_MAX_RECORDS_PER_FILE", 1_000_000))
+# Tempo de espera após o fim da hora antes de considerá-la encerrada
+GRACE_MINUTES = int(os.getenv("COMPACTION_GRACE_MINUTES", 10))
+# Quantas horas encerradas são verificadas a cada execução agendada
+LOOKBACK_HOURS = int(os.getenv("COMPACTION_LOOKBACK_HOURS", 3))
+
+
+def _events_to_dataframe(events: List[Dict]) -> pd.DataFrame:
+    """
+    Converte os eventos em um DataFrame com tipos compatíveis com Parquet.
+    Colunas de texto que misturam tipos (ex: número e string) são gravadas
+    como string para não quebrar o schema.
+    """
+    df = pd.DataFrame.from_records(events)
+    for column in df.columns:
+        if df[column].dtype == object:
+            non_null = df[column].dropna()
+            if not non_null.map(lambda value: isinstance(value, str)).all():
+                df[column] = df[column].map(
+                    lambda value: None if value is None else str(value)
+                )
+    return df
+
+
+def compact_hour(bucket: str, hour: datetime, force: bool = False) -> Dict:
+    """
+    Compacta todos os arquivos .jsonl brutos de uma hora em arquivos Parquet
+    (compressão snappy) e grava o manifesto da hora.
+
+    Os objetos brutos não são removidos: o manifesto passa a ser a fonte de
+    leitura de fetch_sensor_data e os brutos podem expirar por lifecycle.
+
+    Args:
+        bucket: O nome do bucket S3 do data lake.
+        hour: Hora (UTC) a ser compactada.
+        force: Recompacta mesmo que já exista manifesto.
+
+    Returns:
+        O manifesto gravado (ou o existente, se a hora já estava compactada).
+    """
+    hour = hour.replace(minute=0, second=0, microsecond=0)
+    if not force:
+        existing = get_compaction_manifest(bucket, hour)
+        if existing is not None:
+            print(f"Hora {hour.isoformat()} já compactada. Ignorando.")
+            return existing
+
+    raw_objects = list_raw_objects(bucket, hour)
+    events = []
+    for obj in raw_objects:
+        events.extend(read_jsonl_object(bucket, obj["Key"]))
+
+    compacted_prefix = build_hour_prefix(COMPACTED_PREFIX, hour)
+    files = []
+    for part, offset in enumerate(range(0, len(events), MAX_RECORDS_PER_FILE)):
+        chunk = events[offset:offset + MAX_RECORDS_PER_FILE]
+        buffer = BytesIO()
+        # Row groups do tamanho dos lotes de leitura (ver data_access.read_compacted_batches)
+        _events_to_dataframe(chunk).to_parquet(
+            buffer, index=False, compression="snappy", row_group_size=COMPACTED_READ_BATCH_RECORDS
+        )
+        key = f"{compacted_prefix}part-{part:05d}.parquet"
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=buffer.getvalue(),
+            ContentType="application/vnd.apache.parquet",
+        )
+        # Estatísticas por arquivo permitem podar leituras por máquina e tempo de evento
+        files.append(
+            {"key": key, "records": len(chunk), "bytes": buffer.tell(), **summarize_events(chunk)}
+        )
+
+    manifest = {
+        "hour": hour.isoformat(),
+        "compacted_at": datetime.now(timezone.utc).isoformat(),
+        "source_objects": len(raw_objects),
+        "source_bytes": sum(obj["Size"] for obj in raw_objects),
+        "records": len(events),
+        "files": files,
+    }
+    manifest.update(partition_arrival_stats(events, hour))
+    # O manifesto é gravado por último: leitores só o enxergam com os arquivos prontos
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=compacted_prefix + COMPACTION_MANIFEST_FILE,
+        Body=json.dumps(manifest),
+        ContentType="application/json",
+    )
+    print(
+        f"Hora {hour.isoformat()} compactada: {len(raw_objects)} objetos -> "
+        f"{len(files)} arquivo(s), {len(events)} registros."
+    )
+    return manifest
+
+
+def closed_hours(now: datetime, lookback_hours: int = LOOKBACK_HOURS) -> List[datetime]:
+    """Retorna as últimas horas já encerradas (considerando a carência)."""
+    last_closed = (now - timedelta(minutes=GRACE_MINUTES)).replace(
+        minute=0, second=0, microsecond=0
+    ) - timedelta(hours=1)
+    return [last_closed - timedelta(hours=i) for i in range(lookback_hours)]
+
+
+def lambda_handler(event, context):
+    """
+    Ponto de entrada da Lambda de compactação.
+
+    Sem parâmetros, compacta as últimas horas encerradas ainda sem manifesto.
+    Aceita também {"hour": "2025-10-15T09:00:00+00:00", "force": true} para
+    compactar (ou recompactar) uma hora específica.
+    """
+    bucket = os.getenv("DATA_LAKE_BUCKET")
+    event = event or {}
+
+    if event.get("hour"):
+        hours = [datetime.fromisoformat(event["hour"]).replace(tzinfo=timezone.utc)]
+    else:
+        hours = closed_hours(datetime.now(timezone.utc))
+
+    results = []
+    for hour in hours:
+        manifest = compact_hour(bucket, hour, force=bool(event.get("force")))
+        results.append({"hour": manifest["hour"], "records": manifest["records"]})
+
+    return {"statusCode": 200, "body": json.dumps(results)}
@@ -4,121 +4,883 @@ Centraliza todas as operações de leitura e escrita em recursos AWS.
 """
 
 import boto3
+import hashlib
+import os
+import random
+import time
 import pandas as pd
-from io import StringIO
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 import json
 from boto3.dynamodb.conditions import Key, Attr
-from typing import List, Dict
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 
+import metrics
+from event_batch import EventBatch
 
-# Clientes AWS
-s3_client = boto3.client("s3")
-dynamodb_resource = boto3.resource("dynamodb")
+
+# Número de threads usadas na leitura concorrente do S3
+S3_MAX_WORKERS = int(os.getenv("S3_MAX_WORKERS", 16))
+# Registros baixados e ainda não consumidos na leitura concorrente (ver iter_sensor_events)
+S3_MAX_IN_FLIGHT_RECORDS = int(os.getenv("S3_MAX_IN_FLIGHT_RECORDS", 200_000))
+# Registros convertidos em eventos de cada vez na leitura de um arquivo compactado
+COMPACTED_READ_BATCH_RECORDS = int(os.getenv("COMPACTED_READ_BATCH_RECORDS", 50_000))
+# Tamanho médio de um evento .jsonl bruto, para estimar os registros de um objeto listado
+RAW_EVENT_BYTES_ESTIMATE = 250
+# Número de threads que gravam lotes (BatchWriteItem) em paralelo no DynamoDB
+DYNAMODB_WRITE_WORKERS = int(os.getenv("DYNAMODB_WRITE_WORKERS", 8))
+
+# Clientes AWS (thread-safe; o pool de conexões do S3 acompanha o número de threads)
+s3_client = boto3.client(
+    "s3", config=Config(max_pool_connections=max(S3_MAX_WORKERS, 10))
+)
+# DYNAMODB_ENDPOINT_URL aponta para um DynamoDB local (ex: DynamoDB Local) em testes.
+# O modo de retry 'adaptive' limita a taxa do cliente quando há throttling.
+dynamodb_resource = boto3.resource(
+    "dynamodb",
+    endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL"),
+    config=Config(
+        max_pool_connections=max(DYNAMODB_WRITE_WORKERS, 10),
+        retries={"mode": "adaptive", "max_attempts": 10},
+    ),
+)
 ssm_client = boto3.client("ssm")
 
 
 # === OPERAÇÕES S3 ===
 
 
+RAW_PREFIX = "raw"
+COMPACTED_PREFIX = "compacted"
+COMPACTION_MANIFEST_FILE = "_manifest.json"
+PROCESSED_PREFIX = "processed/training_data"
+# Features ainda sem labels (modo watermark), publicadas em PROCESSED_PREFIX ao completar o horizonte
+PENDING_LABELS_PREFIX = "processed/pending_labels"
+FEATURES_FILE_TIME_FORMAT = "%Y%m%d_%H%M%S"
+# Formato dos arquivos de features em processed/training_data ('parquet' ou 'csv')
+FEATURES_OUTPUT_FORMAT = os.getenv("FEATURES_OUTPUT_FORMAT", "parquet")
+# Histórico de features sem labels, só com inclusões: cada cálculo ou recálculo
+# grava um novo snapshot, e a preparação do treino rotula qualquer horizonte
+FEATURE_HISTORY_PREFIX = "processed/feature_history"
+FEATURE_HISTORY_ENABLED = os.getenv("FEATURE_HISTORY_ENABLED", "true").lower() == "true"
+
+# Índice de cada partição diária de features (processed/training_data/.../day=DD/
+# e processed/feature_history/.../day=DD/), mantido por quem grava os objetos
+# (ver update_partition_index). No raw/, o índice de cada hora é o manifesto
+# de compactação (ver compaction), com as mesmas estatísticas por arquivo.
+PARTITION_INDEX_FILE = "_index.json"
+# Tentativas de gravação condicional do índice antes de marcá-lo como desatualizado
+PARTITION_INDEX_MAX_ATTEMPTS = int(os.getenv("PARTITION_INDEX_MAX_ATTEMPTS", 5))
+# Prefixo comparável do horário de um evento (como em watermark.event_wall_time)
+EVENT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EVENT_TIME_LENGTH = len("2025-10-15T09:00:00")
+# Campo de tempo das linhas de features usado nas estatísticas do índice
+FEATURES_TIME_FIELDS = ("timestamp_janela",)
+# Extensões dos objetos indexados nas partições de features
+FEATURE_FILE_EXTENSIONS = (".parquet", ".csv")
+
+
+def build_hour_prefix(root: str, hour: datetime) -> str:
+    """
+    Monta o prefixo particionado (year=/month=/day=/hour=) de uma hora.
+
+    Args:
+        root: Prefixo raiz (ex: 'raw' ou 'compacted').
+        hour: Hora da partição.
+
+    Returns:
+        O prefixo S3 da partição, terminado em '/'.
+    """
+    return (
+        f"{root}/year={hour.year}"
+        f"/month={hour.month:02d}"
+        f"/day={hour.day:02d}"
+        f"/hour={hour.hour:02d}/"
+    )
+
+
+def build_day_prefix(root: str, day: datetime) -> str:
+    """Monta o prefixo particionado (year=/month=/day=) de um dia, terminado em '/'."""
+    return f"{root}/year={day.year}/month={day.month:02d}/day={day.day:02d}/"
+
+
+def list_raw_objects(bucket: str, hour: datetime) -> List[Dict]:
+    """
+    Lista os objetos .jsonl brutos de uma partição horária.
+
+    Args:
+        bucket: O nome do bucket S3.
+        hour: Hora da partição.
+
+    Returns:
+        Lista de dicionários com 'Key' e 'Size' de cada objeto.
+    """
+    prefix = build_hour_prefix(RAW_PREFIX, hour)
+    objects = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".jsonl"):
+                objects.append({"Key": obj["Key"], "Size": obj["Size"]})
+    return objects
+
+
+def read_jsonl_object(bucket: str, key: str) -> List[Dict]:
+    """
+    Baixa um objeto JSON Lines do S3 e retorna seus eventos.
+    O corpo é lido linha a linha, sem materializar o conteúdo inteiro como string.
+    """
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    events = [
+        json.loads(line)
+        for line in response["Body"].iter_lines()
+        if line.strip()
+    ]
+    _record_object_read(response, len(events))
+    return events
+
+
+def get_compaction_manifest(bucket: str, hour: datetime) -> Optional[Dict]:
+    """
+    Lê o manifesto de compactação de uma hora, se existir.
+
+    Args:
+        bucket: O nome do bucket S3.
+        hour: Hora da partição.
+
+    Returns:
+        O manifesto como dicionário, ou None se a hora ainda não foi compactada.
+    """
+    key = build_hour_prefix(COMPACTED_PREFIX, hour) + COMPACTION_MANIFEST_FILE
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+
+def summarize_events(
+    events: List[Dict], time_fields: Tuple[str, ...] = ("timestamp_utc", "timestamp_registro")
+) -> Dict:
+    """
+    Estatísticas de um objeto de eventos usadas na poda das leituras:
+    intervalo de tempo de evento ('AAAA-MM-DDTHH:MM:SS') e máquinas presentes.
+    O tempo de cada registro é o primeiro campo preenchido de time_fields.
+    """
+    times = []
+    for event in events:
+        timestamp = next((event[field] for field in time_fields if event.get(field)), None)
+        if timestamp:
+            times.append(str(timestamp)[:EVENT_TIME_LENGTH])
+    return {
+        "event_time_min": min(times) if times else None,
+        "event_time_max": max(times) if times else None,
+        "machine_ids": sorted({event["machine_id"] for event in events if event.get("machine_id")}),
+    }
+
+
+def get_partition_index(bucket: str, prefix: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Lê o índice de uma partição.
+
+    O índice tem a forma {"prefix", "updated_at", "stale", "objects": {chave:
+    {"size", "etag", "records", "event_time_min", "event_time_max", "machine_ids"}}}
+    Com "stale", o índice pode estar incompleto e a partição deve ser listada.
+
+    Returns:
+        (índice ou None se não existe, ETag usado na gravação condicional).
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=prefix + PARTITION_INDEX_FILE)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response["Body"].read()), response["ETag"]
+
+
+def _usable_partition_index(bucket: str, prefix: str) -> Optional[Dict]:
+    """Índice da partição, se existe e está completo; None indica que é preciso listar."""
+    index, _ = get_partition_index(bucket, prefix)
+    if index is None or index.get("stale"):
+        metrics.increment("PartitionListings")
+        return None
+    metrics.increment("PartitionIndexHits")
+    return index
+
+
+def _put_partition_index(bucket: str, prefix: str, index: Dict, etag: Optional[str]) -> bool:
+    """
+    Grava o índice condicionado ao ETag lido (ou à sua inexistência).
+
+    Returns:
+        False se outro gravador alterou o índice depois da leitura.
+    """
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=prefix + PARTITION_INDEX_FILE,
+            Body=json.dumps(index),
+            ContentType="application/json",
+            **condition,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+        return False
+    return True
+
+
+def list_partition_objects(bucket: str, prefix: str, extensions: Tuple[str, ...]) -> List[Dict]:
+    """Lista os objetos com as extensões dadas diretamente sob o prefixo da partição."""
+    objects = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(extensions) and "/" not in obj["Key"][len(prefix):]:
+                objects.append(obj)
+    return objects
+
+
+def update_partition_index(
+    bucket: str,
+    prefix: str,
+    entries: Dict[str, Dict],
+    extensions: Tuple[str, ...],
+    max_attempts: int = PARTITION_INDEX_MAX_ATTEMPTS,
+) -> bool:
+    """
+    Acrescenta entradas ao índice de uma partição com gravação condicional
+    (If-Match/If-None-Match), relendo e refazendo a junção quando outro
+    gravador altera o índice no meio. Depois de max_attempts conflitos, o
+    índice é marcado como desatualizado (stale) e os leitores passam a listar
+    a partição até que ela seja reconstruída (rebuild_partition_index).
+
+    Ao criar o índice, a partição é listada uma vez: se já há objetos não
+    indexados (gravados antes do índice existir), ele nasce desatualizado.
+
+    Args:
+        bucket: O nome do bucket S3.
+        prefix: Prefixo da partição, terminado em '/'.
+        entries: {chave S3: estatísticas do objeto}.
+        extensions: Extensões dos objetos indexados na partição.
+        max_attempts: Tentativas de gravação condicional.
+
+    Returns:
+        True se o índice foi gravado completo.
+    """
+    for _ in range(max_attempts):
+        index, etag = get_partition_index(bucket, prefix)
+        if index is None:
+            unindexed = [
+                obj["Key"]
+                for obj in list_partition_objects(bucket, prefix, extensions)
+                if obj["Key"] not in entries
+            ]
+            index = {"prefix": prefix, "stale": bool(unindexed), "objects": {}}
+        index["objects"].update(entries)
+        index["updated_at"] = datetime.now(timezone.utc).isoformat()
+        if _put_partition_index(bucket, prefix, index, etag):
+            return True
+        metrics.increment("PartitionIndexConflicts")
+
+    print(f"[AVISO] Índice de {prefix} não atualizado após {max_attempts} tentativas. Marcando como desatualizado.")
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=prefix + PARTITION_INDEX_FILE,
+        Body=json.dumps({"prefix": prefix, "stale": True, "objects": {}}),
+        ContentType="application/json",
+    )
+    return False
+
+
+def rebuild_partition_index(
+    bucket: str,
+    prefix: str,
+    extensions: Tuple[str, ...],
+    reader: Callable[[str, str], List[Dict]],
+    time_fields: Tuple[str, ...] = ("timestamp_utc", "timestamp_registro"),
+    max_attempts: int = PARTITION_INDEX_MAX_ATTEMPTS,
+) -> Dict:
+    """
+    Reconstrói o índice de uma partição a partir da listagem, lendo cada
+    objeto para obter as estatísticas. Se outro gravador altera o índice
+    durante a reconstrução, a partição é listada de novo.
+
+    Args:
+        bucket: O nome do bucket S3.
+        prefix: Prefixo da partição, terminado em '/'.
+        extensions: Extensões dos objetos indexados.
+        reader: Função (bucket, chave) -> registros do objeto.
+        time_fields: Campos de tempo dos registros (ver summarize_events).
+        max_attempts: Tentativas de gravação condicional.
+
+    Returns:
+        O índice gravado.
+    """
+    for _ in range(max_attempts):
+        _, etag = get_partition_index(bucket, prefix)
+        entries = {}
+        for obj in list_partition_objects(bucket, prefix, extensions):
+            records = reader(bucket, obj["Key"])
+            entries[obj["Key"]] = {
+                "size": obj["Size"],
+                "etag": obj.get("ETag"),
+                "records": len(records),
+                **summarize_events(records, time_fields),
+            }
+        index = {
+            "prefix": prefix,
+            "stale": False,
+            "objects": entries,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if _put_partition_index(bucket, prefix, index, etag):
+            print(f"Índice de {prefix} reconstruído com {len(entries)} objeto(s).")
+            return index
+    raise RuntimeError(f"Índice de {prefix} alterado durante {max_attempts} reconstruções.")
+
+
+def _object_may_match(
+    entry: Dict, machine_ids: Optional[set], event_time_range: Optional[Tuple[str, str]]
+) -> bool:
+    """Indica se um objeto pode ter eventos das máquinas e do intervalo pedidos."""
+    if machine_ids and "machine_ids" in entry and not machine_ids.intersection(entry["machine_ids"]):
+        return False
+    if event_time_range and entry.get("event_time_min") and entry.get("event_time_max"):
+        start, end = event_time_range
+        if entry["event_time_max"] < start or entry["event_time_min"] >= end:
+            return False
+    return True
+
+
+def read_compacted_batches(
+    bucket: str, key: str, batch_size: int = COMPACTED_READ_BATCH_RECORDS
+) -> Iterator[List[Dict]]:
+    """
+    Baixa um arquivo Parquet compactado e retorna um iterador de lotes de até
+    `batch_size` eventos, no mesmo formato dos arquivos .jsonl brutos (campos
+    nulos são omitidos).
+
+    O download acontece na chamada; a conversão em eventos, só à medida que o
+    iterador é consumido, então um arquivo grande nunca vira uma única lista.
+    """
+    import pyarrow.parquet as pq
+
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    parquet_file = pq.ParquetFile(BytesIO(response["Body"].read()))
+    _record_object_read(response, parquet_file.metadata.num_rows)
+    return (
+        [
+            {k: v for k, v in row.items() if v is not None and v == v}
+            for row in batch.to_pandas().to_dict("records")
+        ]
+        for batch in parquet_file.iter_batches(batch_size=batch_size)
+    )
+
+
+def _read_raw_batches(bucket: str, key: str) -> List[List[Dict]]:
+    """Lê um objeto .jsonl bruto como um único lote de eventos."""
+    return [read_jsonl_object(bucket, key)]
+
+
+def _record_object_read(response: Dict, events: int) -> None:
+    """Contabiliza um objeto de eventos lido do S3 nas métricas da execução."""
+    metrics.increment("S3ObjectsRead")
+    metrics.increment("S3BytesRead", response.get("ContentLength", 0))
+    metrics.increment("SensorEventsRead", events)
+
+
+def _raw_hour_objects(bucket: str, hour: datetime) -> List[Dict]:
+    """
+    Objetos .jsonl brutos de uma hora ainda não compactada, pela listagem.
+
+    Returns:
+        Lista de dicionários com 'key' e 'size'.
+    """
+    print(f"Buscando dados no prefixo: s3://{bucket}/{build_hour_prefix(RAW_PREFIX, hour)}")
+    metrics.increment("PartitionListings")
+    return [{"key": obj["Key"], "size": obj["Size"]} for obj in list_raw_objects(bucket, hour)]
+
+
+def _plan_hour_reads(
+    bucket: str,
+    hour: datetime,
+    machine_ids: Optional[set] = None,
+    event_time_range: Optional[Tuple[str, str]] = None,
+) -> List[Tuple[Callable, str, int]]:
+    """
+    Define quais objetos devem ser lidos para uma hora: os arquivos compactados,
+    quando existe manifesto (o índice da hora), ou os .jsonl brutos da
+    partição, pela listagem. Arquivos compactados cujas estatísticas mostram
+    que não há eventos das máquinas ou do intervalo de tempo de evento pedidos
+    não são lidos.
+
+    Returns:
+        Lista de tuplas (função de leitura em lotes, chave S3, registros), com
+        os registros do manifesto ou, nos brutos, estimados pelo tamanho.
+    """
+    manifest = get_compaction_manifest(bucket, hour)
+    if manifest is not None:
+        reader, objects = read_compacted_batches, manifest["files"]
+    else:
+        reader, objects = _read_raw_batches, _raw_hour_objects(bucket, hour)
+
+    selected = [obj for obj in objects if _object_may_match(obj, machine_ids, event_time_range)]
+    metrics.increment("S3ObjectsPruned", len(objects) - len(selected))
+    if manifest is not None:
+        print(
+            f"Lendo {len(selected)} de {len(objects)} arquivo(s) compactado(s) da hora {hour.isoformat()}"
+        )
+    return [(reader, obj["key"], _object_records(obj)) for obj in selected]
+
+
+def _object_records(obj: Dict) -> int:
+    """Registros de um objeto planejado: do manifesto ou estimados pelo tamanho."""
+    if "records" in obj:
+        return obj["records"]
+    return max(1, obj.get("size", 0) // RAW_EVENT_BYTES_ESTIMATE)
+
+
+def estimate_hour_volume(bucket: str, hour: datetime) -> Dict:
+    """
+    Estima o volume de eventos de uma hora sem baixá-los: pelo manifesto de
+    compactação, quando existe, ou pela listagem dos .jsonl brutos.
+
+    Returns:
+        {"objects": objetos a ler, "bytes": bytes de JSON bruto, "compacted": bool}.
+    """
+    manifest = get_compaction_manifest(bucket, hour)
+    if manifest is not None:
+        return {
+            "objects": len(manifest["files"]),
+            "bytes": manifest.get("source_bytes", 0),
+            "compacted": True,
+        }
+    raw_objects = _raw_hour_objects(bucket, hour)
+    return {
+        "objects": len(raw_objects),
+        "bytes": sum(obj["size"] for obj in raw_objects),
+        "compacted": False,
+    }
+
+
+def _safe_plan_hour_reads(
+    bucket: str,
+    hour: datetime,
+    machine_ids: Optional[set] = None,
+    event_time_range: Optional[Tuple[str, str]] = None,
+) -> List[Tuple[Callable, str, int]]:
+    try:
+        return _plan_hour_reads(bucket, hour, machine_ids, event_time_range)
+    except Exception as e:
+        print(f"Erro ao processar o prefixo {build_hour_prefix(RAW_PREFIX, hour)}: {str(e)}")
+        return []
+
+
+def _safe_read(reader: Callable, bucket: str, key: str) -> Iterable[List[Dict]]:
+    try:
+        return reader(bucket, key)
+    except Exception as e:
+        print(f"Erro ao ler o arquivo {key}: {str(e)}")
+        return []
+
+
+def _safe_events(batches: Iterable[List[Dict]], key: str) -> Iterator[Dict]:
+    try:
+        for batch in batches:
+            yield from batch
+    except Exception as e:
+        print(f"Erro ao ler o arquivo {key}: {str(e)}")
+
+
+def iter_sensor_events(
+    bucket: str,
+    start_time: datetime,
+    end_time: datetime,
+    max_workers: int = S3_MAX_WORKERS,
+    max_in_flight: Optional[int] = None,
+    max_in_flight_records: int = S3_MAX_IN_FLIGHT_RECORDS,
+    machine_ids: Optional[List[str]] = None,
+    event_time_range: Optional[Tuple[datetime, datetime]] = None,
+) -> Iterator[Dict]:
+    """
+    Lê os eventos de sensores de um intervalo de tempo de forma concorrente e
+    os devolve como um gerador, à medida que os objetos chegam do S3.
+
+    As horas são planejadas (manifesto/listagem) em paralelo e os objetos são
+    baixados por um pool de threads limitado que compartilha o cliente S3.
+    Um novo download só começa se os objetos baixados e ainda não consumidos
+    ficam dentro de `max_in_flight` objetos e `max_in_flight_records`
+    registros (do manifesto ou, nos brutos, estimados pelo tamanho); um objeto
+    maior que o orçamento é lido sozinho. Os arquivos compactados são
+    convertidos em eventos em lotes (ver read_compacted_batches), então o pico
+    de memória não depende do tamanho da janela nem do tamanho dos arquivos.
+    Os eventos são devolvidos na mesma ordem da leitura sequencial (hora a
+    hora, chave a chave).
+
+    Args:
+        bucket: O nome do bucket S3.
+        start_time: A data/hora de início para a busca.
+        end_time: A data/hora de fim para a busca.
+        max_workers: Número de threads de download.
+        max_in_flight: Máximo de objetos baixados e ainda não consumidos
+                       (padrão: 2 x max_workers).
+        max_in_flight_records: Máximo de registros nesses objetos.
+        machine_ids: Se informado, não lê objetos sem eventos dessas máquinas.
+        event_time_range: (início, fim) de tempo de evento; se informado, não
+                          lê objetos sem eventos no intervalo.
+                          A poda é por objeto: os eventos devolvidos ainda
+                          precisam ser filtrados por quem os consome.
+
+    Yields:
+        Cada evento de sensor como dicionário.
+    """
+    max_in_flight = max_in_flight or 2 * max_workers
+    machine_ids = set(machine_ids) if machine_ids else None
+    if event_time_range is not None:
+        event_time_range = tuple(value.strftime(EVENT_TIME_FORMAT) for value in event_time_range)
+
+    hours = []
+    current_hour = start_time.replace(minute=0, second=0, microsecond=0)
+    while current_hour < end_time:
+        hours.append(current_hour)
+        current_hour += timedelta(hours=1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        planned_hours = [
+            executor.submit(_safe_plan_hour_reads, bucket, hour, machine_ids, event_time_range)
+            for hour in hours
+        ]
+        pending = deque()
+        in_flight_records = 0
+
+        for planned in planned_hours:
+            for reader, key, records in planned.result():
+                while pending and (
+                    len(pending) >= max_in_flight
+                    or in_flight_records + records > max_in_flight_records
+                ):
+                    done_key, done_records, future = pending.popleft()
+                    in_flight_records -= done_records
+                    yield from _safe_events(future.result(), done_key)
+                pending.append((key, records, executor.submit(_safe_read, reader, bucket, key)))
+                in_flight_records += records
+
+        while pending:
+            done_key, _, future = pending.popleft()
+            yield from _safe_events(future.result(), done_key)
+
+
 def fetch_sensor_data(
-    bucket: str, start_time: datetime, end_time: datetime
+    bucket: str, start_time: datetime, end_time: datetime, machine_ids: Optional[List[str]] = None
 ) -> List[Dict]:
     """
-    Busca todos os arquivos .jsonl de partições no S3 (raw/year=.../hour=...)
-    dentro de um intervalo de tempo e retorna uma lista com todos os eventos.
+    Busca todos os eventos de partições no S3 dentro de um intervalo de tempo.
+    Para cada hora, usa os arquivos compactados (compacted/.../hour=...) quando
+    existe manifesto de compactação e, caso contrário, os .jsonl brutos
+    (raw/year=.../hour=...), listados na partição.
+    A leitura é concorrente (ver iter_sensor_events).
 
     Args:
         bucket: O nome do bucket S3 (ex: 'replyec-data-lake-20250115').
         start_time: A data/hora de início para a busca.
         end_time: A data/hora de fim para a busca.
+        machine_ids: Se informado, devolve apenas os eventos dessas máquinas,
+                     sem ler os objetos que não as contêm.
 
     Returns:
         Uma lista de dicionários, onde cada dicionário é um evento de sensor.
     """
-    all_events = []
+    all_events = list(iter_sensor_events(bucket, start_time, end_time, machine_ids=machine_ids))
+    if machine_ids:
+        wanted = set(machine_ids)
+        all_events = [event for event in all_events if event.get("machine_id") in wanted]
 
-    # Itera sobre cada hora no intervalo de tempo especificado
-    current_hour = start_time.replace(minute=0, second=0, microsecond=0)
-    while current_hour < end_time:
-        prefix = (
-            f"raw/year={current_hour.year}"
-            f"/month={current_hour.month:02d}"
-            f"/day={current_hour.day:02d}"
-            f"/hour={current_hour.hour:02d}/"
-        )
+    print(f"Total de {len(all_events)} eventos encontrados.")
+    return all_events
 
-        print(f"Buscando dados no prefixo: s3://{bucket}/{prefix}")
 
-        try:
-            paginator = s3_client.get_paginator("list_objects_v2")
-            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-                if "Contents" not in page:
-                    continue
-                for obj in page["Contents"]:
-                    key = obj["Key"]
-                    if key.endswith(".jsonl"):
-                        print(f"  Lendo arquivo: {key}")
-                        response = s3_client.get_object(Bucket=bucket, Key=key)
-                        content = response["Body"].read().decode("utf-8")
-                        events = [
-                            json.loads(line)
-                            for line in content.splitlines()
-                            if line.strip()
-                        ]
-                        all_events.extend(events)
-        except Exception as e:
-            print(f"Erro ao processar o prefixo {prefix}: {str(e)}")
+def fetch_sensor_batch(
+    bucket: str, start_time: datetime, end_time: datetime
+) -> EventBatch:
+    """
+    Busca os eventos de sensores de um intervalo de tempo diretamente em um
+    EventBatch colunar, sem materializar a lista de dicionários.
 
-        current_hour += timedelta(hours=1)
+    Args:
+        bucket: O nome do bucket S3.
+        start_time: A data/hora de início para a busca.
+        end_time: A data/hora de fim para a busca.
 
-    print(f"Total de {len(all_events)} eventos encontrados.")
-    return all_events
+    Returns:
+        O EventBatch com todos os eventos válidos do intervalo.
+    """
+    batch = EventBatch.from_events(iter_sensor_events(bucket, start_time, end_time))
+    print(f"Total de {len(batch)} eventos carregados ({batch.nbytes / 1e6:.1f} MB).")
+    return batch
+
+
+def _typed_features_frame(features_df: pd.DataFrame) -> pd.DataFrame:
+    """Tipa as colunas das features para Parquet (timestamps em UTC, labels int8)."""
+    typed = features_df.copy()
+    for column in typed.columns:
+        if column.startswith("timestamp_"):
+            typed[column] = pd.to_datetime(typed[column], utc=True, format="ISO8601")
+        elif column.startswith("label_"):
+            typed[column] = typed[column].astype("int8")
+    return typed
 
 
-def save_features_to_s3(features_df: pd.DataFrame, bucket: str) -> None:
+def save_features_to_s3(
+    features_df: pd.DataFrame,
+    bucket: str,
+    output_format: str = FEATURES_OUTPUT_FORMAT,
+    partition_time: Optional[datetime] = None,
+    prefix: str = PROCESSED_PREFIX,
+) -> None:
     """
-    Salva o DataFrame de features em um arquivo CSV no S3, seguindo a estrutura
-    de particionamento por data para os dados processados.
+    Salva o DataFrame de features no S3 (Parquet comprimido e tipado, ou CSV),
+    seguindo a estrutura de particionamento por data para os dados processados.
+    Sem pyarrow disponível, grava em CSV.
 
     Args:
         features_df: DataFrame do Pandas contendo as features calculadas.
         bucket: O nome do bucket S3 de destino.
+        output_format: 'parquet' (padrão) ou 'csv'.
+        partition_time: Data/hora que define a partição e o nome do arquivo
+                        (padrão: agora). Com o início da janela, a chave é
+                        determinística e regravações sobrescrevem o arquivo.
+        prefix: Prefixo de destino (padrão: dados de treino; PENDING_LABELS_PREFIX
+                para features ainda sem labels).
     """
     if features_df.empty:
         print("DataFrame de features está vazio. Nenhum dado será salvo no S3.")
         return
 
-    # Converte o DataFrame para uma string CSV em memória
-    csv_buffer = StringIO()
-    features_df.to_csv(csv_buffer, index=False)
-    csv_content = csv_buffer.getvalue()
+    body, extension, content_type = None, "csv", "text/csv"
+    if output_format == "parquet":
+        try:
+            buffer = BytesIO()
+            _typed_features_frame(features_df).to_parquet(buffer, index=False, compression="snappy")
+            body, extension, content_type = buffer.getvalue(), "parquet", "application/vnd.apache.parquet"
+        except ImportError as e:
+            print(f"[AVISO] Parquet indisponível ({e}). Salvando features em CSV.")
+
+    if body is None:
+        # Converte o DataFrame para uma string CSV em memória
+        csv_buffer = StringIO()
+        features_df.to_csv(csv_buffer, index=False)
+        body = csv_buffer.getvalue()
 
     # Define o caminho (key) do arquivo no S3 com particionamento por data
-    now = datetime.now(timezone.utc)
-    s3_key = (
-        f"processed/training_data/"
-        f"year={now.year}/"
-        f"month={now.month:02d}/"
-        f"day={now.day:02d}/"
-        f"features_{now.strftime('%Y%m%d_%H%M%S')}.csv"
-    )
+    now = partition_time or datetime.now(timezone.utc)
+    partition_prefix = build_day_prefix(prefix, now)
+    s3_key = f"{partition_prefix}features_{now.strftime(FEATURES_FILE_TIME_FORMAT)}.{extension}"
 
     try:
         print(f"Salvando features no S3 em: s3://{bucket}/{s3_key}")
-        s3_client.put_object(
-            Bucket=bucket, Key=s3_key, Body=csv_content, ContentType="text/csv"
+        response = s3_client.put_object(
+            Bucket=bucket, Key=s3_key, Body=body, ContentType=content_type
         )
+        metrics.increment("S3ObjectsWritten")
+        metrics.increment("S3BytesWritten", len(body))
         print("Features salvas com sucesso no S3.")
     except Exception as e:
         print(f"[ERRO] Falha ao salvar features no S3: {e}")
         raise
 
+    if prefix == PROCESSED_PREFIX:
+        # Índice diário lido pela preparação do treino no lugar da listagem
+        entry = {
+            "size": len(body),
+            "etag": response.get("ETag"),
+            "records": len(features_df),
+            **summarize_events(features_df.to_dict("records"), FEATURES_TIME_FIELDS),
+        }
+        update_partition_index(bucket, partition_prefix, {s3_key: entry}, FEATURE_FILE_EXTENSIONS)
+
+
+def append_feature_history(
+    features_df: pd.DataFrame, bucket: str, written_at: Optional[datetime] = None
+) -> List[str]:
+    """
+    Acrescenta um snapshot das features (sem as colunas label_*) ao histórico
+    em FEATURE_HISTORY_PREFIX, em Parquet, particionado pelo dia de
+    timestamp_janela. Nenhum arquivo é sobrescrito: a chave leva o instante da
+    gravação, e o leitor fica com a versão mais recente (timestamp_processamento)
+    de cada máquina e janela. Cada dia gravado atualiza o índice da partição.
+
+    Returns:
+        Chaves S3 gravadas (vazia sem linhas ou sem pyarrow).
+    """
+    if features_df.empty:
+        return []
+    written_at = written_at or datetime.now(timezone.utc)
+    features_df = features_df.drop(columns=[c for c in features_df.columns if c.startswith("label_")])
+    typed = _typed_features_frame(features_df)
+
+    keys = []
+    for day, day_index in typed.groupby(typed["timestamp_janela"].dt.floor("D")).groups.items():
+        day_df = typed.loc[day_index]
+        buffer = BytesIO()
+        try:
+            day_df.to_parquet(buffer, index=False, compression="snappy")
+        except ImportError as e:
+            print(f"[AVISO] Parquet indisponível ({e}). Histórico de features não gravado.")
+            return keys
+        body = buffer.getvalue()
+
+        partition_prefix = build_day_prefix(FEATURE_HISTORY_PREFIX, day.to_pydatetime())
+        first_window = day_df["timestamp_janela"].min().strftime(FEATURES_FILE_TIME_FORMAT)
+        s3_key = (
+            f"{partition_prefix}snapshot_{first_window}_"
+            f"{written_at.strftime('%Y%m%dT%H%M%S%f')}.parquet"
+        )
+        response = s3_client.put_object(
+            Bucket=bucket, Key=s3_key, Body=body, ContentType="application/vnd.apache.parquet"
+        )
+        metrics.increment("S3ObjectsWritten")
+        metrics.increment("S3BytesWritten", len(body))
+
+        entry = {
+            "size": len(body),
+            "etag": response.get("ETag"),
+            "records": len(day_df),
+            **summarize_events(features_df.loc[day_index].to_dict("records"), FEATURES_TIME_FIELDS),
+        }
+        update_partition_index(bucket, partition_prefix, {s3_key: entry}, (".parquet",))
+        keys.append(s3_key)
+
+    print(f"Histórico de features: {len(features_df)} linhas em {len(keys)} arquivo(s).")
+    return keys
+
+
+def list_feature_files(bucket: str, prefix: str) -> List[Tuple[datetime, str]]:
+    """
+    Lista os arquivos de features gravados por save_features_to_s3 em um prefixo.
+
+    Returns:
+        Lista de (partition_time, chave S3) em ordem cronológica.
+    """
+    files = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        for obj in page.get("Contents", []):
+            filename = obj["Key"].rsplit("/", 1)[-1]
+            if not filename.startswith("features_"):
+                continue
+            stamp = filename[len("features_"):].split(".", 1)[0]
+            partition_time = datetime.strptime(stamp, FEATURES_FILE_TIME_FORMAT).replace(tzinfo=timezone.utc)
+            files.append((partition_time, obj["Key"]))
+    return sorted(files)
+
+
+def read_features_from_s3(bucket: str, key: str) -> Dict[str, Dict]:
+    """
+    Lê um arquivo de features (Parquet ou CSV) de volta no formato do cálculo
+    de features: {machine_id: features}, com timestamps em ISO 8601.
+    """
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    body = response["Body"].read()
+    if key.endswith(".parquet"):
+        df = pd.read_parquet(BytesIO(body))
+    else:
+        df = pd.read_csv(BytesIO(body))
+    for column in df.columns:
+        if column.startswith("timestamp_"):
+            df[column] = pd.to_datetime(df[column], utc=True, format="ISO8601").map(
+                lambda value: value.isoformat()
+            )
+    df = df.astype(object).where(df.notna(), None)
+    return {row["machine_id"]: row for row in df.to_dict("records")}
+
+
+def delete_s3_object(bucket: str, key: str) -> None:
+    """Remove um objeto do S3."""
+    s3_client.delete_object(Bucket=bucket, Key=key)
+
 
 # === OPERAÇÕES DYNAMODB ===
 
 
+# GSI da tabela de falhas: partição diária (time_bucket) + timestamp_utc
+FAILURE_TIME_INDEX = os.getenv("FAILURE_TIME_INDEX", "time_bucket-timestamp_utc-index")
+FAILURE_TIME_BUCKET_FORMAT = "%Y-%m-%d"
+# Atributos lidos da tabela de falhas (suficientes para as labels)
+FAILURE_PROJECTION = "machine_id, timestamp_utc"
+
+# Limite do BatchWriteItem e backoff dos itens não processados (throttling)
+BATCH_WRITE_SIZE = 25
+BATCH_WRITE_MAX_ATTEMPTS = 8
+BATCH_WRITE_BACKOFF_BASE_SECONDS = 0.05
+BATCH_WRITE_BACKOFF_MAX_SECONDS = 5.0
+
+# Campos que mudam a cada execução e não entram no hash de conteúdo das features
+FEATURE_HASH_IGNORED_FIELDS = ("timestamp_janela", "timestamp_processamento")
+
+
+def failure_time_bucket(timestamp: datetime) -> str:
+    """Partição diária (UTC) do índice de falhas por tempo, ex: '2025-10-15'."""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime(FAILURE_TIME_BUCKET_FORMAT)
+
+
+def _failure_time_buckets(start_time: datetime, end_time: datetime) -> List[str]:
+    """Lista as partições diárias que cobrem o intervalo [start_time, end_time]."""
+    buckets = []
+    day = start_time.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    while day <= end_time:
+        buckets.append(failure_time_bucket(day))
+        day += timedelta(days=1)
+    return buckets
+
+
+def _query_failures_by_time(table, start_time_str: str, end_time_str: str, buckets: List[str]) -> List[Dict]:
+    """Consulta o GSI time_bucket/timestamp_utc, uma Query paginada por dia."""
+    failures = []
+    for bucket in buckets:
+        query_kwargs = {
+            "IndexName": FAILURE_TIME_INDEX,
+            "KeyConditionExpression": Key("time_bucket").eq(bucket)
+            & Key("timestamp_utc").between(start_time_str, end_time_str),
+            "ProjectionExpression": FAILURE_PROJECTION,
+            "ReturnConsumedCapacity": "TOTAL",
+        }
+        response = table.query(**query_kwargs)
+        metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+        failures.extend(response.get("Items", []))
+        while "LastEvaluatedKey" in response:
+            response = table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **query_kwargs)
+            metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+            failures.extend(response.get("Items", []))
+    return failures
+
+
+def _scan_failures_by_time(table, start_time_str: str, end_time_str: str) -> List[Dict]:
+    """Varredura completa da tabela com filtro de tempo (caminho antigo, sem o GSI)."""
+    scan_kwargs = {
+        "FilterExpression": Attr("timestamp_utc").between(start_time_str, end_time_str),
+        "ProjectionExpression": FAILURE_PROJECTION,
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    response = table.scan(**scan_kwargs)
+    metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+    failures = list(response.get("Items", []))
+
+    # Lida com paginação do DynamoDB
+    while "LastEvaluatedKey" in response:
+        response = table.scan(ExclusiveStartKey=response["LastEvaluatedKey"], **scan_kwargs)
+        metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+        failures.extend(response.get("Items", []))
+    return failures
+
+
 def fetch_failure_labels_from_dynamo(
     table_name: str, start_time: datetime, end_time: datetime
 ) -> List[Dict]:
@@ -126,6 +888,10 @@ def fetch_failure_labels_from_dynamo(
     Busca eventos de falha do DynamoDB dentro de um intervalo de tempo específico.
     Esta função é usada para criar labels preditivas baseadas em falhas futuras.
 
+    Consulta o GSI por partição diária (time_bucket) e intervalo de timestamp,
+    lendo só os dias do intervalo e só machine_id/timestamp_utc. Se o índice
+    não existir, volta para o Scan com filtro.
+
     Args:
         table_name: Nome da tabela DynamoDB que contém o histórico de falhas.
         start_time: Data/hora de início para busca de falhas.
@@ -139,7 +905,6 @@ def fetch_failure_labels_from_dynamo(
         return []
 
     table = dynamodb_resource.Table(table_name)
-    all_failures = []
 
     print(
         f"Buscando falhas na tabela {table_name} entre {start_time.isoformat()} e {end_time.isoformat()}"
@@ -150,19 +915,15 @@ def fetch_failure_labels_from_dynamo(
         start_time_str = start_time.isoformat()
         end_time_str = end_time.isoformat()
 
-        # Usa scan com FilterExpression para buscar falhas no intervalo
-        filter_expression = Attr("timestamp_utc").between(start_time_str, end_time_str)
-
-        response = table.scan(FilterExpression=filter_expression)
-        all_failures.extend(response.get("Items", []))
-
-        # Lida com paginação do DynamoDB
-        while "LastEvaluatedKey" in response:
-            response = table.scan(
-                FilterExpression=filter_expression,
-                ExclusiveStartKey=response["LastEvaluatedKey"],
-            )
-            all_failures.extend(response.get("Items", []))
+        buckets = _failure_time_buckets(start_time, end_time)
+        try:
+            all_failures = _query_failures_by_time(table, start_time_str, end_time_str, buckets)
+            print(f"Consultadas {len(buckets)} partições diárias do índice {FAILURE_TIME_INDEX}.")
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("ValidationException", "ResourceNotFoundException"):
+                raise
+            print(f"[AVISO] Índice {FAILURE_TIME_INDEX} indisponível ({e}). Usando Scan.")
+            all_failures = _scan_failures_by_time(table, start_time_str, end_time_str)
 
         print(f"Encontradas {len(all_failures)} falhas no período especificado.")
         return all_failures
@@ -172,37 +933,182 @@ def fetch_failure_labels_from_dynamo(
         raise
 
 
-def save_features_to_dynamodb(features_dict: Dict, table_name: str) -> None:
+def to_dynamodb_value(value):
+    """
+    Converte um valor Python para o formato aceito pelo DynamoDB: floats
+    viram Decimal (pela mesma representação de json.dumps) e escalares
+    NumPy viram tipos nativos. Dicionários e listas são convertidos
+    recursivamente.
+    """
+    if isinstance(value, float):
+        return Decimal(repr(float(value)))
+    if isinstance(value, dict):
+        return {key: to_dynamodb_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamodb_value(item) for item in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # Escalares NumPy (np.int64, np.bool_, ...)
+        return to_dynamodb_value(value.item())
+    return value
+
+
+def feature_content_hash(features: Dict) -> str:
+    """
+    Hash do conteúdo das features de uma máquina, ignorando os timestamps
+    que mudam a cada execução. Itens com o mesmo hash não precisam ser regravados.
+    """
+    content = {
+        key: value for key, value in features.items() if key not in FEATURE_HASH_IGNORED_FIELDS
+    }
+    encoded = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def save_features_to_dynamodb(
+    features_dict: Dict, table_name: str, previous_hashes: Optional[Dict] = None
+) -> Dict:
     """
     Salva as features calculadas na tabela do DynamoDB (Feature Store).
 
+    Só grava as máquinas cujo conteúdo mudou desde a última gravação
+    (comparando o hash de conteúdo com previous_hashes), em lotes paralelos.
+
     Args:
         features_dict: Dicionário onde as chaves são machine_id e os valores são as features.
         table_name: O nome da tabela DynamoDB de destino.
+        previous_hashes: Hash de conteúdo da última gravação de cada máquina
+                         (guardado no estado da máquina). Sem ele, grava tudo.
+
+    Returns:
+        Estatísticas da gravação (written, skipped, retried) e o hash de
+        conteúdo atual de cada máquina (hashes).
     """
+    stats = {"written": 0, "skipped": 0, "retried": 0, "hashes": {}}
     if not features_dict:
         print("Dicionário de features está vazio. Nenhum dado será salvo no DynamoDB.")
-        return
+        return stats
 
-    table = dynamodb_resource.Table(table_name)
+    previous_hashes = previous_hashes or {}
+    items_to_save = []
+    for machine_id, features in features_dict.items():
+        content_hash = feature_content_hash(features)
+        stats["hashes"][machine_id] = content_hash
+        if previous_hashes.get(machine_id) == content_hash:
+            stats["skipped"] += 1
+            continue
+        # O DynamoDB não aceita floats nativamente, então os convertemos para Decimal
+        items_to_save.append(to_dynamodb_value(features))
 
     print(
-        f"Iniciando salvamento de {len(features_dict)} registros na tabela {table_name}..."
+        f"Iniciando salvamento de {len(items_to_save)} registros na tabela {table_name} "
+        f"({stats['skipped']} sem alteração ignorados)..."
     )
 
     try:
-        with table.batch_writer() as batch:
-            for machine_id, features in features_dict.items():
-                # O DynamoDB não aceita floats nativamente, então os convertemos para Decimal
-                item_to_save = json.loads(json.dumps(features), parse_float=Decimal)
-                batch.put_item(Item=item_to_save)
-
-        print("Features salvas com sucesso no DynamoDB.")
+        write_stats = batch_write_items(table_name, items_to_save)
+        stats["written"] = write_stats["written"]
+        stats["retried"] = write_stats["retried"]
+        print(
+            f"Features salvas com sucesso no DynamoDB: {stats['written']} gravadas, "
+            f"{stats['skipped']} ignoradas, {stats['retried']} reenviadas."
+        )
+        return stats
     except Exception as e:
         print(f"[ERRO] Falha ao salvar features no DynamoDB: {e}")
         raise
 
 
+def _write_batch_with_backoff(table_name: str, items: List[Dict]) -> int:
+    """
+    Grava um lote (até 25 itens) com BatchWriteItem, reenviando os itens não
+    processados com backoff exponencial e jitter.
+
+    Returns:
+        Número de itens reenviados.
+    """
+    request = {table_name: [{"PutRequest": {"Item": item}} for item in items]}
+    retried = 0
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        response = dynamodb_resource.batch_write_item(
+            RequestItems=request, ReturnConsumedCapacity="TOTAL"
+        )
+        metrics.record_consumed_capacity(response, "DynamoDBWriteCapacityUnits")
+        request = response.get("UnprocessedItems") or None
+        if not request:
+            return retried
+        retried += len(request.get(table_name, []))
+        delay = min(BATCH_WRITE_BACKOFF_MAX_SECONDS, BATCH_WRITE_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        time.sleep(random.uniform(0, delay))
+    raise RuntimeError(
+        f"{len(request.get(table_name, []))} itens não processados na tabela {table_name} "
+        f"após {BATCH_WRITE_MAX_ATTEMPTS} tentativas."
+    )
+
+
+def batch_write_items(table_name: str, items: List[Dict], max_workers: int = DYNAMODB_WRITE_WORKERS) -> Dict:
+    """
+    Grava vários itens em uma tabela DynamoDB com BatchWriteItem, em lotes de
+    25 enviados em paralelo. Itens não processados (throttling) são reenviados
+    com backoff; erros de throttling são tratados pelo retry adaptativo do cliente.
+
+    Args:
+        table_name: Nome da tabela DynamoDB.
+        items: Itens a gravar (já no formato aceito pelo DynamoDB).
+        max_workers: Número de lotes gravados simultaneamente.
+
+    Returns:
+        Estatísticas da gravação: {"written": n, "retried": n}.
+    """
+    batches = [items[offset:offset + BATCH_WRITE_SIZE] for offset in range(0, len(items), BATCH_WRITE_SIZE)]
+    if not batches:
+        return {"written": 0, "retried": 0}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        retried = sum(executor.map(lambda batch: _write_batch_with_backoff(table_name, batch), batches))
+    return {"written": len(items), "retried": retried}
+
+
+def batch_get_items(table_name: str, key_name: str, key_values: List[str]) -> List[Dict]:
+    """
+    Lê vários itens de uma tabela DynamoDB com BatchGetItem (lotes de 100),
+    reenviando as chaves não processadas.
+
+    Args:
+        table_name: Nome da tabela DynamoDB.
+        key_name: Nome da chave de partição.
+        key_values: Valores da chave a buscar.
+
+    Returns:
+        Lista com os itens encontrados.
+    """
+    items = []
+    key_values = list(key_values)
+    for offset in range(0, len(key_values), 100):
+        request = {
+            table_name: {
+                "Keys": [{key_name: value} for value in key_values[offset:offset + 100]]
+            }
+        }
+        while request:
+            response = dynamodb_resource.batch_get_item(
+                RequestItems=request, ReturnConsumedCapacity="TOTAL"
+            )
+            metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request = response.get("UnprocessedKeys") or None
+    return items
+
+
+def batch_put_items(table_name: str, items: List[Dict]) -> None:
+    """
+    Grava vários itens em uma tabela DynamoDB com BatchWriteItem.
+
+    Args:
+        table_name: Nome da tabela DynamoDB.
+        items: Itens a gravar (já no formato aceito pelo DynamoDB).
+    """
+    batch_write_items(table_name, items)
+
+
 # === OPERAÇÕES SSM ===
 
 
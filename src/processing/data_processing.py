@@ -3,25 +3,58 @@ Módulo de processamento de dados.
 Contém a lógica de merge e agrupamento de eventos de sensores.
 """
 from datetime import datetime, timezone
-from typing import List, Dict
+from typing import Dict, Iterable, Union
 
+import numpy as np
+import pandas as pd
 
-def merge_sensor_events(events: List[Dict]) -> Dict:
+from event_batch import (
+    MINUTE_MS,
+    EventBatch,
+    WindowBatch,
+    format_window_timestamps,
+    parse_timestamps_to_epoch_ms,
+)
+
+
+# Engines de merge disponíveis (selecionadas via MERGE_ENGINE)
+MERGE_ENGINE_PYTHON = "python"
+MERGE_ENGINE_VECTORIZED = "vectorized"
+MERGE_ENGINE_COLUMNAR = "columnar"
+
+# Tipos de leitura, na mesma prioridade do merge original (temperatura > vibração > falha)
+KIND_NONE, KIND_TEMPERATURE, KIND_VIBRATION, KIND_FAILURE = -1, 0, 1, 2
+READING_FIELDS = {
+    KIND_TEMPERATURE: ("temperature_celsius", "temperatura"),
+    KIND_VIBRATION: ("vibration_rms", "vibracao"),
+    KIND_FAILURE: ("codigo_evento", "falha"),
+}
+
+
+def merge_sensor_events(events: Union[Iterable[Dict], EventBatch]) -> Union[Dict, WindowBatch]:
     """
-    Recebe uma lista de eventos brutos (temperatura, vibração, falha) e os agrupa
+    Recebe eventos brutos (temperatura, vibração, falha) e os agrupa
     em janelas de tempo discretas (por minuto) para cada máquina.
 
     Args:
-        events: A lista de eventos brutos lidos do S3.
+        events: Os eventos brutos lidos do S3. Pode ser uma lista ou um
+                gerador (ex: iter_sensor_events), consumido uma única vez,
+                ou um EventBatch colunar.
 
     Returns:
         Um dicionário onde cada chave é uma 'machine_id' e 'janela de tempo',
         e o valor contém os dados consolidados dos sensores para essa janela.
+        Para um EventBatch, retorna o WindowBatch equivalente.
     """
+    if isinstance(events, EventBatch):
+        return merge_event_batch(events)
+
     grouped_windows = {}
-    print(f"Iniciando o merge de {len(events)} eventos...")
+    total_events = 0
+    print("Iniciando o merge de eventos...")
 
     for event in events:
+        total_events += 1
         machine_id = event.get("machine_id")
         timestamp_str = event.get("timestamp_utc") or event.get("timestamp_registro")
         
@@ -57,5 +90,192 @@ def merge_sensor_events(events: List[Dict]) -> Dict:
         elif "codigo_evento" in event:
             grouped_windows[window_key]['falha'] = event['codigo_evento']
 
+    print(f"{len(grouped_windows)} janelas de tempo criadas após o merge de {total_events} eventos.")
+    return grouped_windows
+
+
+
+def _pivot_last_readings(
+    machine_keys: np.ndarray, window_ms: np.ndarray, kinds: np.ndarray, values: np.ndarray
+) -> pd.DataFrame:
+    """
+    Núcleo vetorizado do merge: recebe colunas já extraídas (uma posição por
+    evento, na ordem de leitura) e devolve uma linha por (máquina, janela)
+    com o último valor de cada tipo de leitura.
+
+    As janelas aparecem na ordem em que foram vistas pela primeira vez,
+    exatamente como em merge_sensor_events.
+    """
+    frame = pd.DataFrame(
+        {"machine_id": machine_keys, "window_ms": window_ms, "kind": kinds, "value": values}
+    )
+
+    # Janelas na ordem da primeira ocorrência (inclui eventos sem leitura conhecida)
+    windows = frame.drop_duplicates(["machine_id", "window_ms"], keep="first")[
+        ["machine_id", "window_ms"]
+    ]
+
+    # Um único group-by devolve o último valor de cada tipo por janela
+    readings = frame[frame["kind"] != KIND_NONE]
+    last_values = (
+        readings.groupby(["machine_id", "window_ms", "kind"], sort=False)["value"]
+        .last()
+        .unstack("kind")
+    )
+    pivot = windows.join(last_values, on=["machine_id", "window_ms"])
+    for kind in READING_FIELDS:
+        if kind not in pivot.columns:
+            pivot[kind] = None
+    return pivot
+
+
+def group_windows(
+    machine_ids: np.ndarray, window_ms: np.ndarray, kinds: np.ndarray, values: np.ndarray
+) -> Dict:
+    """Monta o dicionário de janelas (contrato de merge_sensor_events) a partir das colunas."""
+    pivot = _pivot_last_readings(machine_ids, window_ms, kinds, values)
+
+    window_strs = format_window_timestamps(pivot["window_ms"].to_numpy())
+    columns = {}
+    for kind, (_, output_field) in READING_FIELDS.items():
+        column = pivot[kind].astype(object)
+        columns[output_field] = column.where(column.notna(), None).tolist()
+
+    grouped_windows = {}
+    for machine_id, window_str, temperatura, vibracao, falha in zip(
+        pivot["machine_id"].tolist(),
+        window_strs,
+        columns["temperatura"],
+        columns["vibracao"],
+        columns["falha"],
+    ):
+        grouped_windows[f"{machine_id}_{window_str}"] = {
+            "machine_id": machine_id,
+            "timestamp_janela": window_str,
+            "temperatura": temperatura,
+            "vibracao": vibracao,
+            "falha": falha,
+        }
+    return grouped_windows
+
+
+def merge_event_batch(batch: EventBatch) -> WindowBatch:
+    """
+    Merge colunar: agrupa um EventBatch em um WindowBatch sem criar
+    dicionários por evento ou por janela.
+
+    Args:
+        batch: O lote colunar de eventos brutos.
+
+    Returns:
+        O WindowBatch com uma linha por (máquina, janela de um minuto).
+    """
+    print(f"Iniciando o merge colunar de {len(batch)} eventos ({batch.nbytes / 1e6:.1f} MB)...")
+    window_ms = batch.timestamp_ms - batch.timestamp_ms % MINUTE_MS
+
+    kinds = np.full(len(batch), KIND_NONE, dtype=np.int8)
+    values = np.zeros(len(batch), dtype=np.float64)
+    has_failure = batch.event_codes > 0
+    has_vibration = ~np.isnan(batch.vibration)
+    has_temperature = ~np.isnan(batch.temperature)
+    kinds[has_failure] = KIND_FAILURE
+    values[has_failure] = batch.event_codes[has_failure]
+    kinds[has_vibration] = KIND_VIBRATION
+    values[has_vibration] = batch.vibration[has_vibration]
+    kinds[has_temperature] = KIND_TEMPERATURE
+    values[has_temperature] = batch.temperature[has_temperature]
+
+    pivot = _pivot_last_readings(batch.machine_codes, window_ms, kinds, values)
+    windows = WindowBatch(
+        machine_ids=batch.machine_ids,
+        machine_codes=pivot["machine_id"].to_numpy(dtype=np.int32),
+        window_ms=pivot["window_ms"].to_numpy(dtype=np.int64),
+        temperatura=pivot[KIND_TEMPERATURE].to_numpy(dtype=np.float32, na_value=np.nan),
+        vibracao=pivot[KIND_VIBRATION].to_numpy(dtype=np.float32, na_value=np.nan),
+        falha=pivot[KIND_FAILURE].fillna(0).to_numpy(dtype=np.int16),
+        event_names=batch.event_names,
+    )
+    print(f"{len(windows)} janelas de tempo criadas após o merge.")
+    return windows
+
+
+def merge_sensor_events_vectorized(events: Iterable[Dict]) -> Dict:
+    """
+    Versão vetorizada (pandas/NumPy) de merge_sensor_events, com o mesmo
+    contrato de saída.
+
+    Os timestamps são convertidos em lote para epoch int64, arredondados
+    para o minuto, e temperatura/vibração/falha são pivotadas por
+    (machine_id, janela) em um único group-by.
+
+    Diferença conhecida: uma leitura presente com valor nulo
+    (ex: "temperature_celsius": null) é tratada como ausente.
+
+    Args:
+        events: Os eventos brutos lidos do S3 (lista ou gerador).
+
+    Returns:
+        O mesmo dicionário de janelas retornado por merge_sensor_events.
+    """
+    columns = [field for field, _ in READING_FIELDS.values()]
+    frame = pd.DataFrame.from_records(
+        events if isinstance(events, list) else list(events),
+        columns=["machine_id", "timestamp_utc", "timestamp_registro"] + columns,
+    )
+    print(f"Iniciando o merge vetorizado de {len(frame)} eventos...")
+
+    # Equivalente a `event.get("timestamp_utc") or event.get("timestamp_registro")`
+    timestamps = frame["timestamp_utc"].where(
+        frame["timestamp_utc"].notna() & (frame["timestamp_utc"] != ""),
+        frame["timestamp_registro"],
+    )
+    valid = (
+        frame["machine_id"].notna()
+        & (frame["machine_id"] != "")
+        & timestamps.notna()
+        & (timestamps != "")
+    )
+    frame = frame[valid]
+    if frame.empty:
+        print("0 janelas de tempo criadas após o merge.")
+        return {}
+
+    epoch_ms = parse_timestamps_to_epoch_ms(timestamps[valid].astype(str))
+    window_ms = epoch_ms - epoch_ms % MINUTE_MS
+
+    kinds = np.full(len(frame), KIND_NONE, dtype=np.int8)
+    values = np.full(len(frame), None, dtype=object)
+    # Ordem inversa da prioridade: o tipo de maior prioridade sobrescreve os demais
+    for kind in sorted(READING_FIELDS, reverse=True):
+        field, _ = READING_FIELDS[kind]
+        present = frame[field].notna().to_numpy()
+        kinds[present] = kind
+        values[present] = frame[field].to_numpy(dtype=object)[present]
+
+    grouped_windows = group_windows(
+        frame["machine_id"].to_numpy(dtype=object), window_ms, kinds, values
+    )
     print(f"{len(grouped_windows)} janelas de tempo criadas após o merge.")
     return grouped_windows
+
+
+def merge_events(
+    events: Union[Iterable[Dict], EventBatch], engine: str = MERGE_ENGINE_PYTHON
+) -> Union[Dict, WindowBatch]:
+    """
+    Seleciona a implementação do merge de eventos.
+
+    Args:
+        events: Os eventos brutos lidos do S3.
+        engine: 'python' (laço original), 'vectorized' (pandas/NumPy) ou
+                'columnar' (EventBatch -> WindowBatch).
+    """
+    if engine == MERGE_ENGINE_COLUMNAR or isinstance(events, EventBatch):
+        if not isinstance(events, EventBatch):
+            events = EventBatch.from_events(events)
+        return merge_event_batch(events)
+    if engine == MERGE_ENGINE_VECTORIZED:
+        return merge_sensor_events_vectorized(events)
+    if engine != MERGE_ENGINE_PYTHON:
+        raise ValueError(f"Engine de merge desconhecida: {engine}")
+    return merge_sensor_events(events)
@@ -0,0 +1,296 @@
+"""
+Módulo de lotes colunares de eventos.
+Define EventBatch (eventos brutos) e WindowBatch (janelas por máquina), as
+estruturas compactas baseadas em arrays NumPy que trafegam entre a leitura
+do S3, o merge e o cálculo de features no lugar de listas de dicionários.
+
+Cada leitura ocupa ~22 bytes (código da máquina int32, epoch ms int64,
+temperatura e vibração float32, código de evento int16), contra algumas
+centenas de bytes de um dicionário Python.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+MINUTE_MS = 60_000
+
+# Quantidade de timestamps acumulados antes do parsing em lote
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def parse_timestamps_to_epoch_ms(timestamps: pd.Series) -> np.ndarray:
+    """
+    Converte timestamps ISO 8601 em epoch (ms, int64) de forma vetorizada.
+
+    Assim como o merge original, o sufixo de fuso ('Z' ou '+HH:MM') é
+    descartado e o horário local do timestamp é tratado como UTC.
+    """
+    wall_time = timestamps.str.replace(r"(?:Z|[+-]\d{2}:?\d{2})$", "", regex=True)
+    parsed = pd.to_datetime(wall_time, format="ISO8601").astype("datetime64[ns]")
+    return parsed.to_numpy().view("int64") // 1_000_000
+
+
+def format_window_timestamps(window_ms: np.ndarray) -> np.ndarray:
+    """Formata epochs (ms) de janelas no mesmo formato de datetime.isoformat() em UTC."""
+    # Há muito menos minutos distintos do que janelas: formata só os valores únicos
+    unique_ms, inverse = np.unique(window_ms, return_inverse=True)
+    formatted = np.char.add(
+        np.datetime_as_string(unique_ms.astype("datetime64[ms]"), unit="s"), "+00:00"
+    )
+    return formatted.astype(object)[inverse]
+
+
+def float32_to_float64(values: np.ndarray) -> np.ndarray:
+    """
+    Converte um array float32 em float64 usando a menor representação
+    decimal (75.4 e não 75.40000152...), preservando NaN.
+    """
+    # Leituras de sensores se repetem muito: converte só os valores únicos
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    return unique_values.astype(str).astype(np.float64)[inverse.reshape(-1)]
+
+
+def float32_to_python(values: np.ndarray) -> List[Optional[float]]:
+    """Converte um array float32 em floats Python (ver float32_to_float64), com NaN em None."""
+    return [None if value != value else value for value in float32_to_float64(values).tolist()]
+
+
+class EventBatch:
+    """
+    Lote colunar de eventos brutos de sensores.
+
+    Atributos:
+        machine_ids: Dicionário de categorias (código -> machine_id).
+        machine_codes: Código da máquina de cada evento (int32).
+        timestamp_ms: Timestamp de cada evento em epoch ms (int64).
+        temperature: Temperatura (float32, NaN quando ausente).
+        vibration: Vibração RMS (float32, NaN quando ausente).
+        event_codes: Código do evento de falha (int16, 0 quando ausente;
+                     n > 0 corresponde a event_names[n - 1]).
+        event_names: Dicionário de categorias dos códigos de evento.
+    """
+
+    def __init__(
+        self,
+        machine_ids: List[str],
+        machine_codes: np.ndarray,
+        timestamp_ms: np.ndarray,
+        temperature: np.ndarray,
+        vibration: np.ndarray,
+        event_codes: np.ndarray,
+        event_names: List[str],
+    ):
+        self.machine_ids = machine_ids
+        self.machine_codes = machine_codes
+        self.timestamp_ms = timestamp_ms
+        self.temperature = temperature
+        self.vibration = vibration
+        self.event_codes = event_codes
+        self.event_names = event_names
+
+    def __len__(self) -> int:
+        return len(self.timestamp_ms)
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pelos arrays do lote."""
+        return sum(
+            column.nbytes
+            for column in (
+                self.machine_codes,
+                self.timestamp_ms,
+                self.temperature,
+                self.vibration,
+                self.event_codes,
+            )
+        )
+
+    @classmethod
+    def from_events(
+        cls, events: Iterable[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> "EventBatch":
+        """
+        Constrói o lote a partir de eventos em dicionário (lista ou gerador),
+        sem manter os dicionários em memória. Eventos sem machine_id ou
+        timestamp são descartados, como em merge_sensor_events.
+        """
+        builder = EventBatchBuilder(chunk_size)
+        for event in events:
+            builder.add(event)
+        return builder.build()
+
+
+class EventBatchBuilder:
+    """Acumula eventos em arrays compactos e gera um EventBatch."""
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._machine_index: Dict[str, int] = {}
+        self._event_index: Dict[str, int] = {}
+        self._machine_codes = array("i")
+        self._timestamp_ms = array("q")
+        self._temperature = array("f")
+        self._vibration = array("f")
+        self._event_codes = array("h")
+        self._pending_timestamps: List[str] = []
+        self.total_events = 0
+
+    def add(self, event: Dict) -> None:
+        """Adiciona um evento bruto ao lote."""
+        self.total_events += 1
+        machine_id = event.get("machine_id")
+        timestamp_str = event.get("timestamp_utc") or event.get("timestamp_registro")
+        if not (machine_id and timestamp_str):
+            return
+
+        machine_code = self._machine_index.setdefault(machine_id, len(self._machine_index))
+        temperature = vibration = np.nan
+        event_code = 0
+        # Mesma prioridade do merge: temperatura, depois vibração, depois falha
+        if "temperature_celsius" in event:
+            temperature = _to_float(event["temperature_celsius"])
+        elif "vibration_rms" in event:
+            vibration = _to_float(event["vibration_rms"])
+        elif "codigo_evento" in event:
+            event_code = self._event_index.setdefault(
+                event["codigo_evento"], len(self._event_index) + 1
+            )
+
+        self._machine_codes.append(machine_code)
+        self._temperature.append(temperature)
+        self._vibration.append(vibration)
+        self._event_codes.append(event_code)
+        self._pending_timestamps.append(timestamp_str)
+        if len(self._pending_timestamps) >= self.chunk_size:
+            self._flush_timestamps()
+
+    def _flush_timestamps(self) -> None:
+        if self._pending_timestamps:
+            parsed = parse_timestamps_to_epoch_ms(pd.Series(self._pending_timestamps, dtype=object))
+            self._timestamp_ms.extend(parsed.tolist())
+            self._pending_timestamps = []
+
+    def build(self) -> EventBatch:
+        """Finaliza o lote."""
+        self._flush_timestamps()
+        return EventBatch(
+            machine_ids=list(self._machine_index),
+            machine_codes=np.frombuffer(self._machine_codes, dtype=np.int32),
+            timestamp_ms=np.frombuffer(self._timestamp_ms, dtype=np.int64),
+            temperature=np.frombuffer(self._temperature, dtype=np.float32),
+            vibration=np.frombuffer(self._vibration, dtype=np.float32),
+            event_codes=np.frombuffer(self._event_codes, dtype=np.int16),
+            event_names=list(self._event_index),
+        )
+
+
+class WindowBatch:
+    """
+    Lote colunar de janelas de um minuto por máquina (resultado do merge).
+
+    Atributos:
+        machine_ids: Dicionário de categorias (código -> machine_id).
+        machine_codes: Código da máquina de cada janela (int32).
+        window_ms: Início da janela em epoch ms (int64).
+        temperatura: Última temperatura da janela (float32, NaN se ausente).
+        vibracao: Última vibração da janela (float32, NaN se ausente).
+        falha: Último código de falha da janela (int16, 0 se ausente).
+        event_names: Dicionário de categorias dos códigos de evento.
+    """
+
+    def __init__(
+        self,
+        machine_ids: List[str],
+        machine_codes: np.ndarray,
+        window_ms: np.ndarray,
+        temperatura: np.ndarray,
+        vibracao: np.ndarray,
+        falha: np.ndarray,
+        event_names: List[str],
+    ):
+        self.machine_ids = machine_ids
+        self.machine_codes = machine_codes
+        self.window_ms = window_ms
+        self.temperatura = temperatura
+        self.vibracao = vibracao
+        self.falha = falha
+        self.event_names = event_names
+
+    def __len__(self) -> int:
+        return len(self.window_ms)
+
+    def machine_id_array(self) -> np.ndarray:
+        """Decodifica os machine_ids de cada janela."""
+        return np.asarray(self.machine_ids, dtype=object)[self.machine_codes]
+
+    def _decoded_columns(self, order: np.ndarray) -> Iterator[tuple]:
+        machine_ids = self.machine_id_array()[order].tolist()
+        window_strs = format_window_timestamps(self.window_ms[order])
+        temperaturas = float32_to_python(self.temperatura[order])
+        vibracoes = float32_to_python(self.vibracao[order])
+        names = [None] + list(self.event_names)
+        falhas = [names[code] for code in self.falha[order].tolist()]
+        return zip(machine_ids, window_strs, temperaturas, vibracoes, falhas)
+
+    def iter_rows(self, sort_by_time: bool = True) -> Iterator[Dict]:
+        """
+        Gera cada janela no formato de dicionário usado por merge_sensor_events,
+        por padrão em ordem cronológica (estável, como sorted()).
+        """
+        if sort_by_time:
+            order = np.argsort(self.window_ms, kind="stable")
+        else:
+            order = np.arange(len(self))
+        for machine_id, window_str, temperatura, vibracao, falha in self._decoded_columns(order):
+            yield {
+                "machine_id": machine_id,
+                "timestamp_janela": window_str,
+                "temperatura": temperatura,
+                "vibracao": vibracao,
+                "falha": falha,
+            }
+
+    def to_dict(self) -> Dict:
+        """Converte para o contrato em dicionário de merge_sensor_events."""
+        return {
+            f"{row['machine_id']}_{row['timestamp_janela']}": row
+            for row in self.iter_rows(sort_by_time=False)
+        }
+
+    @classmethod
+    def from_dict(cls, grouped_windows: Dict) -> "WindowBatch":
+        """Constrói o lote a partir do dicionário retornado por merge_sensor_events."""
+        rows = list(grouped_windows.values())
+        machine_index: Dict[str, int] = {}
+        event_index: Dict[str, int] = {}
+        machine_codes = [machine_index.setdefault(row["machine_id"], len(machine_index)) for row in rows]
+        falha = [
+            0 if row["falha"] is None else event_index.setdefault(row["falha"], len(event_index) + 1)
+            for row in rows
+        ]
+        window_ms = parse_timestamps_to_epoch_ms(
+            pd.Series([row["timestamp_janela"] for row in rows], dtype=object)
+        ) if rows else np.array([], dtype=np.int64)
+        return cls(
+            machine_ids=list(machine_index),
+            machine_codes=np.asarray(machine_codes, dtype=np.int32),
+            window_ms=np.asarray(window_ms, dtype=np.int64),
+            temperatura=np.asarray(
+                [np.nan if row["temperatura"] is None else row["temperatura"] for row in rows],
+                dtype=np.float32,
+            ),
+            vibracao=np.asarray(
+                [np.nan if row["vibracao"] is None else row["vibracao"] for row in rows],
+                dtype=np.float32,
+            ),
+            falha=np.asarray(falha, dtype=np.int16),
+            event_names=list(event_index),
+        )
+
+
+def _to_float(value) -> float:
+    return np.nan if value is None else float(value)
@@ -2,19 +2,102 @@
 Módulo de engenharia de features.
 Contém a lógica de cálculo de features preditivas e adição de labels.
 """
-from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+import os
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
+import numpy as np
+import pandas as pd
 
-def calculate_features(grouped_windows: Dict, previous_machine_states: Dict) -> Dict:
+from event_batch import (
+    WindowBatch,
+    float32_to_float64,
+    format_window_timestamps,
+    parse_timestamps_to_epoch_ms,
+)
+
+
+# Janela da feature temp_max_24h
+TEMP_MAX_WINDOW_MS = 24 * 60 * 60 * 1000
+# Fator de suavização da EMA de vibração (vib_media_5h), uma média 'lenta'
+VIB_EMA_ALPHA = float(os.getenv("VIB_EMA_ALPHA", 0.01))
+
+# Engines de cálculo de features disponíveis (selecionadas via FEATURE_ENGINE)
+FEATURE_ENGINE_PYTHON = "python"
+FEATURE_ENGINE_VECTORIZED = "vectorized"
+
+
+def _iso_to_epoch_ms(timestamp_str: str) -> int:
+    """Converte um timestamp ISO 8601 em epoch ms (sem fuso é tratado como UTC)."""
+    dt_obj = datetime.fromisoformat(timestamp_str)
+    if dt_obj.tzinfo is None:
+        dt_obj = dt_obj.replace(tzinfo=timezone.utc)
+    return int(dt_obj.timestamp() * 1000)
+
+
+class RollingMax:
+    """
+    Máximo exato em uma janela deslizante de tempo (t - janela, t], mantido
+    com uma deque monotônica decrescente de (timestamp_ms, valor).
+
+    Cada leitura entra e sai da deque no máximo uma vez (O(1) amortizado),
+    e a deque só guarda os candidatos a máximo, o que a mantém pequena o
+    bastante para ser persistida no estado da máquina.
+    """
+
+    def __init__(self, window_ms: int = TEMP_MAX_WINDOW_MS, entries: Optional[List] = None):
+        self.window_ms = window_ms
+        self._entries = deque((int(ts), float(value)) for ts, value in (entries or []))
+
+    def push(self, timestamp_ms: int, value: float) -> None:
+        """Adiciona uma leitura (em ordem cronológica) e descarta as expiradas."""
+        while self._entries and self._entries[-1][1] <= value:
+            self._entries.pop()
+        self._entries.append((timestamp_ms, value))
+        self.evict(timestamp_ms)
+
+    def evict(self, now_ms: int) -> None:
+        """Remove as leituras que saíram da janela terminada em now_ms."""
+        while self._entries and self._entries[0][0] <= now_ms - self.window_ms:
+            self._entries.popleft()
+
+    def max(self, default: float = 0) -> float:
+        """Máximo da janela atual (default se não há leituras na janela)."""
+        return self._entries[0][1] if self._entries else default
+
+    def to_state(self) -> Dict:
+        """Forma serializada compacta para o estado da máquina."""
+        return {"deque": [[ts, value] for ts, value in self._entries]}
+
+    @classmethod
+    def from_state(cls, state: Optional[Dict], window_ms: int = TEMP_MAX_WINDOW_MS) -> "RollingMax":
+        """
+        Reconstrói a estrutura a partir do estado persistido. Aceita também o
+        formato anterior {"value", "timestamp"}, convertido em uma única leitura.
+        """
+        if not state:
+            return cls(window_ms)
+        if "deque" in state:
+            return cls(window_ms, state["deque"])
+        return cls(window_ms, [[_iso_to_epoch_ms(state["timestamp"]), state["value"]]])
+
+
+def calculate_features(
+    grouped_windows: Union[Dict, WindowBatch], previous_machine_states: Dict,
+    alpha: float = VIB_EMA_ALPHA
+) -> Dict:
     """
     Calcula as features preditivas (vib_media_5h, temp_max_24h) a partir dos
     dados agrupados, utilizando o estado anterior da máquina para cálculos stateful.
 
     Args:
-        grouped_windows: Dicionário com os dados dos sensores já agrupados por janela de tempo.
+        grouped_windows: Dicionário com os dados dos sensores já agrupados por janela de tempo,
+                         ou o WindowBatch equivalente.
         previous_machine_states: Dicionário contendo o último estado conhecido de cada máquina,
                                  buscado do DynamoDB.
+        alpha: Fator de suavização da EMA de vibração.
 
     Returns:
         Um dicionário com as features finais calculadas para cada máquina.
@@ -23,7 +106,13 @@ def calculate_features(grouped_windows: Dict, previous_machine_states: Dict) ->
     print(f"Calculando features para {len(grouped_windows)} janelas de tempo...")
 
     # Ordena as janelas por timestamp para garantir o processamento em ordem cronológica
-    sorted_windows = sorted(grouped_windows.values(), key=lambda item: item['timestamp_janela'])
+    if isinstance(grouped_windows, WindowBatch):
+        sorted_windows = grouped_windows.iter_rows(sort_by_time=True)
+    else:
+        sorted_windows = sorted(grouped_windows.values(), key=lambda item: item['timestamp_janela'])
+
+    # Estruturas de máxima em 24h vivas durante o cálculo, serializadas ao final
+    rolling_maxes = {}
 
     for window_data in sorted_windows:
         machine_id = window_data["machine_id"]
@@ -33,75 +122,316 @@ def calculate_features(grouped_windows: Dict, previous_machine_states: Dict) ->
         # --- Feature 1: Média Móvel Exponencial (EMA) para Vibração (vib_media_5h) ---
         last_avg_vibration = machine_state.get("vib_media_5h", window_data.get("vibracao") or 0)
         current_vibration = window_data.get("vibracao") or last_avg_vibration
-        alpha = 0.01 # Fator de suavização para uma média 'lenta'
         new_avg_vibration = (current_vibration * alpha) + (last_avg_vibration * (1 - alpha))
 
         # --- Feature 2: Temperatura Máxima nas últimas 24h (temp_max_24h) ---
-        last_max_temp_state = machine_state.get("temp_max_24h_state", {"value": 0, "timestamp": "1970-01-01T00:00:00+00:00"})
-        last_max_temp_value = last_max_temp_state["value"]
-        last_max_temp_ts = datetime.fromisoformat(last_max_temp_state["timestamp"])
-        current_window_ts = datetime.fromisoformat(window_data["timestamp_janela"])
-        
-        # Garante que ambos os timestamps sejam timezone-aware (UTC)
-        if last_max_temp_ts.tzinfo is None:
-            last_max_temp_ts = last_max_temp_ts.replace(tzinfo=timezone.utc)
-        if current_window_ts.tzinfo is None:
-            current_window_ts = current_window_ts.replace(tzinfo=timezone.utc)
-
-        if (current_window_ts - last_max_temp_ts) > timedelta(hours=24):
-            new_max_temp_value = window_data.get("temperatura") or 0
+        # Máximo exato na janela deslizante (t - 24h, t], via deque monotônica
+        temp_max = rolling_maxes.get(machine_id)
+        if temp_max is None:
+            temp_max = RollingMax.from_state(machine_state.get("temp_max_24h_state"))
+            rolling_maxes[machine_id] = temp_max
+        current_window_ms = _iso_to_epoch_ms(window_data["timestamp_janela"])
+        if window_data.get("temperatura") is not None:
+            temp_max.push(current_window_ms, window_data["temperatura"])
         else:
-            current_temp = window_data.get("temperatura") or 0
-            new_max_temp_value = max(last_max_temp_value, current_temp)
+            temp_max.evict(current_window_ms)
+        new_max_temp_value = temp_max.max(default=0)
 
         # --- Montagem do resultado final para esta máquina ---
         final_features[machine_id] = {
             "machine_id": machine_id,
+            "timestamp_janela": window_data["timestamp_janela"],
             "timestamp_processamento": datetime.now(timezone.utc).isoformat(),
             "vib_media_5h": round(new_avg_vibration, 4),
             "temp_max_24h": round(new_max_temp_value, 2)
         }
 
         # --- Atualiza o estado da máquina para ser salvo ou usado na próxima iteração ---
-        new_max_temp_state = {"value": new_max_temp_value, "timestamp": window_data["timestamp_janela"]}
+        previous_machine_states[machine_id] = {
+            "vib_media_5h": new_avg_vibration
+        }
+
+    for machine_id, temp_max in rolling_maxes.items():
+        previous_machine_states[machine_id]["temp_max_24h_state"] = temp_max.to_state()
+
+    print("Cálculo de features concluído.")
+    return final_features
+
+
+def _window_columns(grouped_windows: Union[Dict, WindowBatch]) -> Tuple:
+    """
+    Extrai as colunas usadas no cálculo de features:
+    (machine_ids, códigos das máquinas, epoch ms, temperatura, vibração).
+    """
+    if isinstance(grouped_windows, WindowBatch):
+        return (
+            grouped_windows.machine_ids,
+            grouped_windows.machine_codes.astype(np.int64),
+            grouped_windows.window_ms,
+            float32_to_float64(grouped_windows.temperatura),
+            float32_to_float64(grouped_windows.vibracao),
+        )
+
+    rows = list(grouped_windows.values())
+    codes, machine_ids = pd.factorize(pd.Series([row["machine_id"] for row in rows], dtype=object))
+    window_ms = parse_timestamps_to_epoch_ms(
+        pd.Series([row["timestamp_janela"] for row in rows], dtype=object)
+    )
+    temperatures = np.array(
+        [np.nan if row.get("temperatura") is None else row["temperatura"] for row in rows],
+        dtype=np.float64,
+    )
+    vibrations = np.array(
+        [np.nan if row.get("vibracao") is None else row["vibracao"] for row in rows],
+        dtype=np.float64,
+    )
+    return list(machine_ids), codes.astype(np.int64), window_ms, temperatures, vibrations
+
+
+def _grouped_ema_last(
+    codes: np.ndarray, vibrations: np.ndarray, machines: np.ndarray,
+    first_index: np.ndarray, states: List[Dict], alpha: float
+) -> np.ndarray:
+    """
+    EMA de vibração ao fim da janela de cada máquina (ewm com adjust=False),
+    com a mesma semântica do laço de calculate_features: vibração ausente ou
+    zero mantém a média, e a semente é o estado salvo ou, sem estado, a
+    primeira vibração da janela (0 se ausente).
+
+    Espera as janelas ordenadas por máquina e, dentro dela, por tempo.
+    """
+    present = ~np.isnan(vibrations) & (vibrations != 0)
+    first_vibrations = np.where(present[first_index], vibrations[first_index], 0.0)
+    seeds = np.array(
+        [state.get("vib_media_5h", first) for state, first in zip(states, first_vibrations)],
+        dtype=np.float64,
+    )
+
+    # Insere a semente de cada máquina antes das suas leituras
+    present_codes = codes[present]
+    starts = np.searchsorted(present_codes, machines)
+    ema_codes = np.insert(present_codes, starts, machines)
+    ema_values = np.insert(vibrations[present], starts, seeds)
+
+    ema = pd.Series(ema_values).groupby(ema_codes, sort=False).ewm(alpha=alpha, adjust=False).mean()
+    return ema.groupby(level=0).last().reindex(machines).to_numpy()
+
+
+def _grouped_rolling_max_last(
+    codes: np.ndarray, window_ms: np.ndarray, temperatures: np.ndarray,
+    machines: np.ndarray, last_ms: np.ndarray, states: List[Dict],
+    window_size_ms: int = TEMP_MAX_WINDOW_MS
+) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Máxima exata em (t - 24h, t] ao fim da janela de cada máquina e o estado
+    de RollingMax resultante, sem percorrer as janelas em Python.
+
+    Returns:
+        Tupla (máxima de cada máquina, estado temp_max_24h_state de cada máquina).
+    """
+    seeds = [
+        RollingMax.from_state(state.get("temp_max_24h_state"), window_size_ms).to_state()["deque"]
+        for state in states
+    ]
+    seed_codes = np.repeat(machines, [len(seed) for seed in seeds])
+    seed_ms = np.array([ts for seed in seeds for ts, _ in seed], dtype=np.int64)
+    seed_values = np.array([value for seed in seeds for _, value in seed], dtype=np.float64)
+
+    present = ~np.isnan(temperatures)
+    all_codes = np.concatenate((seed_codes, codes[present]))
+    all_ms = np.concatenate((seed_ms, window_ms[present]))
+    all_values = np.concatenate((seed_values, temperatures[present]))
+
+    # Mantém só as leituras dentro da janela terminada na última janela da máquina
+    in_window = all_ms > last_ms[np.searchsorted(machines, all_codes)] - window_size_ms
+    order = np.lexsort((all_ms[in_window], all_codes[in_window]))
+    all_codes = all_codes[in_window][order]
+    all_ms = all_ms[in_window][order]
+    all_values = all_values[in_window][order]
+
+    maxes = pd.Series(all_values).groupby(all_codes).max().reindex(machines, fill_value=0)
+
+    # Uma leitura permanece na deque se for maior que todas as posteriores da máquina
+    reversed_codes = all_codes[::-1]
+    later_max = (
+        pd.Series(all_values[::-1]).groupby(reversed_codes).cummax()
+        .groupby(reversed_codes).shift(1).fillna(-np.inf).to_numpy()[::-1]
+    )
+    keep = all_values > later_max
+
+    deques = {code: [] for code in machines.tolist()}
+    for code, ts, value in zip(
+        all_codes[keep].tolist(), all_ms[keep].tolist(), all_values[keep].tolist()
+    ):
+        deques[code].append([ts, value])
+    return maxes.to_numpy(), [{"deque": deques[code]} for code in machines.tolist()]
+
+
+def calculate_features_vectorized(
+    grouped_windows: Union[Dict, WindowBatch], previous_machine_states: Dict,
+    alpha: float = VIB_EMA_ALPHA
+) -> Dict:
+    """
+    Versão vetorizada de calculate_features: agrupa as janelas por máquina e
+    calcula a EMA de vibração e a máxima de temperatura em 24h com primitivas
+    NumPy/pandas (ewm, cummax, groupby), semeadas pelo estado anterior.
+
+    Produz as mesmas features e o mesmo estado (dentro da tolerância de ponto
+    flutuante), com custo em Python proporcional ao número de máquinas e não
+    ao número de janelas.
+
+    Args:
+        grouped_windows: Dicionário com os dados agrupados por janela ou o WindowBatch equivalente.
+        previous_machine_states: Último estado conhecido de cada máquina (atualizado in-place).
+        alpha: Fator de suavização da EMA de vibração.
+
+    Returns:
+        Um dicionário com as features finais calculadas para cada máquina.
+    """
+    final_features = {}
+    print(f"Calculando features (vetorizado) para {len(grouped_windows)} janelas de tempo...")
+    if not len(grouped_windows):
+        print("Cálculo de features concluído.")
+        return final_features
+
+    machine_ids, codes, window_ms, temperatures, vibrations = _window_columns(grouped_windows)
+
+    # Ordem de saída igual à do laço: máquinas pela primeira janela em ordem cronológica
+    chronological = np.argsort(window_ms, kind="stable")
+    _, first_position = np.unique(codes[chronological], return_index=True)
+    output_order = np.argsort(first_position)
+
+    # Ordena por máquina e, dentro de cada máquina, cronologicamente
+    order = np.lexsort((window_ms, codes))
+    codes, window_ms = codes[order], window_ms[order]
+    temperatures, vibrations = temperatures[order], vibrations[order]
+    machines, first_index = np.unique(codes, return_index=True)
+    last_index = np.append(first_index[1:], len(codes)) - 1
+    states = [previous_machine_states.get(machine_ids[code], {}) for code in machines.tolist()]
+
+    vib_means = _grouped_ema_last(codes, vibrations, machines, first_index, states, alpha)
+    temp_maxes, temp_states = _grouped_rolling_max_last(
+        codes, window_ms, temperatures, machines, window_ms[last_index], states
+    )
+
+    last_windows = format_window_timestamps(window_ms[last_index])
+    timestamp_processamento = datetime.now(timezone.utc).isoformat()
+    for position in output_order.tolist():
+        machine_id = machine_ids[machines[position]]
+        new_avg_vibration = float(vib_means[position])
+        final_features[machine_id] = {
+            "machine_id": machine_id,
+            "timestamp_janela": last_windows[position],
+            "timestamp_processamento": timestamp_processamento,
+            "vib_media_5h": round(new_avg_vibration, 4),
+            "temp_max_24h": round(temp_maxes[position].item(), 2)
+        }
         previous_machine_states[machine_id] = {
             "vib_media_5h": new_avg_vibration,
-            "temp_max_24h_state": new_max_temp_state
+            "temp_max_24h_state": temp_states[position]
         }
 
     print("Cálculo de features concluído.")
     return final_features
 
 
-def add_predictive_label(features_dict: Dict, failure_events: List[Dict], prediction_horizon_hours: int) -> Dict:
+def compute_features(
+    grouped_windows: Union[Dict, WindowBatch], previous_machine_states: Dict,
+    engine: str = FEATURE_ENGINE_PYTHON, alpha: float = VIB_EMA_ALPHA
+) -> Dict:
+    """
+    Seleciona a implementação do cálculo de features.
+
+    Args:
+        grouped_windows: As janelas agrupadas pelo merge.
+        previous_machine_states: Último estado conhecido de cada máquina.
+        engine: 'python' (laço original) ou 'vectorized' (NumPy/pandas).
+        alpha: Fator de suavização da EMA de vibração.
+    """
+    if engine == FEATURE_ENGINE_VECTORIZED:
+        return calculate_features_vectorized(grouped_windows, previous_machine_states, alpha)
+    if engine != FEATURE_ENGINE_PYTHON:
+        raise ValueError(f"Engine de features desconhecida: {engine}")
+    return calculate_features(grouped_windows, previous_machine_states, alpha)
+
+
+def label_column(horizon_hours: int) -> str:
+    """Nome da coluna de label para um horizonte de predição (ex: label_falha_24h)."""
+    return f"label_falha_{horizon_hours}h"
+
+
+class FailureIndex:
+    """
+    Índice de falhas por máquina: timestamps (epoch ms) ordenados, consultados
+    por busca binária em vez de percorrer todas as falhas para cada janela.
+    """
+
+    def __init__(self, failure_events: Iterable[Dict]):
+        timestamps: Dict[str, List[int]] = {}
+        for failure in failure_events:
+            machine_id = failure.get("machine_id")
+            timestamp_str = failure.get("timestamp_utc")
+            if machine_id and timestamp_str:
+                timestamps.setdefault(machine_id, []).append(_iso_to_epoch_ms(timestamp_str))
+        self._timestamps = {machine_id: sorted(values) for machine_id, values in timestamps.items()}
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def next_failure_ms(self, machine_id: str, after_ms: int) -> Optional[int]:
+        """Primeira falha da máquina estritamente posterior a after_ms (None se não há)."""
+        timestamps = self._timestamps.get(machine_id)
+        if not timestamps:
+            return None
+        position = bisect_right(timestamps, after_ms)
+        return timestamps[position] if position < len(timestamps) else None
+
+
+def add_predictive_label(
+    features_dict: Dict, failure_events: List[Dict], prediction_horizon_hours: Union[int, Iterable[int]]
+) -> Dict:
     """
     Adiciona labels preditivas às features baseadas em falhas futuras.
 
+    Cada linha recebe, para cada horizonte h, label_falha_{h}h = 1 se a máquina
+    tem uma falha em (timestamp_janela, timestamp_janela + h]. Uma única busca
+    binária por linha (a próxima falha) atende todos os horizontes.
+
     Args:
         features_dict: Dicionário com as features calculadas para cada máquina.
         failure_events: Lista de eventos de falha do DynamoDB.
-        prediction_horizon_hours: Horizonte de predição em horas.
+        prediction_horizon_hours: Horizonte de predição em horas, ou uma lista
+                                  de horizontes (ex: [1, 6, 24]).
 
     Returns:
         Dicionário com features + labels preditivas.
     """
+    if isinstance(prediction_horizon_hours, int):
+        horizons = [prediction_horizon_hours]
+    else:
+        horizons = sorted(prediction_horizon_hours)
+
     if not failure_events:
         print("Nenhum evento de falha encontrado. Labels serão definidas como 0.")
-        for machine_id in features_dict:
-            features_dict[machine_id]["label_falha_24h"] = 0
+        for features in features_dict.values():
+            for horizon in horizons:
+                features[label_column(horizon)] = 0
         return features_dict
 
-    # Cria um mapeamento de máquinas que falharam no horizonte de predição
-    machines_with_failures = set()
-    for failure in failure_events:
-        machine_id = failure.get("machine_id")
-        if machine_id:
-            machines_with_failures.add(machine_id)
-
-    print(f"Encontradas {len(machines_with_failures)} máquinas com falhas no horizonte de {prediction_horizon_hours}h")
+    failure_index = FailureIndex(failure_events)
+    print(
+        f"Índice de falhas com {len(failure_index)} máquinas; "
+        f"horizontes de predição: {', '.join(f'{h}h' for h in horizons)}"
+    )
 
     # Adiciona as labels preditivas
     for machine_id, features in features_dict.items():
-        features["label_falha_24h"] = 1 if machine_id in machines_with_failures else 0
+        window_ms = _iso_to_epoch_ms(features["timestamp_janela"])
+        next_failure_ms = failure_index.next_failure_ms(machine_id, window_ms)
+        for horizon in horizons:
+            features[label_column(horizon)] = int(
+                next_failure_ms is not None
+                and next_failure_ms <= window_ms + horizon * 60 * 60 * 1000
+            )
 
     return features_dict
@@ -1,31 +1,142 @@
 import json
 import os
+from datetime import timedelta
+
+import metrics
 from pipeline import FeaturePipeline
+from watermark import EventTimeWatermark
+from window_scheduler import (
+    DEFAULT_BYTES_PER_SECOND,
+    DEFAULT_MEMORY_FACTOR,
+    AdaptiveWindowScheduler,
+)
+
+# Margem de segurança (s) entre o orçamento do catch-up e o timeout da Lambda
+CATCH_UP_SAFETY_MARGIN_SECONDS = 60
+
+
+def build_config():
+    """Lê as configurações do pipeline das variáveis de ambiente."""
+    return {
+        "bucket_name": os.getenv("DATA_LAKE_BUCKET"),
+        "features_table": os.getenv("DYNAMODB_TABLE_NAME"),
+        "failures_table": os.getenv("DYNAMODB_LABEL_HISTORY_TABLE"),
+        "ssm_param_name": os.getenv("SSM_PARAMETER_NAME"),
+        "time_window": int(os.getenv("TIME_WINDOW", 1)),
+        "prediction_horizon": int(os.getenv("PREDICTION_HORIZON_HOURS", 24)),
+        "label_horizons": [
+            int(hours) for hours in os.getenv("LABEL_HORIZONS_HOURS", "").split(",") if hours.strip()
+        ] or None,
+        "processing_lag": int(os.getenv("PROCESSING_LAG_HOURS", 25)),
+        "merge_engine": os.getenv("MERGE_ENGINE", "python"),
+        "feature_engine": os.getenv("FEATURE_ENGINE", "python"),
+        "state_table": os.getenv("FEATURE_STATE_TABLE"),
+        "state_file": os.getenv("FEATURE_STATE_FILE"),
+        "chunk_size": int(os.getenv("CHUNK_SIZE_EVENTS", 0)) or None,
+        "max_windows_in_memory": int(os.getenv("CHUNK_MAX_WINDOWS_IN_MEMORY", 500_000)),
+        "spill_dir": os.getenv("SPILL_DIR", "/tmp"),
+        # Com FEATURE_STORE_SOURCE=stream, a Feature Store é atualizada pela Lambda de streaming
+        "write_feature_store": os.getenv("FEATURE_STORE_SOURCE", "batch") != "stream",
+    }
+
+
+def build_window_scheduler(time_budget_seconds, memory_budget_mb):
+    """Cria o AdaptiveWindowScheduler quando ADAPTIVE_WINDOW=true."""
+    if os.getenv("ADAPTIVE_WINDOW", "false").lower() != "true":
+        return None
+    return AdaptiveWindowScheduler(
+        min_hours=int(os.getenv("WINDOW_MIN_HOURS", 1)),
+        max_hours=int(os.getenv("WINDOW_MAX_HOURS", 24)),
+        bytes_per_second=float(os.getenv("ADAPTIVE_BYTES_PER_SECOND", DEFAULT_BYTES_PER_SECOND)),
+        memory_factor=float(os.getenv("ADAPTIVE_MEMORY_FACTOR", DEFAULT_MEMORY_FACTOR)),
+        time_budget_seconds=time_budget_seconds,
+        memory_budget_mb=memory_budget_mb,
+    )
+
+
+def build_watermark(config):
+    """
+    Cria o EventTimeWatermark quando WATERMARK_ENABLED=true. Partições sem
+    manifesto de compactação são consideradas seladas após o processing_lag.
+    """
+    if os.getenv("WATERMARK_ENABLED", "false").lower() != "true":
+        return None
+    return EventTimeWatermark(
+        config["bucket_name"], seal_fallback=timedelta(hours=config["processing_lag"])
+    )
+
 
 def lambda_handler(event, context):
     """
     Ponto de entrada limpo. Lê configurações do ambiente e instancia o pipeline.
+
+    Com CATCH_UP_MAX_WINDOWS > 1, processa várias janelas atrasadas na mesma
+    invocação, dentro do tempo restante da Lambda e de uma fração da memória.
+    Com CATCH_UP_PIPELINED=true, a extração, a transformação e a carga das
+    janelas são sobrepostas (ver FeaturePipeline.run_pipelined).
+    Com ADAPTIVE_WINDOW=true, o tamanho de cada janela é escolhido pelo
+    volume estimado, dentro dos mesmos orçamentos (ver window_scheduler).
+    Com WATERMARK_ENABLED=true, o processing_lag fixo dá lugar ao watermark
+    de tempo de evento (ver watermark); o catch-up não usa o modo em pipeline.
+
+    Ao final, emite as métricas da execução em um registro EMF (ver metrics).
     """
     print("--- INICIANDO PIPELINE DE PROCESSAMENTO DE FEATURES STATEFUL ---")
+    metrics.reset()
+    mode = "single"
+    status = "error"
     try:
         # Lê configurações das variáveis de ambiente
-        config = {
-            "bucket_name": os.getenv("DATA_LAKE_BUCKET"),
-            "features_table": os.getenv("DYNAMODB_TABLE_NAME"),
-            "failures_table": os.getenv("DYNAMODB_LABEL_HISTORY_TABLE"),
-            "ssm_param_name": os.getenv("SSM_PARAMETER_NAME"),
-            "time_window": int(os.getenv("TIME_WINDOW", 1)),
-            "prediction_horizon": int(os.getenv("PREDICTION_HORIZON_HOURS", 24)),
-            "processing_lag": int(os.getenv("PROCESSING_LAG_HOURS", 25))
-        }
-        
+        config = build_config()
+
         print(f"Configurações carregadas: {config}")
-        
+
+        time_budget = None
+        if context is not None:
+            time_budget = (
+                context.get_remaining_time_in_millis() / 1000 - CATCH_UP_SAFETY_MARGIN_SECONDS
+            )
+        memory_budget = int(os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", 0)) * float(
+            os.getenv("CATCH_UP_MEMORY_FRACTION", 0.8)
+        ) or None
+
         # Instancia o pipeline com parâmetros injetados
-        pipeline = FeaturePipeline(**config)
-        result = pipeline.run()
+        watermark = build_watermark(config)
+        pipeline = FeaturePipeline(
+            **config,
+            window_scheduler=build_window_scheduler(time_budget, memory_budget),
+            watermark=watermark,
+        )
+
+        max_windows = int(os.getenv("CATCH_UP_MAX_WINDOWS", 1))
+        with metrics.profiled():
+            if max_windows > 1:
+                pipelined = os.getenv("CATCH_UP_PIPELINED", "false").lower() == "true"
+                if pipelined and watermark is None:
+                    mode = "pipelined"
+                    result = pipeline.run_pipelined(
+                        time_budget,
+                        max_windows,
+                        memory_budget,
+                        queue_depth=int(os.getenv("CATCH_UP_QUEUE_DEPTH", 1)),
+                    )
+                else:
+                    mode = "catch_up"
+                    result = pipeline.run_catch_up(time_budget, max_windows, memory_budget)
+            else:
+                result = pipeline.run()
+        status = "success"
         print(f"--- RESULTADO: {result} ---")
         return {"statusCode": 200, "body": json.dumps(result)}
     except Exception as e:
         print(f"[ERRO FATAL] Falha na execução do pipeline: {e}")
-        return {"statusCode": 500, "body": json.dumps(f"Erro no pipeline: {str(e)}")}
\ No newline at end of file
+        return {"statusCode": 500, "body": json.dumps(f"Erro no pipeline: {str(e)}")}
+    finally:
+        metrics.emit(
+            dimensions={"FunctionName": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "processing")},
+            properties={
+                "Mode": mode,
+                "Status": status,
+                "RequestId": getattr(context, "aws_request_id", None),
+            },
+        )
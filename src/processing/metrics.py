@@ -0,0 +1,227 @@
+"""
+Módulo de instrumentação do pipeline de processamento.
+Acumula, durante uma execução, o tempo de cada etapa, contadores de I/O
+(objetos e bytes lidos do S3, capacidade consumida no DynamoDB), eventos,
+janelas e máquinas processados, e o pico de memória. Ao final, emite um único
+registro JSON no CloudWatch Embedded Metric Format (EMF): o CloudWatch Logs
+extrai as métricas do próprio log da Lambda, sem chamadas à API.
+
+Com PROFILE_MODE=cprofile ou PROFILE_MODE=tracemalloc, a execução também é
+perfilada; o resumo vai para o log e o perfil completo para PROFILE_DIR.
+"""
+
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "PredictiveMaintenance/Processing")
+PROFILE_MODE_CPROFILE = "cprofile"
+PROFILE_MODE_TRACEMALLOC = "tracemalloc"
+PROFILE_MODE = os.getenv("PROFILE_MODE", "").lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp")
+# Linhas do resumo do perfil impressas no log
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", 25))
+
+# Unidade CloudWatch de cada contador (os demais são "Count")
+COUNTER_UNITS = {
+    "S3BytesRead": "Bytes",
+    "S3BytesWritten": "Bytes",
+    "EstimatedBytesScheduled": "Bytes",
+    "DynamoDBReadCapacityUnits": "Count",
+    "DynamoDBWriteCapacityUnits": "Count",
+}
+
+# Contadores e tempos da execução atual (atualizados também pelas threads de leitura do S3)
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_stage_seconds: Dict[str, float] = {}
+_properties: Dict[str, list] = {}
+
+
+def reset() -> None:
+    """Zera os contadores e tempos (início de uma execução)."""
+    with _lock:
+        _counters.clear()
+        _stage_seconds.clear()
+        _properties.clear()
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Soma value ao contador name."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def append_property(name: str, value) -> None:
+    """Acrescenta value à lista name, gravada no registro EMF sem virar métrica."""
+    with _lock:
+        _properties.setdefault(name, []).append(value)
+
+
+def record_consumed_capacity(response: Dict, metric: str) -> None:
+    """
+    Soma ao contador metric as unidades de capacidade de uma resposta do
+    DynamoDB pedida com ReturnConsumedCapacity="TOTAL" (objeto ou lista).
+    """
+    consumed = response.get("ConsumedCapacity")
+    if not consumed:
+        return
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    increment(metric, sum(float(entry.get("CapacityUnits", 0)) for entry in consumed))
+
+
+@contextmanager
+def stage(name: str):
+    """Acumula o tempo de parede de uma etapa do pipeline."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            _stage_seconds[name] = _stage_seconds.get(name, 0.0) + elapsed
+
+
+def timed(name: str):
+    """Decorador equivalente a stage(name) para o corpo de um método."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def peak_memory_mb() -> float:
+    """Pico de memória residente (RSS) do processo, em MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_memory_mb() -> float:
+    """
+    Memória residente (RSS) atual do processo, em MB. Ao contrário do pico,
+    cai quando a memória é devolvida, então serve para medir o que uma janela
+    ocupa em containers reaproveitados. Sem /proc (fora do Linux), usa o pico.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return peak_memory_mb()
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def snapshot() -> Dict[str, float]:
+    """Métricas da execução atual: tempos por etapa, contadores e pico de memória."""
+    with _lock:
+        values = {f"{name}Seconds": round(seconds, 6) for name, seconds in _stage_seconds.items()}
+        values.update(_counters)
+        events = _counters.get("SensorEventsRead", 0)
+        # Os eventos são lidos do S3 sob demanda pelo merge: a vazão inclui o I/O
+        read_seconds = _stage_seconds.get("Extract", 0.0) + _stage_seconds.get("Merge", 0.0)
+    if events and read_seconds:
+        values["SensorEventsPerSecond"] = round(events / read_seconds, 1)
+    values["PeakMemoryMB"] = round(peak_memory_mb(), 1)
+    return values
+
+
+def _unit(name: str) -> str:
+    if name.endswith("Seconds"):
+        return "Seconds"
+    if name == "PeakMemoryMB":
+        return "Megabytes"
+    if name == "SensorEventsPerSecond":
+        return "Count/Second"
+    return COUNTER_UNITS.get(name, "Count")
+
+
+def build_emf_record(
+    dimensions: Optional[Dict[str, str]] = None, properties: Optional[Dict] = None
+) -> Dict:
+    """
+    Monta o registro EMF com as métricas da execução atual.
+
+    Args:
+        dimensions: Dimensões das métricas (ex: {"FunctionName": ...}).
+        properties: Campos adicionais do registro, não extraídos como métricas.
+    """
+    dimensions = dimensions or {}
+    values = snapshot()
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [sorted(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": _unit(name)} for name in sorted(values)],
+                }
+            ],
+        }
+    }
+    with _lock:
+        record.update({name: list(entries) for name, entries in _properties.items()})
+    record.update(properties or {})
+    record.update(dimensions)
+    record.update(values)
+    return record
+
+
+def emit(dimensions: Optional[Dict[str, str]] = None, properties: Optional[Dict] = None) -> Dict:
+    """Imprime o registro EMF da execução em uma única linha de log e o retorna."""
+    record = build_emf_record(dimensions, properties)
+    print(json.dumps(record, default=str))
+    return record
+
+
+@contextmanager
+def profiled(mode: str = PROFILE_MODE, output_dir: str = PROFILE_DIR):
+    """
+    Perfila o bloco com cProfile (tempo de CPU por função) ou tracemalloc
+    (alocações por linha), conforme mode. Sem mode, não faz nada.
+    """
+    if mode not in (PROFILE_MODE_CPROFILE, PROFILE_MODE_TRACEMALLOC):
+        yield
+        return
+
+    path = os.path.join(output_dir, f"processing-{int(time.time())}.{mode}")
+    if mode == PROFILE_MODE_CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+            print(summary.getvalue())
+            print(f"Perfil cProfile salvo em {path}")
+        return
+
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        memory_snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory_snapshot.dump(path)
+        print(f"Pico de memória rastreada (tracemalloc): {peak / 1024 / 1024:.1f} MB")
+        for statistic in memory_snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+            print(statistic)
+        print(f"Snapshot tracemalloc salvo em {path}")
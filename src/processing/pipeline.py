@@ -2,18 +2,51 @@
 Módulo de pipeline de processamento de dados.
 """
 
+import bisect
+import copy
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import pandas as pd
 from data_access import (
-    fetch_sensor_data,
+    FEATURE_HISTORY_ENABLED,
+    PENDING_LABELS_PREFIX,
+    PROCESSED_PREFIX,
+    append_feature_history,
+    build_day_prefix,
+    fetch_sensor_batch,
+    iter_sensor_events,
     save_features_to_s3,
+    list_feature_files,
+    read_features_from_s3,
+    delete_s3_object,
     fetch_failure_labels_from_dynamo,
     save_features_to_dynamodb,
+    feature_content_hash,
     get_ssm_parameter,
     update_ssm_parameter,
 )
-from data_processing import merge_sensor_events
-from feature_engineering import calculate_features, add_predictive_label
+from chunked_processing import (
+    DEFAULT_SPILL_DIR,
+    WindowStore,
+    compute_features_chunked,
+    merge_events_chunked,
+)
+from data_processing import merge_events, MERGE_ENGINE_COLUMNAR, MERGE_ENGINE_PYTHON
+from event_batch import EventBatch, WindowBatch
+from metrics import current_memory_mb, increment, peak_memory_mb, timed
+from feature_engineering import compute_features, add_predictive_label, FEATURE_ENGINE_PYTHON
+from state_store import build_state_store
+from watermark import (
+    ceil_hour,
+    filter_events_by_event_time,
+    floor_hour,
+    format_checkpoint_value,
+    parse_checkpoint_value,
+)
 
 
 class FeaturePipeline:
@@ -26,6 +59,17 @@ class FeaturePipeline:
         time_window: int = 1,
         prediction_horizon: int = 24,
         processing_lag: int = 25,
+        merge_engine: str = MERGE_ENGINE_PYTHON,
+        feature_engine: str = FEATURE_ENGINE_PYTHON,
+        label_horizons: list = None,
+        state_table: str = None,
+        state_file: str = None,
+        chunk_size: int = None,
+        max_windows_in_memory: int = 500_000,
+        spill_dir: str = DEFAULT_SPILL_DIR,
+        window_scheduler=None,
+        write_feature_store: bool = True,
+        watermark=None,
     ):
         """
         Inicializa o pipeline com parâmetros injetados.
@@ -38,6 +82,32 @@ class FeaturePipeline:
             time_window: Janela de tempo para processamento em horas (padrão: 1)
             prediction_horizon: Horizonte de predição em horas (padrão: 24)
             processing_lag: Lag de processamento em horas (padrão: 25)
+            merge_engine: Implementação do merge de eventos: 'python',
+                          'vectorized' ou 'columnar' (EventBatch/WindowBatch)
+                          (padrão: 'python')
+            feature_engine: Implementação do cálculo de features: 'python'
+                            ou 'vectorized' (padrão: 'python')
+            label_horizons: Horizontes das labels em horas, ex: [1, 6, 24]
+                            (padrão: [prediction_horizon])
+            state_table: Tabela DynamoDB com o estado das máquinas entre execuções
+            state_file: Arquivo JSON local usado como estado quando não há tabela
+                        (sem nenhum dos dois, cada execução começa sem estado)
+            chunk_size: Com valor, processa a janela em blocos de chunk_size
+                        eventos (modo chunked); sem valor, em memória
+            max_windows_in_memory: No modo chunked, janelas mantidas em memória
+                                   antes do spill para o disco
+            spill_dir: Diretório do arquivo de spill do modo chunked
+            window_scheduler: AdaptiveWindowScheduler que escolhe o tamanho de
+                              cada janela pelo volume estimado (sem ele, usa
+                              time_window)
+            write_feature_store: Se False, não grava na Feature Store do
+                                 DynamoDB (atualizada pelo modo streaming,
+                                 ver streaming_features); as features
+                                 continuam indo para o S3
+            watermark: EventTimeWatermark que substitui o processing_lag: as
+                       janelas de tempo de evento são processadas assim que o
+                       watermark passa, as labels são adiadas até o horizonte
+                       e leituras atrasadas recalculam só as máquinas afetadas
         """
         self.bucket_name = bucket_name
         self.features_table = features_table
@@ -45,36 +115,89 @@ class FeaturePipeline:
         self.ssm_param_name = ssm_param_name
         self.time_window = time_window
         self.prediction_horizon = prediction_horizon
+        self.label_horizons = sorted(label_horizons or [prediction_horizon])
         self.processing_lag = processing_lag
+        self.merge_engine = merge_engine
+        self.feature_engine = feature_engine
+        self.state_store = build_state_store(state_table, state_file)
+        self.chunk_size = chunk_size
+        self.max_windows_in_memory = max_windows_in_memory
+        self.spill_dir = spill_dir
+        self.window_scheduler = window_scheduler
+        self.write_feature_store = write_feature_store
+        self.watermark = watermark
 
         # Inicializa atributos que serão definidos durante a execução
         self.sensor_events = None
+        self.grouped_data = None
         self.failure_events = None
+        self.input_states = None
+        self.machine_states = None
         self.final_features = None
+        # Maior RSS da última janela, medido após o merge e após a carga
+        # (ver AdaptiveWindowScheduler.observe)
+        self.window_memory_mb = None
         self.labeling_start = None
         self.labeling_end = None
         self.features_start = None
         self.features_end = None
+        # Modo watermark: partições de ingestão lidas e watermark atual
+        self.read_from = None
+        self.read_through = None
+        self.lateness = timedelta(0)
+        self.watermark_time = None
 
+    @timed("CalculateWindows")
     def _calculate_windows(self):
         """Calcula e define as janelas de tempo para a execução atual."""
-        last_processed_str = get_ssm_parameter(self.ssm_param_name)
-        last_processed_ts = datetime.fromisoformat(last_processed_str).replace(
-            tzinfo=timezone.utc
+        last_processed_ts, read_through = parse_checkpoint_value(
+            get_ssm_parameter(self.ssm_param_name)
         )
-
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.processing_lag)
+        cutoff = self._cutoff(last_processed_ts, read_through)
 
         if last_processed_ts >= cutoff:
             print("Pipeline já está em dia. Nenhum dado novo para processar.")
             return None  # Sinaliza que não há nada a fazer
 
-        self.features_start = last_processed_ts
-        self.features_end = min(
-            self.features_start + timedelta(hours=self.time_window), cutoff
+        self._set_windows(last_processed_ts, self._window_end(last_processed_ts, cutoff))
+        if self.watermark is not None:
+            self._set_read_range(read_through)
+        return True  # Sinaliza para continuar
+
+    def _cutoff(self, checkpoint: datetime, read_through: datetime = None) -> datetime:
+        """Fim da última janela processável: pelo watermark ou pelo processing_lag."""
+        now = datetime.now(timezone.utc)
+        if self.watermark is None:
+            return now - timedelta(hours=self.processing_lag)
+        state = self.watermark.advance(read_through or checkpoint, now)
+        self.lateness = state["lateness"]
+        self.watermark_time = state["watermark"]
+        print(
+            f"Watermark: {self.watermark_time.isoformat()} (partições seladas até "
+            f"{state['sealed_end'].isoformat()}, atraso de {self.lateness})."
         )
-        self.labeling_start = self.features_end
-        self.labeling_end = self.features_end + timedelta(hours=self.prediction_horizon)
+        return state["cutoff"]
+
+    def _set_read_range(self, read_through: datetime = None):
+        """
+        Define as partições de ingestão lidas pela janela: até o fim da janela
+        mais o atraso permitido, sem recuar em relação à janela anterior.
+        As partições em [read_from, read_through) ainda não foram lidas.
+        """
+        self.read_from = read_through or self.features_start
+        self.read_through = max(self.read_from, ceil_hour(self.features_end + self.lateness))
+
+    def _window_end(self, window_start: datetime, cutoff: datetime) -> datetime:
+        """Fim da janela iniciada em window_start: fixo (time_window) ou adaptativo."""
+        if self.window_scheduler is not None:
+            return self.window_scheduler.choose_window_end(self.bucket_name, window_start, cutoff)
+        return min(window_start + timedelta(hours=self.time_window), cutoff)
+
+    def _set_windows(self, features_start: datetime, features_end: datetime):
+        """Define a janela de features e a janela de labels correspondente."""
+        self.features_start = features_start
+        self.features_end = features_end
+        self.labeling_start, self.labeling_end = self._labeling_window(features_start, features_end)
 
         print(
             f"Janela de features: {self.features_start.isoformat()} a {self.features_end.isoformat()}"
@@ -82,55 +205,667 @@ class FeaturePipeline:
         print(
             f"Janela de labels: {self.labeling_start.isoformat()} a {self.labeling_end.isoformat()}"
         )
-        return True  # Sinaliza para continuar
 
+    def _labeling_window(self, features_start: datetime, features_end: datetime):
+        """Janela de labels de uma janela de features."""
+        # Cada linha é rotulada com falhas em (timestamp_janela, timestamp_janela + h]
+        return features_start, features_end + timedelta(hours=max(self.label_horizons))
+
+    @timed("Extract")
     def _extract(self):
-        """Etapa de extração de dados."""
-        self.sensor_events = fetch_sensor_data(
-            self.bucket_name, self.features_start, self.features_end
+        """
+        Etapa de extração de dados. Os eventos de sensores são lidos como um
+        gerador concorrente e só são consumidos pelo merge (_merge),
+        sem materializar a janela inteira em memória.
+        """
+        self.sensor_events = self._read_sensor_events(
+            self.features_start, self.features_end, self.read_through
         )
-        self.failure_events = fetch_failure_labels_from_dynamo(
+        # No modo watermark, as labels são calculadas depois (_publish_labeled_windows)
+        self.failure_events = [] if self.watermark is not None else fetch_failure_labels_from_dynamo(
             self.failures_table, self.labeling_start, self.labeling_end
         )
 
+    @timed("Merge")
+    def _merge(self):
+        """Agrupa os eventos de sensores em janelas de tempo por máquina."""
+        self.grouped_data = self._merge_events(self.sensor_events)
+        # Pico do merge: eventos lidos e dados agrupados em memória ao mesmo tempo
+        self.window_memory_mb = current_memory_mb()
+        self.sensor_events = None
+
+    def _read_sensor_events(
+        self, features_start: datetime, features_end: datetime, read_through: datetime = None
+    ):
+        """
+        Lê os eventos de sensores da janela: um EventBatch para o merge
+        colunar em memória, ou um gerador, consumido pelo merge.
+
+        Com read_through (modo watermark), lê as partições de ingestão até
+        read_through e mantém só os eventos com timestamp na janela.
+        """
+        columnar = self.merge_engine == MERGE_ENGINE_COLUMNAR and not self.chunk_size
+        if read_through is None:
+            if columnar:
+                return fetch_sensor_batch(self.bucket_name, features_start, features_end)
+            return iter_sensor_events(self.bucket_name, features_start, features_end)
+
+        events = filter_events_by_event_time(
+            iter_sensor_events(
+                self.bucket_name,
+                features_start,
+                read_through,
+                event_time_range=(features_start, features_end),
+            ),
+            features_start,
+            features_end,
+        )
+        return EventBatch.from_events(events) if columnar else events
+
+    def _merge_events(self, sensor_events):
+        """Faz o merge em memória ou, no modo chunked, bloco a bloco (WindowStore)."""
+        if self.chunk_size:
+            return merge_events_chunked(
+                sensor_events,
+                self.merge_engine,
+                self.chunk_size,
+                self.max_windows_in_memory,
+                self.spill_dir,
+            )
+        return merge_events(sensor_events, self.merge_engine)
+
+    def _compute_features(self, grouped_data, machine_states: dict) -> dict:
+        """Calcula as features das janelas agrupadas, atualizando machine_states."""
+        if isinstance(grouped_data, WindowStore):
+            return compute_features_chunked(
+                grouped_data, machine_states, self.feature_engine, self.chunk_size
+            )
+        return compute_features(grouped_data, machine_states, self.feature_engine)
+
+    def _window_machine_ids(self):
+        """Retorna os machine_ids presentes nas janelas agrupadas."""
+        return window_machine_ids(self.grouped_data)
+
+    def _load_machine_states(self):
+        """Carrega em lote o estado das máquinas presentes na janela."""
+        if self.state_store is None:
+            self.input_states = {}
+            return
+        self.input_states = self.state_store.load(
+            self._window_machine_ids(), self.features_start
+        )
+
+    @timed("Transform")
     def _transform(self):
         """Etapa de transformação e cálculo de features."""
-        grouped_data = merge_sensor_events(self.sensor_events)
-        # Estado anterior pode ser aprimorado
-        features_no_label = calculate_features(grouped_data, {})
+        self._load_machine_states()
+        # O cálculo de features atualiza o dicionário de estados recebido
+        self.machine_states = copy.deepcopy(self.input_states)
+        features_no_label = self._compute_features(self.grouped_data, self.machine_states)
+        if self.watermark is not None:
+            self.final_features = features_no_label
+            return
         self.final_features = add_predictive_label(
-            features_no_label, self.failure_events, self.prediction_horizon
+            features_no_label, self.failure_events, self.label_horizons
         )
 
+    @timed("Load")
     def _load(self):
         """Etapa de carregamento dos dados para S3 e DynamoDB."""
         if not self.final_features:
             print("Nenhuma feature calculada.")
             return
+        self._write_features(
+            self.final_features, self.input_states, self.machine_states, self.features_start
+        )
 
-        features_df = pd.DataFrame(self.final_features.values())
-        save_features_to_s3(features_df, self.bucket_name)
-        save_features_to_dynamodb(self.final_features, self.features_table)
+    def _write_features(self, final_features, input_states, machine_states, features_start=None):
+        """
+        Grava as features no S3 e no DynamoDB e registra o hash gravado no estado.
+        O arquivo no S3 tem chave pelo início da janela, a mesma do backfill:
+        retentativas e reprocessamentos da janela sobrescrevem o arquivo.
+        No modo watermark, as features vão sem labels para PENDING_LABELS_PREFIX.
+        Com FEATURE_HISTORY_ENABLED, um snapshot sem labels também vai para o
+        histórico de features.
+        """
+        features_df = pd.DataFrame(final_features.values())
+        if self.watermark is not None:
+            save_features_to_s3(
+                features_df, self.bucket_name, partition_time=features_start, prefix=PENDING_LABELS_PREFIX
+            )
+        else:
+            save_features_to_s3(features_df, self.bucket_name, partition_time=features_start)
+        if FEATURE_HISTORY_ENABLED:
+            append_feature_history(features_df, self.bucket_name)
+        if not self.write_feature_store:
+            return
+
+        # Só regrava no DynamoDB as máquinas cujas features mudaram desde a última gravação
+        previous_hashes = {
+            machine_id: state.get("features_hash")
+            for machine_id, state in (input_states or {}).items()
+        }
+        write_stats = save_features_to_dynamodb(
+            final_features, self.features_table, previous_hashes
+        )
+        for machine_id, features_hash in write_stats["hashes"].items():
+            if machine_id in machine_states:
+                machine_states[machine_id]["features_hash"] = features_hash
 
-    def _update_state(self):
+    @timed("SaveMachineStates")
+    def _save_machine_states(self):
+        """
+        Grava em lote o estado das máquinas após a janela. Deve ocorrer depois
+        do _load e antes de _update_state: se a execução falhar entre os dois,
+        a nova tentativa usa o estado anterior gravado junto (ver state_store).
+        """
+        if self.state_store is None or not self.machine_states:
+            return
+        self.state_store.save(
+            self.machine_states, self.input_states, self.features_start, self.features_end
+        )
+
+    @timed("UpdateState")
+    def _update_state(self, features_end: datetime = None):
         """Atualiza o parâmetro no SSM para a próxima execução."""
-        print(f"Atualizando estado para: {self.features_end.isoformat()}")
-        update_ssm_parameter(self.ssm_param_name, self.features_end.isoformat())
+        features_end = features_end or self.features_end
+        print(f"Atualizando estado para: {features_end.isoformat()}")
+        read_through = self.read_through if self.watermark is not None else None
+        update_ssm_parameter(self.ssm_param_name, format_checkpoint_value(features_end, read_through))
+
+    @timed("Recompute")
+    def _recompute_late_arrivals(self):
+        """
+        Recalcula as máquinas com leituras atrasadas: leituras anteriores ao
+        início da janela que chegaram nas partições ainda não lidas
+        [read_from, read_through), segundo os manifestos de compactação.
+
+        As máquinas afetadas são reprocessadas a partir de warmup_hours antes
+        da primeira hora atrasada, com as leituras atrasadas incluídas, partindo
+        do estado guardado válido nesse início (se houver; senão, só o
+        aquecimento, como no backfill). São regravadas as linhas dessas
+        máquinas nas janelas ainda sem labels e o estado delas no início da
+        janela atual, com o estado anterior ao recálculo como estado anterior.
+        Janelas já publicadas com labels não são alteradas.
+        """
+        late = self.watermark.late_arrivals(self.read_from, self.read_through, self.features_start)
+        if not late:
+            return
+        machine_ids = set().union(*late.values())
+        earliest = min(late)
+        increment("LateMachineHours", sum(len(machines) for machines in late.values()))
+        print(
+            f"Leituras atrasadas de {len(machine_ids)} máquina(s) desde {earliest.isoformat()}. "
+            "Recalculando."
+        )
+
+        pending = list_feature_files(self.bucket_name, PENDING_LABELS_PREFIX)
+        window_ends = [start for start, _ in pending[1:]] + [self.features_start]
+        affected = [
+            (start, end, key)
+            for (start, key), end in zip(pending, window_ends)
+            if end > earliest and start < self.features_start
+        ]
+        if not pending or earliest < pending[0][0]:
+            increment("LateHoursAlreadyLabeled", sum(
+                1 for hour in late if not pending or hour < pending[0][0]
+            ))
+            print("[AVISO] Parte das leituras atrasadas pertence a janelas já publicadas com labels.")
+
+        replay_start = floor_hour(min([earliest] + [start for start, _, _ in affected])) - timedelta(
+            hours=self.watermark.warmup_hours
+        )
+        events = (
+            event
+            for event in filter_events_by_event_time(
+                iter_sensor_events(
+                    self.bucket_name,
+                    replay_start,
+                    self.read_through,
+                    machine_ids=machine_ids,
+                    event_time_range=(replay_start, self.features_start),
+                ),
+                replay_start,
+                self.features_start,
+            )
+            if event.get("machine_id") in machine_ids
+        )
+        windows = sorted(
+            merge_events(events, MERGE_ENGINE_PYTHON).values(),
+            key=lambda window: window["timestamp_janela"],
+        )
+
+        # Segmento 0: aquecimento; segmento i: janela pendente affected[i - 1]
+        boundaries = [start.isoformat() for start, _, _ in affected]
+        segments = [[] for _ in range(len(boundaries) + 1)]
+        for window in windows:
+            segments[bisect.bisect_right(boundaries, window["timestamp_janela"])].append(window)
+
+        states, previous_states = {}, {}
+        if self.state_store is not None:
+            states = self.state_store.load(machine_ids, replay_start)
+            previous_states = self.state_store.load(machine_ids, self.features_start)
+        for index, segment in enumerate(segments):
+            grouped = {f"{window['machine_id']}_{window['timestamp_janela']}": window for window in segment}
+            features = compute_features(grouped, states, self.feature_engine) if grouped else {}
+            if index == 0 or not features:
+                continue
+            start, _, key = affected[index - 1]
+            rows = read_features_from_s3(self.bucket_name, key)
+            rows.update(features)
+            save_features_to_s3(
+                pd.DataFrame(rows.values()),
+                self.bucket_name,
+                partition_time=start,
+                prefix=PENDING_LABELS_PREFIX,
+            )
+            if FEATURE_HISTORY_ENABLED:
+                append_feature_history(pd.DataFrame(features.values()), self.bucket_name)
+            increment("WindowsRecomputed")
+
+        if self.state_store is not None and states:
+            # O estado recalculado vale para o início da janela atual (e para retentativas dela)
+            self.state_store.save(states, previous_states, self.features_start, self.features_start)
+
+    @timed("Label")
+    def _publish_labeled_windows(self):
+        """
+        Modo watermark: publica em processed/training_data, com labels, as
+        janelas pendentes cujo horizonte de labels já passou do watermark.
+        """
+        if self.watermark is None or self.watermark_time is None:
+            return
+        pending = list_feature_files(self.bucket_name, PENDING_LABELS_PREFIX)
+        if not pending:
+            return
+        checkpoint, _ = parse_checkpoint_value(get_ssm_parameter(self.ssm_param_name))
+        window_ends = [start for start, _ in pending[1:]] + [checkpoint]
+        horizon = timedelta(hours=max(self.label_horizons))
+
+        published = 0
+        for (start, key), end in zip(pending, window_ends):
+            if end + horizon > self.watermark_time:
+                break
+            features = read_features_from_s3(self.bucket_name, key)
+            failure_events = fetch_failure_labels_from_dynamo(
+                self.failures_table, *self._labeling_window(start, end)
+            )
+            labeled = add_predictive_label(features, failure_events, self.label_horizons)
+            save_features_to_s3(pd.DataFrame(labeled.values()), self.bucket_name, partition_time=start)
+            delete_s3_object(self.bucket_name, key)
+            published += 1
+        increment("WindowsLabeled", published)
+        print(f"{published} janela(s) publicadas com labels; {len(pending) - published} pendente(s).")
+
+    def _process_window(self):
+        """Processa a janela definida em _calculate_windows e avança o checkpoint."""
+        self.window_memory_mb = None
+        try:
+            if self.watermark is not None:
+                self._recompute_late_arrivals()
+            self._extract()
+            self._merge()
+            increment("WindowsProcessed")
+            if not self.grouped_data:
+                print(
+                    "Nenhum evento de sensor encontrado na janela. Apenas atualizando o estado."
+                )
+                self._update_state()
+                return "Nenhum evento de sensor para processar."
+
+            self._transform()
+            increment("MachinesProcessed", len(self.final_features))
+            self._load()
+            self._save_machine_states()
+            self._update_state()
+            return "Pipeline executado com sucesso!"
+        finally:
+            self.window_memory_mb = max(self.window_memory_mb or 0.0, current_memory_mb())
+            self._release_window_data()
+
+    def _release_window_data(self):
+        """Libera os dados da janela processada antes da próxima."""
+        close_grouped_data(self.grouped_data)
+        self.grouped_data = None
+        self.failure_events = None
+        self.final_features = None
 
     def run(self):
         """Orquestra a execução do pipeline."""
         if not self._calculate_windows():
+            self._publish_labeled_windows()
+            return "Nenhum dado novo para processar."
+
+        result = self._process_window()
+        self._publish_labeled_windows()
+        return result
+
+    def run_catch_up(
+        self,
+        time_budget_seconds: float = None,
+        max_windows: int = None,
+        memory_budget_mb: float = None,
+    ):
+        """
+        Processa janelas consecutivas em uma única execução até alcançar o
+        cutoff ou esgotar o orçamento. O SSM é atualizado após cada janela,
+        então uma interrupção retoma da última janela concluída.
+
+        Args:
+            time_budget_seconds: Tempo máximo da execução; uma nova janela só é
+                                 iniciada se a mais lenta até agora ainda couber.
+            max_windows: Número máximo de janelas nesta execução.
+            memory_budget_mb: Pico de memória (RSS) a partir do qual não se
+                              inicia uma nova janela.
+        """
+        started = time.monotonic()
+        slowest_window = 0.0
+        processed = 0
+
+        while max_windows is None or processed < max_windows:
+            if not self._calculate_windows():
+                break
+
+            window_started = time.monotonic()
+            self._process_window()
+            processed += 1
+            window_seconds = time.monotonic() - window_started
+            slowest_window = max(slowest_window, window_seconds)
+            if self.window_scheduler is not None:
+                self.window_scheduler.observe(
+                    window_seconds, self.features_start, self.window_memory_mb
+                )
+
+            if self._budget_exhausted(
+                started, slowest_window, processed, time_budget_seconds, memory_budget_mb
+            ):
+                break
+
+        self._publish_labeled_windows()
+        if not processed:
+            return "Nenhum dado novo para processar."
+        return f"Catch-up executado com sucesso: {processed} janela(s) até {self.features_end.isoformat()}."
+
+    def _budget_exhausted(
+        self, started, slowest_window, processed, time_budget_seconds, memory_budget_mb
+    ) -> bool:
+        """Indica se ainda cabe uma nova janela nos orçamentos de tempo e memória."""
+        elapsed = time.monotonic() - started
+        if time_budget_seconds is not None and elapsed + slowest_window > time_budget_seconds:
+            print(f"Orçamento de tempo esgotado após {processed} janela(s) ({elapsed:.1f}s).")
+            return True
+        if memory_budget_mb is not None and peak_memory_mb() > memory_budget_mb:
+            print(f"Orçamento de memória esgotado após {processed} janela(s) ({peak_memory_mb():.0f} MB).")
+            return True
+        return False
+
+    def _pending_windows(self, max_windows: int = None):
+        """
+        Gera as janelas (início, fim) entre o checkpoint do SSM e o cutoff.
+        O gerador é consumido sob demanda pela pré-busca, então o tamanho de
+        cada janela adaptativa é decidido só quando ela vai ser lida.
+        """
+        last_processed_ts, _ = parse_checkpoint_value(get_ssm_parameter(self.ssm_param_name))
+        cutoff = self._cutoff(last_processed_ts)
+
+        window_start = last_processed_ts
+        generated = 0
+        while window_start < cutoff and (max_windows is None or generated < max_windows):
+            window_end = self._window_end(window_start, cutoff)
+            yield window_start, window_end
+            generated += 1
+            window_start = window_end
+
+    @timed("Extract")
+    def _fetch_window(self, features_start: datetime, features_end: datetime) -> dict:
+        """Extrai e agrupa os dados de uma janela (etapa de pré-busca)."""
+        labeling_start, labeling_end = self._labeling_window(features_start, features_end)
+        sensor_events = self._read_sensor_events(features_start, features_end)
+        grouped_data = self._merge_events(sensor_events)
+        # Pico do merge, antes de os eventos lidos serem liberados
+        merge_memory_mb = current_memory_mb()
+        return {
+            "features_start": features_start,
+            "features_end": features_end,
+            "grouped_data": grouped_data,
+            "merge_memory_mb": merge_memory_mb,
+            "failure_events": fetch_failure_labels_from_dynamo(
+                self.failures_table, labeling_start, labeling_end
+            ),
+        }
+
+    @timed("Transform")
+    def _transform_window(self, window: dict, carried_states: dict):
+        """
+        Calcula as features de uma janela pré-buscada. O estado de entrada vem
+        das janelas anteriores desta execução (carried_states), ainda que a
+        gravação delas esteja em andamento, ou do repositório de estado.
+        """
+        machine_ids = window_machine_ids(window["grouped_data"])
+        input_states = {
+            machine_id: carried_states[machine_id]
+            for machine_id in machine_ids
+            if machine_id in carried_states
+        }
+        missing = [machine_id for machine_id in machine_ids if machine_id not in carried_states]
+        if self.state_store is not None and missing:
+            input_states.update(self.state_store.load(missing, window["features_start"]))
+
+        machine_states = copy.deepcopy(input_states)
+        features_no_label = self._compute_features(window["grouped_data"], machine_states)
+        window["final_features"] = add_predictive_label(
+            features_no_label, window["failure_events"], self.label_horizons
+        )
+        # O hash é registrado aqui, e não após a gravação, para que a próxima
+        # janela não dependa da gravação em segundo plano desta
+        if self.write_feature_store:
+            for machine_id, features in window["final_features"].items():
+                machine_states[machine_id]["features_hash"] = feature_content_hash(features)
+        increment("MachinesProcessed", len(window["final_features"]))
+        window["input_states"] = input_states
+        window["machine_states"] = machine_states
+        close_grouped_data(window["grouped_data"])
+        window["grouped_data"] = None
+        window["failure_events"] = None
+        carried_states.update(copy.deepcopy(machine_states))
+
+    @timed("Load")
+    def _flush_window(self, window: dict, load_failed: threading.Event):
+        """
+        Grava as saídas de uma janela e avança o checkpoint (etapa de carga).
+        Executada em ordem por uma única thread; após uma falha, as janelas
+        seguintes não são gravadas, e o SSM fica na última janela concluída.
+        """
+        if load_failed.is_set():
+            return
+        try:
+            if window["final_features"]:
+                self._write_features(
+                    window["final_features"],
+                    window["input_states"],
+                    window["machine_states"],
+                    window["features_start"],
+                )
+                if self.state_store is not None:
+                    self.state_store.save(
+                        window["machine_states"],
+                        window["input_states"],
+                        window["features_start"],
+                        window["features_end"],
+                    )
+            else:
+                print("Nenhum evento de sensor encontrado na janela. Apenas atualizando o estado.")
+            self._update_state(window["features_end"])
+        except Exception:
+            load_failed.set()
+            raise
+
+    def run_pipelined(
+        self,
+        time_budget_seconds: float = None,
+        max_windows: int = None,
+        memory_budget_mb: float = None,
+        queue_depth: int = 1,
+    ):
+        """
+        Catch-up com as etapas sobrepostas: enquanto uma janela é transformada,
+        as próximas são pré-buscadas (S3 e DynamoDB) e as anteriores são
+        gravadas em segundo plano. As filas de pré-busca e de carga têm no
+        máximo queue_depth janelas cada, limitando a memória a
+        2 * queue_depth + 1 janelas.
+
+        Os orçamentos têm o mesmo significado de run_catch_up. O checkpoint do
+        SSM é atualizado em ordem, após a gravação de cada janela.
+        Não suporta o modo watermark (use run_catch_up).
+        """
+        if self.watermark is not None:
+            raise ValueError("O catch-up em pipeline não suporta o modo watermark.")
+        windows = self._pending_windows(max_windows)
+        first_window = next(windows, None)
+        if first_window is None:
+            print("Pipeline já está em dia. Nenhum dado novo para processar.")
             return "Nenhum dado novo para processar."
+        print(
+            f"Catch-up em pipeline a partir de {first_window[0].isoformat()} "
+            f"(profundidade {queue_depth})."
+        )
+
+        started = time.monotonic()
+        slowest_window = 0.0
+        processed = 0
+        carried_states = {}
+        load_failed = threading.Event()
+        prefetched = deque()
+        pending_loads = deque()
+
+        with ThreadPoolExecutor(max_workers=queue_depth) as prefetcher, ThreadPoolExecutor(
+            max_workers=1
+        ) as loader:
+            next_window = itertools.chain([first_window], windows)
+
+            def prefetch_next():
+                window_bounds = next(next_window, None)
+                if window_bounds is not None:
+                    prefetched.append(prefetcher.submit(self._fetch_window, *window_bounds))
+
+            for _ in range(queue_depth):
+                prefetch_next()
+
+            try:
+                while prefetched and not load_failed.is_set():
+                    window_started = time.monotonic()
+                    window = prefetched.popleft().result()
+                    prefetch_next()
+
+                    if window["grouped_data"]:
+                        self._transform_window(window, carried_states)
+                    else:
+                        window["final_features"] = None
+                    window_memory_mb = max(window["merge_memory_mb"], current_memory_mb())
+
+                    # Fila de carga limitada: espera a gravação mais antiga
+                    while len(pending_loads) >= queue_depth:
+                        pending_loads.popleft().result()
+                    pending_loads.append(loader.submit(self._flush_window, window, load_failed))
 
+                    processed += 1
+                    increment("WindowsProcessed")
+                    window_seconds = time.monotonic() - window_started
+                    slowest_window = max(slowest_window, window_seconds)
+                    if self.window_scheduler is not None:
+                        self.window_scheduler.observe(
+                            window_seconds, window["features_start"], window_memory_mb
+                        )
+                    if self._budget_exhausted(
+                        started, slowest_window, processed, time_budget_seconds, memory_budget_mb
+                    ):
+                        break
+            finally:
+                for future in prefetched:
+                    future.cancel()
+
+            while pending_loads:
+                pending_loads.popleft().result()
+
+        self.features_end = window["features_end"]
+        return f"Catch-up executado com sucesso: {processed} janela(s) até {self.features_end.isoformat()}."
+
+    def run_backfill_window(self, window_start: datetime, window_end: datetime, warmup_hours: int = 24):
+        """
+        Processa uma janela histórica de forma isolada (backfill), sem ler ou
+        gravar o checkpoint do SSM, o estado das máquinas ou a Feature Store.
+
+        O estado das features é reconstruído lendo também as warmup_hours
+        anteriores à janela, e o arquivo no S3 tem chave determinística pelo
+        início da janela, a mesma das execuções regulares: reprocessar a mesma
+        janela sobrescreve o resultado. Janelas em que outra execução já gravou
+        um arquivo iniciado depois de window_start (ex: janelas adaptativas de
+        outro tamanho) são ignoradas, para não duplicar linhas.
+        """
+        existing = self._window_output_keys(window_start, window_end)
+        if existing:
+            return (
+                f"Janela {window_start.isoformat()} ignorada: já possui {len(existing)} "
+                "arquivo(s) de features de outra execução."
+            )
+        self._set_windows(window_start - timedelta(hours=warmup_hours), window_end)
         self._extract()
-        if not self.sensor_events:
-            print(
-                "Nenhum evento de sensor encontrado na janela. Apenas atualizando o estado."
+        self._merge()
+        if not self.grouped_data:
+            return f"Janela {window_start.isoformat()} sem eventos de sensor."
+
+        self.input_states = {}
+        self.machine_states = {}
+        features_no_label = self._compute_features(self.grouped_data, self.machine_states)
+        # Só as janelas agrupadas são liberadas aqui: as falhas ainda são usadas nas labels
+        close_grouped_data(self.grouped_data)
+        self.grouped_data = None
+        # Máquinas cuja última leitura ficou no aquecimento não pertencem à janela
+        window_start_str = window_start.isoformat()
+        features_in_window = {
+            machine_id: features
+            for machine_id, features in features_no_label.items()
+            if features["timestamp_janela"] >= window_start_str
+        }
+        self.final_features = add_predictive_label(
+            features_in_window, self.failure_events, self.label_horizons
+        )
+        if self.final_features:
+            features_df = pd.DataFrame(self.final_features.values())
+            save_features_to_s3(features_df, self.bucket_name, partition_time=window_start)
+            if FEATURE_HISTORY_ENABLED:
+                append_feature_history(features_df, self.bucket_name)
+        machines = len(self.final_features)
+        self._release_window_data()
+        return f"Janela {window_start.isoformat()}: {machines} máquinas."
+
+    def _window_output_keys(self, window_start: datetime, window_end: datetime) -> list:
+        """
+        Arquivos de features de processed/training_data iniciados em
+        (window_start, window_end). O arquivo iniciado em window_start é o da
+        própria janela e é sobrescrito.
+        """
+        keys = []
+        day = window_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < window_end:
+            day_prefix = build_day_prefix(PROCESSED_PREFIX, day).rstrip("/")
+            keys.extend(
+                key
+                for start, key in list_feature_files(self.bucket_name, day_prefix)
+                if window_start < start < window_end
             )
-            self._update_state()
-            return "Nenhum evento de sensor para processar."
+            day += timedelta(days=1)
+        return keys
+
+
+def window_machine_ids(grouped_data) -> list:
+    """Retorna os machine_ids presentes nas janelas agrupadas."""
+    if isinstance(grouped_data, (WindowBatch, WindowStore)):
+        return sorted(grouped_data.machine_ids)
+    return sorted({window["machine_id"] for window in grouped_data.values()})
+
 
-        self._transform()
-        self._load()
-        self._update_state()
-        return "Pipeline executado com sucesso!"
+def close_grouped_data(grouped_data) -> None:
+    """Libera o arquivo de spill das janelas agrupadas no modo chunked."""
+    if isinstance(grouped_data, WindowStore):
+        grouped_data.close()
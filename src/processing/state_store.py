@@ -0,0 +1,163 @@
+"""
+Módulo de persistência do estado das máquinas entre execuções.
+Guarda o estado usado por calculate_features (EMA de vibração, máxima de
+temperatura em 24h) para que cada execução processe apenas a sua janela.
+
+Cada item guarda o estado após a janela (checkpoint = fim da janela) e o
+estado anterior (previous_checkpoint = início da janela). Se uma execução
+gravar o estado mas falhar antes de atualizar o checkpoint no SSM, a nova
+tentativa da mesma janela recebe o estado anterior, e o reprocessamento não
+aplica a janela duas vezes.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from data_access import batch_get_items, batch_put_items
+
+
+def _parse_checkpoint(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def select_state_for_window(item: Dict, window_start: datetime) -> Dict:
+    """
+    Escolhe, dentre o estado atual e o anterior de um item, aquele que
+    corresponde ao início da janela a ser processada.
+
+    Args:
+        item: Item persistido (checkpoint, state, previous_checkpoint, previous_state).
+        window_start: Início da janela que será processada.
+
+    Returns:
+        O estado da máquina a ser usado como entrada, ou {} se nenhum é válido.
+    """
+    checkpoint = _parse_checkpoint(item.get("checkpoint"))
+    if checkpoint is not None and checkpoint <= window_start:
+        return json.loads(item["state"])
+
+    previous_checkpoint = _parse_checkpoint(item.get("previous_checkpoint"))
+    if previous_checkpoint is not None and previous_checkpoint <= window_start:
+        print(
+            f"Estado de {item['machine_id']} já inclui a janela iniciada em "
+            f"{window_start.isoformat()}. Usando o estado anterior."
+        )
+        return json.loads(item["previous_state"]) if item.get("previous_state") else {}
+
+    print(
+        f"[AVISO] Estado de {item['machine_id']} é posterior à janela "
+        f"{window_start.isoformat()}. Iniciando sem estado."
+    )
+    return {}
+
+
+def latest_state(item: Dict) -> Tuple[Optional[datetime], Dict]:
+    """Estado mais recente de um item persistido e o instante (checkpoint) a que corresponde."""
+    return _parse_checkpoint(item.get("checkpoint")), json.loads(item["state"])
+
+
+def build_state_items(
+    new_states: Dict, previous_states: Dict, window_start: datetime, window_end: datetime
+) -> list:
+    """Monta os itens persistidos a partir dos estados de entrada e de saída da janela."""
+    return [
+        {
+            "machine_id": machine_id,
+            "checkpoint": window_end.isoformat(),
+            "state": json.dumps(state),
+            "previous_checkpoint": window_start.isoformat(),
+            "previous_state": json.dumps(previous_states.get(machine_id, {})),
+        }
+        for machine_id, state in new_states.items()
+    ]
+
+
+class DynamoDBStateStore:
+    """Estado das máquinas em uma tabela DynamoDB (chave: machine_id)."""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def load(self, machine_ids: Iterable[str], window_start: datetime) -> Dict:
+        """Carrega em lote (BatchGetItem) o estado das máquinas para a janela."""
+        items = batch_get_items(self.table_name, "machine_id", list(machine_ids))
+        print(f"Estado carregado para {len(items)} máquinas da tabela {self.table_name}.")
+        return {
+            item["machine_id"]: select_state_for_window(item, window_start)
+            for item in items
+        }
+
+    def load_latest(self, machine_ids: Iterable[str]) -> Dict[str, Tuple[Optional[datetime], Dict]]:
+        """Carrega em lote o estado mais recente das máquinas com o seu checkpoint."""
+        items = batch_get_items(self.table_name, "machine_id", list(machine_ids))
+        return {item["machine_id"]: latest_state(item) for item in items}
+
+    def save(
+        self, new_states: Dict, previous_states: Dict, window_start: datetime, window_end: datetime
+    ) -> None:
+        """Grava em lote (BatchWriteItem) o estado das máquinas após a janela."""
+        items = build_state_items(new_states, previous_states, window_start, window_end)
+        batch_put_items(self.table_name, items)
+        print(f"Estado salvo para {len(items)} máquinas na tabela {self.table_name}.")
+
+
+class LocalFileStateStore:
+    """Estado das máquinas em um arquivo JSON local (uso em testes e execução local)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read_all(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def load(self, machine_ids: Iterable[str], window_start: datetime) -> Dict:
+        """Carrega o estado das máquinas para a janela."""
+        items = self._read_all()
+        return {
+            machine_id: select_state_for_window(items[machine_id], window_start)
+            for machine_id in machine_ids
+            if machine_id in items
+        }
+
+    def load_latest(self, machine_ids: Iterable[str]) -> Dict[str, Tuple[Optional[datetime], Dict]]:
+        """Carrega o estado mais recente das máquinas com o seu checkpoint."""
+        items = self._read_all()
+        return {
+            machine_id: latest_state(items[machine_id])
+            for machine_id in machine_ids
+            if machine_id in items
+        }
+
+    def save(
+        self, new_states: Dict, previous_states: Dict, window_start: datetime, window_end: datetime
+    ) -> None:
+        """Grava o estado das máquinas após a janela."""
+        items = self._read_all()
+        for item in build_state_items(new_states, previous_states, window_start, window_end):
+            items[item["machine_id"]] = item
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(items, f)
+        os.replace(tmp_path, self.path)
+
+
+def build_state_store(table_name: Optional[str] = None, file_path: Optional[str] = None):
+    """
+    Cria o repositório de estado configurado: tabela DynamoDB, arquivo local
+    ou nenhum (execução sem estado, comportamento original).
+    """
+    if table_name:
+        return DynamoDBStateStore(table_name)
+    if file_path:
+        return LocalFileStateStore(file_path)
+    return None
@@ -0,0 +1,311 @@
+"""
+Módulo de atualização das features em tempo quase real (modo streaming).
+Consome a mesma telemetria da ingestão (regra do IoT Core, ou lotes SQS/Kinesis)
+e atualiza vib_media_5h e temp_max_24h de cada máquina na Feature Store a cada
+mensagem, sem esperar o processing_lag do pipeline em lote.
+
+O cálculo reutiliza feature_engineering.calculate_features. O estado de cada
+máquina fica no próprio item da Feature Store (stream_state): o estado após as
+janelas de minuto já encerradas e a janela aberta (o minuto mais recente), que
+ainda pode receber leituras. Uma leitura do minuto aberto recalcula a janela a
+partir do estado anterior a ela, então, com dados em ordem, as features são as
+mesmas do pipeline em lote. Janelas anteriores à aberta (dados atrasados) são
+ignoradas; reprocessar uma mensagem não altera o resultado.
+
+Cada máquina é gravada com UpdateItem condicional à versão lida
+(stream_version): se outra invocação gravou antes, o item é relido e a
+atualização recalculada. O pipeline em lote continua sendo a fonte dos dados
+de treino rotulados no S3; com FEATURE_STORE_SOURCE=stream ele deixa de gravar
+na Feature Store.
+
+No primeiro uso de uma máquina, o estado parte do pipeline em lote, que fica
+cerca de processing_lag atrás. As leituras da máquina entre o checkpoint desse
+estado e agora são relidas do data lake (DATA_LAKE_BUCKET) e aplicadas antes
+das novas, para que o estado inicial não pule esse intervalo.
+"""
+
+import base64
+import copy
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+import metrics
+from chunked_processing import WINDOW_FIELDS
+from data_access import dynamodb_resource, iter_sensor_events, to_dynamodb_value
+from data_processing import merge_sensor_events
+from feature_engineering import VIB_EMA_ALPHA, calculate_features
+from state_store import build_state_store
+from watermark import filter_events_by_event_time
+
+# Tentativas de gravação condicional por máquina antes de desistir
+STREAM_MAX_ATTEMPTS = int(os.getenv("STREAM_MAX_ATTEMPTS", 5))
+FEATURE_SOURCE_STREAM = "stream"
+
+
+def extract_stream_events(event) -> List[Dict]:
+    """
+    Extrai a telemetria de um evento do IoT Core, de uma lista de eventos ou
+    de um lote com 'Records' (SQS com body em JSON ou Kinesis em base64).
+    """
+    if isinstance(event, list):
+        return [item for item in event if isinstance(item, dict)]
+    if "Records" not in event:
+        return [event]
+
+    events = []
+    for record in event["Records"]:
+        if "kinesis" in record:
+            raw = base64.b64decode(record["kinesis"]["data"]).decode("utf-8")
+        else:
+            raw = record["body"]
+        events.append(json.loads(raw))
+    return events
+
+
+def group_windows_by_machine(events: List[Dict]) -> Dict[str, List[Dict]]:
+    """Agrupa os eventos em janelas de minuto e as separa por máquina, em ordem cronológica."""
+    windows_by_machine: Dict[str, List[Dict]] = {}
+    for window in merge_sensor_events(events).values():
+        windows_by_machine.setdefault(window["machine_id"], []).append(window)
+    for windows in windows_by_machine.values():
+        windows.sort(key=lambda window: window["timestamp_janela"])
+    return windows_by_machine
+
+
+def advance_stream_state(
+    machine_id: str, stream_state: Dict, windows: List[Dict], alpha: float = VIB_EMA_ALPHA
+) -> Tuple[Optional[Dict], Dict, int]:
+    """
+    Aplica as novas janelas de uma máquina ao seu estado de streaming.
+
+    Args:
+        machine_id: A máquina.
+        stream_state: {"state": estado após as janelas encerradas,
+                       "open_window": janela do minuto mais recente}.
+        windows: Novas janelas da máquina, em ordem cronológica.
+        alpha: Fator de suavização da EMA de vibração.
+
+    Returns:
+        (features da janela mais recente ou None, novo stream_state,
+        número de janelas atrasadas ignoradas).
+    """
+    pending = []
+    if stream_state.get("open_window"):
+        pending.append(dict(stream_state["open_window"]))
+
+    late = 0
+    for window in windows:
+        if pending and window["timestamp_janela"] < pending[-1]["timestamp_janela"]:
+            late += 1
+            continue
+        if pending and window["timestamp_janela"] == pending[-1]["timestamp_janela"]:
+            # Mesma regra do merge: a leitura mais recente de cada campo prevalece
+            for field in WINDOW_FIELDS:
+                if window.get(field) is not None:
+                    pending[-1][field] = window[field]
+            continue
+        pending.append(dict(window))
+
+    if not pending:
+        return None, stream_state, late
+
+    closed, open_window = pending[:-1], pending[-1]
+    states = {machine_id: copy.deepcopy(stream_state.get("state") or {})}
+    if closed:
+        calculate_features(_as_grouped(closed), states, alpha)
+    closed_state = copy.deepcopy(states[machine_id])
+    features = calculate_features(_as_grouped([open_window]), states, alpha)[machine_id]
+    return features, {"state": closed_state, "open_window": open_window}, late
+
+
+def seed_stream_state(
+    machine_id: str, state_store, bucket: Optional[str], now: datetime
+) -> Tuple[Dict, List[Dict]]:
+    """
+    Estado inicial de streaming de uma máquina: o estado mais recente do
+    pipeline em lote e as janelas da máquina entre o checkpoint desse estado
+    e agora, relidas do data lake, a aplicar antes das novas.
+
+    Returns:
+        (stream_state inicial, janelas relidas em ordem cronológica).
+    """
+    checkpoint, state = None, {}
+    if state_store is not None:
+        checkpoint, state = state_store.load_latest([machine_id]).get(machine_id, (None, {}))
+    stream_state = {"state": state, "open_window": None}
+    if checkpoint is None or checkpoint >= now:
+        return stream_state, []
+    if not bucket:
+        print(
+            f"[AVISO] Sem DATA_LAKE_BUCKET: estado de {machine_id} parte de "
+            f"{checkpoint.isoformat()} sem as leituras seguintes."
+        )
+        return stream_state, []
+
+    events = [
+        event
+        for event in filter_events_by_event_time(
+            iter_sensor_events(
+                bucket,
+                checkpoint,
+                now,
+                machine_ids=[machine_id],
+                event_time_range=(checkpoint, now),
+            ),
+            checkpoint,
+            now,
+        )
+        if event.get("machine_id") == machine_id
+    ]
+    metrics.increment("StreamSeedEventsReplayed", len(events))
+    print(
+        f"Estado de {machine_id} iniciado em {checkpoint.isoformat()} com "
+        f"{len(events)} leitura(s) relidas até {now.isoformat()}."
+    )
+    return stream_state, group_windows_by_machine(events).get(machine_id, [])
+
+
+def _as_grouped(windows: List[Dict]) -> Dict:
+    """Converte uma lista de janelas no dicionário retornado por merge_sensor_events."""
+    return {f"{window['machine_id']}_{window['timestamp_janela']}": window for window in windows}
+
+
+def _read_stream_item(table, machine_id: str) -> Tuple[Optional[Dict], Optional[int]]:
+    """Lê (com leitura consistente) o stream_state e a versão do item da máquina."""
+    response = table.get_item(
+        Key={"machine_id": machine_id},
+        ConsistentRead=True,
+        ProjectionExpression="stream_state, stream_version",
+        ReturnConsumedCapacity="TOTAL",
+    )
+    metrics.record_consumed_capacity(response, "DynamoDBReadCapacityUnits")
+    item = response.get("Item")
+    if not item or "stream_state" not in item:
+        return None, None
+    return json.loads(item["stream_state"]), int(item["stream_version"])
+
+
+def _write_stream_item(
+    table, features: Dict, stream_state: Dict, expected_version: Optional[int]
+) -> None:
+    """
+    Grava as features e o stream_state com UpdateItem, condicionado à versão
+    lida. Sem versão (primeiro uso do streaming), exige que o item ainda não
+    tenha stream_version.
+    """
+    values = {key: value for key, value in features.items() if key != "machine_id"}
+    values["feature_source"] = FEATURE_SOURCE_STREAM
+    values["stream_state"] = json.dumps(stream_state)
+    values["stream_version"] = (expected_version or 0) + 1
+
+    names = {f"#f{index}": key for index, key in enumerate(values)}
+    expression_values = {
+        f":v{index}": to_dynamodb_value(value) for index, value in enumerate(values.values())
+    }
+    update_expression = "SET " + ", ".join(f"#f{index} = :v{index}" for index in range(len(values)))
+    if expected_version is None:
+        condition = "attribute_not_exists(stream_version)"
+    else:
+        condition = "stream_version = :expected"
+        expression_values[":expected"] = expected_version
+
+    response = table.update_item(
+        Key={"machine_id": features["machine_id"]},
+        UpdateExpression=update_expression,
+        ConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=expression_values,
+        ReturnConsumedCapacity="TOTAL",
+    )
+    metrics.record_consumed_capacity(response, "DynamoDBWriteCapacityUnits")
+
+
+def update_machine_features(
+    table,
+    machine_id: str,
+    windows: List[Dict],
+    state_store=None,
+    alpha: float = VIB_EMA_ALPHA,
+    bucket: Optional[str] = None,
+) -> Optional[Dict]:
+    """
+    Atualiza as features de uma máquina na Feature Store com as novas janelas,
+    relendo e recalculando quando a gravação condicional perde para outra invocação.
+
+    Args:
+        table: Tabela DynamoDB da Feature Store.
+        machine_id: A máquina.
+        windows: Novas janelas da máquina, em ordem cronológica.
+        state_store: Repositório do estado do pipeline em lote, usado como
+                     estado inicial da máquina no primeiro uso do streaming.
+        alpha: Fator de suavização da EMA de vibração.
+        bucket: Data lake de onde são relidas as leituras posteriores ao
+                estado inicial (ver seed_stream_state).
+
+    Returns:
+        As features gravadas, ou None se todas as janelas estavam atrasadas.
+    """
+    for attempt in range(STREAM_MAX_ATTEMPTS):
+        stream_state, version = _read_stream_item(table, machine_id)
+        pending_windows = windows
+        if stream_state is None:
+            stream_state, replayed = seed_stream_state(
+                machine_id, state_store, bucket, datetime.now(timezone.utc)
+            )
+            # Ordenação estável: no mesmo minuto, as leituras novas prevalecem
+            pending_windows = sorted(
+                replayed + windows, key=lambda window: window["timestamp_janela"]
+            )
+
+        features, new_stream_state, late = advance_stream_state(
+            machine_id, stream_state, pending_windows, alpha
+        )
+        if features is None:
+            metrics.increment("StreamLateWindows", late)
+            return None
+        try:
+            _write_stream_item(table, features, new_stream_state, version)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            metrics.increment("StreamConditionalRetries")
+            print(f"Item de {machine_id} alterado por outra invocação. Recalculando ({attempt + 1}).")
+            continue
+        metrics.increment("StreamLateWindows", late)
+        return features
+
+    raise RuntimeError(
+        f"Features de {machine_id} não gravadas após {STREAM_MAX_ATTEMPTS} tentativas condicionais."
+    )
+
+
+def lambda_handler(event, context):
+    """
+    Ponto de entrada da Lambda de features em streaming. Atualiza as máquinas
+    presentes na telemetria recebida e emite as métricas da invocação (EMF).
+    """
+    metrics.reset()
+    table = dynamodb_resource.Table(os.getenv("DYNAMODB_TABLE_NAME"))
+    state_store = build_state_store(os.getenv("FEATURE_STATE_TABLE"))
+    bucket = os.getenv("DATA_LAKE_BUCKET")
+    status = "error"
+    try:
+        events = extract_stream_events(event)
+        metrics.increment("StreamEventsReceived", len(events))
+        updated = 0
+        for machine_id, windows in group_windows_by_machine(events).items():
+            if update_machine_features(table, machine_id, windows, state_store, bucket=bucket) is not None:
+                updated += 1
+        metrics.increment("StreamMachinesUpdated", updated)
+        status = "success"
+        print(f"Features em streaming atualizadas para {updated} máquina(s) a partir de {len(events)} evento(s).")
+        return {"statusCode": 200, "body": json.dumps({"events": len(events), "machines_updated": updated})}
+    finally:
+        metrics.emit(
+            dimensions={"FunctionName": os.getenv("AWS_LAMBDA_FUNCTION_NAME", "streaming-features")},
+            properties={"Mode": FEATURE_SOURCE_STREAM, "Status": status},
+        )
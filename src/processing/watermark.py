@@ -0,0 +1,262 @@
+"""
+Módulo de watermarks de tempo de evento.
+As partições raw/ são organizadas pela hora de ingestão, não pela hora do
+evento: uma leitura pode chegar em uma partição posterior à do seu
+timestamp_utc. Em vez de esperar um PROCESSING_LAG fixo, o pipeline usa um
+watermark calculado a partir da chegada real dos dados:
+
+- Ao compactar uma hora, o manifesto registra o atraso das leituras
+  (ingestion_timestamp - timestamp_utc: máximo e percentil 99) e, para cada
+  hora de evento anterior à partição, as máquinas com leituras atrasadas
+  (partition_arrival_stats).
+- Uma partição está selada quando tem manifesto (ou, sem compactação, quando
+  é mais antiga que o fallback). O watermark é o fim das partições seladas
+  menos o atraso observado (p99) nas últimas horas: os eventos anteriores a
+  ele já chegaram, exceto os poucos mais atrasados que o percentil.
+- A janela [início, fim) de tempo de evento lê as partições até fim + atraso
+  e descarta os eventos fora da janela.
+- Leituras que chegam depois que sua janela foi processada aparecem nos
+  manifestos das partições seguintes (late_arrivals) e disparam o recálculo
+  apenas das máquinas e horas afetadas (ver FeaturePipeline).
+"""
+
+import json
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+import metrics
+from data_access import get_compaction_manifest
+
+# Atraso assumido quando não há manifestos recentes com estatísticas de chegada
+WATERMARK_DEFAULT_LATENESS_MINUTES = int(os.getenv("WATERMARK_DEFAULT_LATENESS_MINUTES", 60))
+# Limite do atraso considerado no watermark (leituras mais atrasadas viram recálculo)
+WATERMARK_MAX_LATENESS_HOURS = int(os.getenv("WATERMARK_MAX_LATENESS_HOURS", 6))
+# Horas seladas cujos manifestos definem o atraso observado
+WATERMARK_LOOKBACK_HOURS = int(os.getenv("WATERMARK_LOOKBACK_HOURS", 24))
+# Horas reprocessadas antes da primeira leitura atrasada para reconstruir o estado
+WATERMARK_RECOMPUTE_WARMUP_HOURS = int(os.getenv("WATERMARK_RECOMPUTE_WARMUP_HOURS", 24))
+
+# Percentil do atraso das leituras usado no watermark
+LATENESS_PERCENTILE = 0.99
+
+# Prefixo comparável do timestamp de um evento (horário de parede, tratado como UTC)
+WALL_TIME_LENGTH = len("2025-10-15T09:00:00")
+HOUR = timedelta(hours=1)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(value: datetime) -> datetime:
+    floored = floor_hour(value)
+    return floored if floored == value else floored + HOUR
+
+
+def _wall_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def event_wall_time(event: Dict) -> Optional[str]:
+    """
+    Horário do evento como 'AAAA-MM-DDTHH:MM:SS'. Como no merge, o fuso do
+    timestamp é descartado e o horário é tratado como UTC.
+    """
+    timestamp = event.get("timestamp_utc") or event.get("timestamp_registro")
+    return timestamp[:WALL_TIME_LENGTH] if timestamp else None
+
+
+def filter_events_by_event_time(events: Iterable[Dict], start: datetime, end: datetime) -> Iterator[Dict]:
+    """Mantém apenas os eventos com timestamp em [start, end)."""
+    start_str, end_str = _wall_time(start), _wall_time(end)
+    for event in events:
+        wall_time = event_wall_time(event)
+        if wall_time and start_str <= wall_time < end_str:
+            yield event
+
+
+def partition_arrival_stats(events: Iterable[Dict], partition_hour: datetime) -> Dict:
+    """
+    Estatísticas de chegada de uma partição horária de ingestão, gravadas
+    no manifesto de compactação.
+
+    O atraso de cada leitura é ingestion_timestamp - timestamp_utc (sem
+    ingestion_timestamp, usa o fim da partição como limite superior).
+
+    Returns:
+        {"event_time_min", "event_time_max", "max_lateness_seconds",
+         "lateness_p99_seconds",
+         "late_machines": {hora de evento anterior à partição: [machine_ids]}}.
+    """
+    partition_hour = floor_hour(partition_hour)
+    partition_str = _wall_time(partition_hour)
+    partition_end = partition_hour + HOUR
+    event_min = event_max = None
+    latenesses = []
+    late_machines: Dict[str, Set[str]] = {}
+
+    for event in events:
+        wall_time = event_wall_time(event)
+        if not wall_time:
+            continue
+        event_time = datetime.fromisoformat(wall_time).replace(tzinfo=timezone.utc)
+        ingested_at = partition_end
+        if event.get("ingestion_timestamp"):
+            ingested_at = datetime.fromisoformat(
+                event["ingestion_timestamp"][:WALL_TIME_LENGTH]
+            ).replace(tzinfo=timezone.utc)
+        latenesses.append(max(0.0, (ingested_at - event_time).total_seconds()))
+
+        event_min = wall_time if event_min is None else min(event_min, wall_time)
+        event_max = wall_time if event_max is None else max(event_max, wall_time)
+        if wall_time < partition_str and event.get("machine_id"):
+            event_hour = floor_hour(event_time).isoformat()
+            late_machines.setdefault(event_hour, set()).add(event["machine_id"])
+
+    latenesses.sort()
+    percentile_index = min(len(latenesses) - 1, int(len(latenesses) * LATENESS_PERCENTILE))
+    return {
+        "event_time_min": event_min,
+        "event_time_max": event_max,
+        "max_lateness_seconds": latenesses[-1] if latenesses else 0.0,
+        "lateness_p99_seconds": latenesses[percentile_index] if latenesses else 0.0,
+        "late_machines": {hour: sorted(machines) for hour, machines in sorted(late_machines.items())},
+    }
+
+
+def parse_checkpoint_value(value: str) -> Tuple[datetime, Optional[datetime]]:
+    """
+    Lê o valor do parâmetro de checkpoint: um timestamp ISO (modo com lag fixo)
+    ou {"checkpoint", "read_through"} (modo watermark), onde read_through é o
+    fim das partições de ingestão já lidas.
+    """
+    def parse(timestamp: str) -> datetime:
+        return datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
+
+    if value.lstrip().startswith("{"):
+        parsed = json.loads(value)
+        read_through = parsed.get("read_through")
+        return parse(parsed["checkpoint"]), parse(read_through) if read_through else None
+    return parse(value), None
+
+
+def format_checkpoint_value(checkpoint: datetime, read_through: Optional[datetime] = None) -> str:
+    """Inverso de parse_checkpoint_value."""
+    if read_through is None:
+        return checkpoint.isoformat()
+    return json.dumps({"checkpoint": checkpoint.isoformat(), "read_through": read_through.isoformat()})
+
+
+class EventTimeWatermark:
+    """Calcula o watermark e os eventos atrasados a partir dos manifestos de compactação."""
+
+    def __init__(
+        self,
+        bucket: str,
+        default_lateness: timedelta = timedelta(minutes=WATERMARK_DEFAULT_LATENESS_MINUTES),
+        max_lateness: timedelta = timedelta(hours=WATERMARK_MAX_LATENESS_HOURS),
+        lookback_hours: int = WATERMARK_LOOKBACK_HOURS,
+        seal_fallback: timedelta = timedelta(hours=25),
+        warmup_hours: int = WATERMARK_RECOMPUTE_WARMUP_HOURS,
+        manifest_reader: Callable[[str, datetime], Optional[Dict]] = get_compaction_manifest,
+    ):
+        """
+        Args:
+            bucket: Bucket do data lake.
+            default_lateness: Atraso assumido sem estatísticas de chegada.
+            max_lateness: Maior atraso considerado no watermark.
+            lookback_hours: Horas seladas usadas para estimar o atraso.
+            seal_fallback: Idade a partir da qual uma partição sem manifesto
+                           é considerada selada (compactação desativada ou atrasada).
+            warmup_hours: Horas reprocessadas antes da primeira leitura
+                          atrasada no recálculo (ver FeaturePipeline).
+            manifest_reader: Função (bucket, hora) -> manifesto ou None.
+        """
+        self.bucket = bucket
+        self.default_lateness = default_lateness
+        self.max_lateness = max_lateness
+        self.lookback_hours = lookback_hours
+        self.seal_fallback = seal_fallback
+        self.warmup_hours = warmup_hours
+        self.manifest_reader = manifest_reader
+        self._manifests: Dict[datetime, Optional[Dict]] = {}
+
+    def _manifest(self, hour: datetime) -> Optional[Dict]:
+        """Manifesto da hora, em cache durante a invocação (inclusive a ausência)."""
+        if hour not in self._manifests:
+            self._manifests[hour] = self.manifest_reader(self.bucket, hour)
+        return self._manifests[hour]
+
+    def sealed_end(self, read_from: datetime, now: datetime) -> datetime:
+        """Fim das partições contíguas seladas a partir de read_from."""
+        hour = floor_hour(read_from)
+        fallback_end = now - self.seal_fallback
+        while hour + HOUR <= now:
+            if hour + HOUR > fallback_end and self._manifest(hour) is None:
+                break
+            hour += HOUR
+        return hour
+
+    def allowed_lateness(self, sealed_end: datetime) -> timedelta:
+        """Maior atraso (p99) das horas seladas recentes, em minutos inteiros."""
+        observed = [
+            manifest["lateness_p99_seconds"]
+            for offset in range(1, self.lookback_hours + 1)
+            for manifest in [self._manifest(sealed_end - offset * HOUR)]
+            if manifest is not None and "lateness_p99_seconds" in manifest
+        ]
+        if not observed:
+            return min(self.default_lateness, self.max_lateness)
+        lateness = timedelta(minutes=math.ceil(max(observed) / 60))
+        return min(lateness, self.max_lateness)
+
+    def advance(self, read_from: datetime, now: datetime) -> Dict:
+        """
+        Calcula o watermark atual.
+
+        Returns:
+            {"sealed_end", "lateness", "watermark", "cutoff"}: cutoff é o
+            watermark arredondado para baixo até a hora, o fim da última
+            janela que pode ser processada.
+        """
+        sealed_end = self.sealed_end(read_from, now)
+        lateness = self.allowed_lateness(sealed_end)
+        watermark = sealed_end - lateness
+        metrics.append_property(
+            "WatermarkDecisions",
+            {
+                "sealed_end": sealed_end.isoformat(),
+                "lateness_seconds": lateness.total_seconds(),
+                "watermark": watermark.isoformat(),
+            },
+        )
+        return {
+            "sealed_end": sealed_end,
+            "lateness": lateness,
+            "watermark": watermark,
+            "cutoff": floor_hour(watermark),
+        }
+
+    def late_arrivals(
+        self, partitions_start: datetime, partitions_end: datetime, before: datetime
+    ) -> Dict[datetime, Set[str]]:
+        """
+        Máquinas com leituras anteriores a before que chegaram nas partições
+        [partitions_start, partitions_end), por hora de evento.
+        """
+        late: Dict[datetime, Set[str]] = {}
+        hour = floor_hour(partitions_start)
+        while hour < partitions_end:
+            manifest = self._manifest(hour)
+            if manifest is None:
+                print(f"[AVISO] Partição {hour.isoformat()} sem manifesto: atrasos não verificados.")
+                metrics.increment("PartitionsWithoutArrivalStats")
+            else:
+                for event_hour, machine_ids in manifest.get("late_machines", {}).items():
+                    parsed_hour = datetime.fromisoformat(event_hour)
+                    if parsed_hour < before:
+                        late.setdefault(parsed_hour, set()).update(machine_ids)
+            hour += HOUR
+        return late
@@ -0,0 +1,164 @@
+"""
+Módulo de escolha adaptativa do tamanho da janela de processamento.
+Em vez de um TIME_WINDOW fixo, estima o volume de cada hora à frente do
+checkpoint (pela listagem dos .jsonl brutos ou pelo manifesto de
+compactação) e escolhe a maior janela que cabe no tempo restante da
+invocação e no orçamento de memória, entre WINDOW_MIN_HOURS e WINDOW_MAX_HOURS.
+
+O tempo e a memória de uma janela são estimados pelos bytes de JSON bruto:
+bytes / vazão (bytes/s) e bytes x fator de memória. A vazão e o fator de
+memória são recalibrados a cada janela processada no catch-up. A memória é
+medida pelo RSS atual, antes da decisão e durante a janela, e não pelo pico
+do processo, que em containers reaproveitados guarda as invocações anteriores.
+"""
+
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+import metrics
+from data_access import estimate_hour_volume
+
+# Estimativas iniciais, recalibradas ao longo do catch-up
+DEFAULT_BYTES_PER_SECOND = 5 * 1024 * 1024
+DEFAULT_MEMORY_FACTOR = 8.0
+# Peso da última observação na recalibração da vazão e do fator de memória
+THROUGHPUT_SMOOTHING = 0.5
+MEMORY_SMOOTHING = 0.5
+
+MB = 1024 * 1024
+
+
+class AdaptiveWindowScheduler:
+    """Escolhe o fim de cada janela a partir do volume estimado das horas seguintes."""
+
+    def __init__(
+        self,
+        min_hours: int = 1,
+        max_hours: int = 24,
+        bytes_per_second: float = DEFAULT_BYTES_PER_SECOND,
+        memory_factor: float = DEFAULT_MEMORY_FACTOR,
+        time_budget_seconds: Optional[float] = None,
+        memory_budget_mb: Optional[float] = None,
+        volume_estimator: Callable[[str, datetime], Dict] = estimate_hour_volume,
+    ):
+        """
+        Args:
+            min_hours: Menor janela, usada mesmo que exceda os orçamentos.
+            max_hours: Maior janela.
+            bytes_per_second: Vazão estimada do processamento (bytes de JSON bruto/s).
+            memory_factor: Memória usada por byte de JSON bruto da janela.
+            time_budget_seconds: Tempo disponível para a invocação inteira.
+            memory_budget_mb: Memória disponível para o processo.
+            volume_estimator: Função (bucket, hora) -> {"objects", "bytes"}.
+        """
+        if min_hours < 1 or max_hours < min_hours:
+            raise ValueError(f"Limites de janela inválidos: min={min_hours}, max={max_hours}")
+        self.min_hours = min_hours
+        self.max_hours = max_hours
+        self.bytes_per_second = bytes_per_second
+        self.memory_factor = memory_factor
+        self.time_budget_seconds = time_budget_seconds
+        self.memory_budget_mb = memory_budget_mb
+        self.volume_estimator = volume_estimator
+        self.started = time.monotonic()
+        self.last_decision = None
+        # Decisões ainda não observadas, por início da janela (a pré-busca do
+        # catch-up em pipeline decide as próximas antes de observar a atual)
+        self._pending_decisions: Dict[str, Dict] = {}
+
+    def remaining_seconds(self) -> Optional[float]:
+        """Tempo ainda disponível na invocação (None sem orçamento)."""
+        if self.time_budget_seconds is None:
+            return None
+        return self.time_budget_seconds - (time.monotonic() - self.started)
+
+    def choose_window_end(self, bucket: str, start: datetime, cutoff: datetime) -> datetime:
+        """
+        Escolhe o fim da janela iniciada em start: acrescenta horas enquanto o
+        volume acumulado couber nos orçamentos, até max_hours ou o cutoff.
+        A decisão é registrada nas métricas da execução.
+        """
+        available_hours = max(1, math.ceil((cutoff - start) / timedelta(hours=1)))
+        upper = min(self.max_hours, available_hours)
+        remaining_seconds = self.remaining_seconds()
+        # Memória já ocupada antes da janela (runtime, bibliotecas, janelas em voo)
+        occupied_mb = metrics.current_memory_mb()
+        available_mb = (
+            None if self.memory_budget_mb is None else self.memory_budget_mb - occupied_mb
+        )
+        partition_start = start.replace(minute=0, second=0, microsecond=0)
+
+        hours, total_bytes, total_objects = 0, 0, 0
+        limited_by = "max_hours" if upper == self.max_hours else "cutoff"
+        while hours < upper:
+            volume = self.volume_estimator(bucket, partition_start + timedelta(hours=hours))
+            candidate_bytes = total_bytes + volume["bytes"]
+            if hours >= self.min_hours:
+                if remaining_seconds is not None and candidate_bytes / self.bytes_per_second > remaining_seconds:
+                    limited_by = "time"
+                    break
+                if available_mb is not None and candidate_bytes * self.memory_factor / MB > available_mb:
+                    limited_by = "memory"
+                    break
+            hours += 1
+            total_bytes = candidate_bytes
+            total_objects += volume["objects"]
+
+        self.last_decision = {
+            "start": start.isoformat(),
+            "hours": hours,
+            "objects": total_objects,
+            "bytes": total_bytes,
+            "estimated_seconds": round(total_bytes / self.bytes_per_second, 2),
+            "estimated_mb": round(total_bytes * self.memory_factor / MB, 1),
+            "occupied_mb": round(occupied_mb, 1),
+            "limited_by": limited_by,
+        }
+        self._pending_decisions[self.last_decision["start"]] = self.last_decision
+        print(
+            f"Janela adaptativa: {hours}h a partir de {start.isoformat()} "
+            f"({total_objects} objetos, {total_bytes / MB:.1f} MB; limitada por {limited_by})."
+        )
+        metrics.append_property("WindowDecisions", self.last_decision)
+        metrics.increment("WindowHoursScheduled", hours)
+        metrics.increment("EstimatedBytesScheduled", total_bytes)
+        return min(start + timedelta(hours=hours), cutoff)
+
+    def observe(
+        self,
+        elapsed_seconds: float,
+        window_start: Optional[datetime] = None,
+        window_memory_mb: Optional[float] = None,
+    ) -> None:
+        """
+        Recalibra a vazão e o fator de memória com uma janela processada
+        (bytes estimados na decisão, tempo e memória observados).
+
+        Args:
+            elapsed_seconds: Duração da janela.
+            window_start: Início da janela; sem ele, usa a última decisão.
+            window_memory_mb: Maior RSS medido enquanto os dados da janela
+                              estavam em memória (após o merge e após a
+                              carga); sem ele, mede o RSS atual.
+        """
+        if window_start is not None:
+            decision = self._pending_decisions.pop(window_start.isoformat(), None)
+        else:
+            decision = self.last_decision
+            self._pending_decisions.clear()
+        if not decision or not decision["bytes"] or elapsed_seconds <= 0:
+            return
+        window_bytes = decision["bytes"]
+        observed_rate = window_bytes / elapsed_seconds
+        self.bytes_per_second = (
+            THROUGHPUT_SMOOTHING * observed_rate + (1 - THROUGHPUT_SMOOTHING) * self.bytes_per_second
+        )
+        if window_memory_mb is None:
+            window_memory_mb = metrics.current_memory_mb()
+        window_mb = max(0.0, window_memory_mb - decision["occupied_mb"])
+        observed_factor = window_mb * MB / window_bytes
+        self.memory_factor = (
+            MEMORY_SMOOTHING * observed_factor + (1 - MEMORY_SMOOTHING) * self.memory_factor
+        )
@@ -1,21 +1,67 @@
+import hashlib
 import json
+import math
 import os
+import shutil
 import tempfile
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
-from typing import List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import boto3
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
+from boto3.dynamodb.conditions import Key
 
 # Constantes de prefixos
 PROCESSED_PREFIX = "processed/training_data"
+# Histórico de features sem labels (data_access.append_feature_history no processamento)
+FEATURE_HISTORY_PREFIX = "processed/feature_history"
 SAGEMAKER_BASE_PREFIX = "sagemaker/training-inputs"
-TARGET_TRAIN_FILE = "train.csv"
-TARGET_VAL_FILE = "validation.csv"
+# Formato dos conjuntos de treino/validação entregues ao SageMaker ('parquet' ou 'csv')
+TRAINING_DATA_FORMAT = os.environ.get("TRAINING_DATA_FORMAT", "parquet")
+TARGET_TRAIN_FILE = f"train.{TRAINING_DATA_FORMAT}"
+TARGET_VAL_FILE = f"validation.{TRAINING_DATA_FORMAT}"
+# Extensões aceitas em processed/training_data (Parquet e o CSV legado)
+FEATURE_FILE_EXTENSIONS = (".parquet", ".csv")
+# Colunas não usadas no treinamento, descartadas já na leitura
+DEFAULT_EXCLUDED_COLUMNS = ["timestamp_processamento"]
+# Índice diário gravado pelo processamento junto com os arquivos de features
+# (formato de data_access.get_partition_index no módulo de processamento)
+PARTITION_INDEX_FILE = "_index.json"
+# Threads que baixam os arquivos de features em paralelo
+DOWNLOAD_WORKERS = int(os.environ.get("DATA_PREP_DOWNLOAD_WORKERS", 8))
+# Tamanho das partes do multipart upload (o S3 exige ao menos 5 MB, exceto na última)
+MULTIPART_PART_SIZE = max(int(os.environ.get("MULTIPART_PART_SIZE_MB", 8)), 5) * 1024 * 1024
+# Fração dos grupos destinada à validação e semente do hash e do embaralhamento
+VALIDATION_FRACTION = float(os.environ.get("VALIDATION_FRACTION", 0.2))
+RANDOM_SEED = int(os.environ.get("SPLIT_SEED", 42))
+# Chave dos grupos que vão inteiros para treino ou validação: colunas, 'day'
+# ou 'hour' (derivados de timestamp_janela)
+SPLIT_GROUP_KEY = os.environ.get("SPLIT_GROUP_KEY", "machine_id,day")
+# Holdout temporal opcional: linhas das últimas N horas vão para a validação
+VALIDATION_HOLDOUT_HOURS = int(os.environ.get("VALIDATION_HOLDOUT_HOURS", 0))
+# Tamanho (MB nos arquivos de origem) de cada balde do embaralhamento externo
+SHUFFLE_BUCKET_MB = int(os.environ.get("SHUFFLE_BUCKET_MB", 64))
+# Diretório dos baldes (o armazenamento efêmero da Lambda)
+SHUFFLE_DIR = os.environ.get("SHUFFLE_DIR", "/tmp")
+# Cache de shards diários consolidados, reutilizados enquanto os arquivos do dia não mudam
+SHARD_CACHE_ENABLED = os.environ.get("SHARD_CACHE_ENABLED", "true").lower() == "true"
+SHARD_CACHE_PREFIX = "sagemaker/shard-cache"
+SHARD_MANIFEST_FILE = "_shard.json"
+# Incrementar quando o conteúdo dos shards mudar, invalidando o cache existente
+SHARD_CACHE_VERSION = 1
+# Tabela de falhas e o GSI por dia (time_bucket) usados para rotular o histórico de features
+FAILURES_TABLE_NAME = os.environ.get("FAILURES_TABLE_NAME")
+# Horizonte da label usada como alvo do treino sem LabelHorizons/TargetHorizon
+# (o PREDICTION_HORIZON_HOURS padrão do processamento)
+DEFAULT_TARGET_HORIZON_HOURS = 24
+FAILURE_TIME_INDEX = os.environ.get("FAILURE_TIME_INDEX", "time_bucket-timestamp_utc-index")
 
 s3_client = boto3.client("s3")
+dynamodb_resource = boto3.resource("dynamodb")
 
 
 def _dates_to_process(days_back: int) -> List[datetime]:
@@ -24,42 +70,600 @@ def _dates_to_process(days_back: int) -> List[datetime]:
     return [today - timedelta(days=i) for i in range(days_back)]
 
 
-def _build_prefix_for_date(date_obj: datetime.date) -> str:
+def _build_prefix_for_date(date_obj: datetime.date, root: str = PROCESSED_PREFIX) -> str:
     """Constroi o prefixo S3 para uma data específica seguindo a partição year/month/day."""
     return (
-        f"{PROCESSED_PREFIX}/"
+        f"{root}/"
         f"year={date_obj.year}/"
         f"month={date_obj.month:02d}/"
         f"day={date_obj.day:02d}/"
     )
 
 
-def _list_csv_keys(bucket: str, prefix: str) -> List[str]:
-    """Lista objetos .csv sob um prefixo, retornando a lista de chaves."""
+def _read_partition_index(bucket: str, prefix: str) -> Optional[dict]:
+    """Lê o índice da partição; None se não existe ou está desatualizado (stale)."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=prefix + PARTITION_INDEX_FILE)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    index = json.loads(response["Body"].read())
+    return None if index.get("stale") else index
+
+
+def _list_feature_keys(
+    bucket: str, prefix: str, machine_ids: Optional[List[str]] = None
+) -> List[Tuple[str, int, str]]:
+    """
+    Lista objetos .parquet e .csv sob um prefixo, retornando (chave, tamanho, ETag).
+    Usa o índice da partição quando existe e registra os ETags, sem listar o
+    prefixo; com machine_ids, o índice também descarta os arquivos sem essas
+    máquinas.
+    """
+    index = _read_partition_index(bucket, prefix)
+    if index is not None and all("etag" in entry for entry in index["objects"].values()):
+        wanted = set(machine_ids or [])
+        return [
+            (key, entry.get("size", 0), entry["etag"])
+            for key, entry in sorted(index["objects"].items())
+            if key.lower().endswith(FEATURE_FILE_EXTENSIONS)
+            and (not wanted or "machine_ids" not in entry or wanted.intersection(entry["machine_ids"]))
+        ]
+
     paginator = s3_client.get_paginator("list_objects_v2")
-    csv_keys: List[str] = []
+    feature_keys: List[Tuple[str, int, str]] = []
     for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
         for obj in page.get("Contents", []):
             key = obj["Key"]
-            if key.lower().endswith(".csv"):
-                csv_keys.append(key)
-    return csv_keys
+            if key.lower().endswith(FEATURE_FILE_EXTENSIONS):
+                feature_keys.append((key, obj["Size"], obj["ETag"]))
+    return feature_keys
+
+
+def _parse_timestamp_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas timestamp_* lidas de CSV para datetime UTC (como no Parquet)."""
+    for column in df.columns:
+        if column.startswith("timestamp_"):
+            df[column] = pd.to_datetime(df[column], utc=True, format="ISO8601")
+    return df
+
+
+def _load_features_from_s3(
+    bucket: str, key: str, excluded_columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Baixa um arquivo de features (Parquet ou CSV) do S3 e carrega como
+    DataFrame, lendo apenas as colunas que não estão em excluded_columns.
+    """
+    excluded = set(excluded_columns or [])
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    body = BytesIO(response["Body"].read())
+
+    if key.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(body)
+        columns = [name for name in parquet_file.schema_arrow.names if name not in excluded]
+        return parquet_file.read(columns=columns).to_pandas()
+
+    df = pd.read_csv(body, usecols=lambda column: column not in excluded)
+    return _parse_timestamp_columns(df)
+
+
+def _iter_feature_frames(
+    bucket: str,
+    keys: List[str],
+    excluded_columns: Optional[List[str]] = None,
+    max_workers: int = DOWNLOAD_WORKERS,
+) -> Iterator[pd.DataFrame]:
+    """
+    Baixa os arquivos de features com um pool de threads e devolve os
+    DataFrames na ordem de keys. No máximo 2 x max_workers arquivos ficam em
+    memória ao mesmo tempo, independentemente do número de dias.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for key in keys:
+            pending.append(executor.submit(_load_features_from_s3, bucket, key, excluded_columns))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class S3MultipartWriter:
+    """
+    Arquivo somente de escrita que envia o conteúdo ao S3 em partes de um
+    multipart upload à medida que é escrito, mantendo em memória no máximo
+    uma parte. Conteúdos menores que uma parte vão em um único PutObject.
+    """
+
+    def __init__(self, bucket: str, key: str, part_size: int = MULTIPART_PART_SIZE):
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self._buffer.extend(data)
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            response = s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self._upload_id = response["UploadId"]
+        part_number = len(self._parts) + 1
+        response = s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def close(self) -> None:
+        """Envia o restante do conteúdo e conclui o upload."""
+        if self.closed:
+            return
+        if self._upload_id is None:
+            s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self.closed = True
+
+    def abort(self) -> None:
+        """Descarta o upload em andamento (as partes já enviadas são removidas)."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is not None:
+            s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+
+class TrainingSetWriter:
+    """
+    Grava um conjunto (treino ou validação) em streaming no S3, no formato
+    dado pela extensão da chave: um único arquivo Parquet (snappy, um row group
+    por bloco recebido) ou CSV com cabeçalho, como os lidos por train.py.
+    As colunas e o schema são os do primeiro arquivo de features: colunas
+    ausentes em um bloco ficam nulas e colunas extras são descartadas.
+    """
+
+    def __init__(self, bucket: str, key: str, columns: List[str], schema=None):
+        self.stream = S3MultipartWriter(bucket, key)
+        self.columns = columns
+        self.schema = schema
+        self.rows = 0
+        self._parquet_writer = None
+        if key.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            self._parquet_writer = pq.ParquetWriter(self.stream, schema, compression="snappy")
+        else:
+            self.stream.write(pd.DataFrame(columns=columns).to_csv(index=False))
+
+    def write(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        df = df.reindex(columns=self.columns)
+        if self._parquet_writer is not None:
+            import pyarrow as pa
+
+            self._parquet_writer.write_table(
+                pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            )
+        else:
+            self.stream.write(df.to_csv(index=False, header=False))
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        self.stream.close()
+
+    def abort(self) -> None:
+        self.stream.abort()
+
+
+class GroupHashSplitter:
+    """
+    Divide as linhas entre treino e validação por um hash estável da chave de
+    grupo (ex: machine_id + dia): todas as linhas de um grupo vão para o mesmo
+    conjunto, em qualquer execução e independentemente da ordem dos arquivos.
+    Com holdout_start, as linhas a partir desse instante vão sempre para a
+    validação (holdout temporal) e o hash divide apenas as anteriores.
+    """
+
+    def __init__(
+        self,
+        group_key: List[str],
+        fraction: float = VALIDATION_FRACTION,
+        seed: int = RANDOM_SEED,
+        holdout_start: Optional[datetime] = None,
+    ):
+        self.group_key = group_key
+        self.fraction = fraction
+        self.seed = seed
+        self.holdout_start = pd.Timestamp(holdout_start) if holdout_start is not None else None
+        self._cache: Dict[str, bool] = {}
+
+    def _group_values(self, df: pd.DataFrame) -> pd.Series:
+        parts = []
+        for name in self.group_key:
+            if name in ("day", "hour"):
+                timestamps = pd.to_datetime(df["timestamp_janela"], utc=True)
+                parts.append(timestamps.dt.strftime("%Y-%m-%d" if name == "day" else "%Y-%m-%dT%H"))
+            else:
+                parts.append(df[name].astype(str))
+        values = parts[0]
+        for part in parts[1:]:
+            values = values + "|" + part
+        return values
+
+    def _is_validation_group(self, group: str) -> bool:
+        if group not in self._cache:
+            digest = hashlib.blake2b(f"{self.seed}:{group}".encode("utf-8"), digest_size=8).digest()
+            self._cache[group] = int.from_bytes(digest, "big") / 2**64 < self.fraction
+        return self._cache[group]
+
+    def validation_mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Máscara booleana das linhas de validação do bloco."""
+        required = {"timestamp_janela" if name in ("day", "hour") else name for name in self.group_key}
+        if self.holdout_start is not None:
+            required.add("timestamp_janela")
+        missing = sorted(required - set(df.columns))
+        if missing:
+            raise ValueError(f"Colunas da chave de divisão ausentes nos dados: {missing}")
+        groups = self._group_values(df)
+        mask = groups.map(self._is_validation_group).to_numpy(dtype=bool)
+        if self.holdout_start is not None:
+            timestamps = pd.to_datetime(df["timestamp_janela"], utc=True)
+            mask = mask | (timestamps >= self.holdout_start).to_numpy()
+        return mask
+
+
+class ExternalShuffler:
+    """
+    Embaralhamento externo em baldes de tamanho limitado: na primeira passada,
+    cada linha vai para um balde sorteado e é anexada ao arquivo do balde em
+    disco (Arrow IPC); na segunda, cada balde é lido sozinho, embaralhado em
+    memória e devolvido. A memória é a de um balde, para qualquer volume, e o
+    resultado é reprodutível para a mesma semente e os mesmos arquivos.
+    """
+
+    def __init__(self, num_buckets: int, schema, seed: int = RANDOM_SEED, directory: str = SHUFFLE_DIR):
+        self.num_buckets = num_buckets
+        self.schema = schema
+        self.directory = tempfile.mkdtemp(prefix="shuffle_", dir=directory)
+        self._scatter_rng = np.random.default_rng(seed)
+        self._shuffle_rng = np.random.default_rng(seed + 1)
+        self._writers: Dict[Tuple[str, int], object] = {}
+        self.rows: Dict[str, int] = {}
+
+    def _path(self, split: str, bucket: int) -> str:
+        return os.path.join(self.directory, f"{split}_{bucket:05d}.arrow")
+
+    def add(self, split: str, df: pd.DataFrame) -> None:
+        """Distribui as linhas de um bloco entre os baldes de um conjunto."""
+        import pyarrow as pa
+
+        if df.empty:
+            return
+        buckets = self._scatter_rng.integers(0, self.num_buckets, len(df))
+        # Arquivos sem alguma coluna do schema (ex: sensor novo) ganham a coluna nula
+        df = df.reindex(columns=self.schema.names)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        for bucket in np.unique(buckets):
+            writer = self._writers.get((split, bucket))
+            if writer is None:
+                writer = pa.ipc.new_stream(self._path(split, bucket), self.schema)
+                self._writers[(split, bucket)] = writer
+            writer.write_table(table.filter(pa.array(buckets == bucket)))
+        self.rows[split] = self.rows.get(split, 0) + len(df)
 
+    def iter_shuffled(self, split: str) -> Iterator[pd.DataFrame]:
+        """Devolve as linhas do conjunto embaralhadas, um balde por vez."""
+        import pyarrow as pa
+
+        for bucket in range(self.num_buckets):
+            writer = self._writers.pop((split, bucket), None)
+            if writer is None:
+                continue
+            writer.close()
+            path = self._path(split, bucket)
+            with pa.OSFile(path, "rb") as source:
+                df = pa.ipc.open_stream(source).read_all().to_pandas()
+            os.remove(path)
+            yield df.iloc[self._shuffle_rng.permutation(len(df))]
+
+    def cleanup(self) -> None:
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _shard_prefix(date_obj: datetime.date, root: str = PROCESSED_PREFIX) -> str:
+    """Prefixo S3 dos shards em cache de um dia da origem root (ex: training_data/year=.../)."""
+    return _build_prefix_for_date(date_obj, f"{SHARD_CACHE_PREFIX}/{root.rsplit('/', 1)[-1]}")
+
+
+def _shard_fingerprint(
+    files: List[Tuple[str, int, str]],
+    excluded_columns: Optional[List[str]],
+    machine_ids: Optional[List[str]],
+) -> str:
+    """
+    Identifica o conteúdo de um shard: os arquivos do dia com seus ETags e os
+    filtros aplicados na leitura. Qualquer arquivo novo, removido ou regravado
+    muda o fingerprint e invalida o shard do dia.
+    """
+    payload = json.dumps(
+        {
+            "version": SHARD_CACHE_VERSION,
+            "files": sorted([key, etag] for key, _, etag in files),
+            "excluded_columns": sorted(excluded_columns or []),
+            "machine_ids": sorted(machine_ids) if machine_ids else None,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _read_shard_manifest(bucket: str, date_obj: datetime.date, root: str = PROCESSED_PREFIX) -> Optional[dict]:
+    """Manifesto do shard em cache do dia: {"fingerprint", "key", "rows", "sources", "built_at"}."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=_shard_prefix(date_obj, root) + SHARD_MANIFEST_FILE)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+
+def _iter_parquet_row_groups(bucket: str, key: str) -> Iterator[pd.DataFrame]:
+    """Baixa um arquivo Parquet do S3 e devolve um DataFrame por row group."""
+    import pyarrow.parquet as pq
 
-def _load_csv_from_s3(bucket: str, key: str) -> pd.DataFrame:
-    """Baixa o objeto CSV do S3 e carrega como DataFrame."""
     response = s3_client.get_object(Bucket=bucket, Key=key)
-    body = response["Body"].read()
-    return pd.read_csv(BytesIO(body))
+    parquet_file = pq.ParquetFile(BytesIO(response["Body"].read()))
+    for row_group in range(parquet_file.num_row_groups):
+        yield parquet_file.read_row_group(row_group).to_pandas()
+
+
+def _latest_versions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mantém, para cada máquina e janela do histórico de features, só a versão
+    gravada por último (maior timestamp_processamento), em ordem de janela.
+    """
+    if "timestamp_processamento" in df.columns:
+        df = df.sort_values("timestamp_processamento", kind="stable")
+    df = df.drop_duplicates(["machine_id", "timestamp_janela"], keep="last")
+    return df.sort_values(["timestamp_janela", "machine_id"], kind="stable").reset_index(drop=True)
+
+
+def _iter_source_frames(
+    bucket: str,
+    keys: List[str],
+    excluded_columns: Optional[List[str]] = None,
+    machine_ids: Optional[List[str]] = None,
+    latest_versions: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """
+    Lê os arquivos de origem de um dia e aplica o filtro de máquinas. Com
+    latest_versions (histórico de features), o dia é consolidado em um único
+    bloco e cada máquina e janela fica só com a versão mais recente.
+    """
+    if latest_versions:
+        excluded = set(excluded_columns or [])
+        frames = list(
+            _iter_feature_frames(bucket, keys, [c for c in excluded if c != "timestamp_processamento"])
+        )
+        if frames:
+            day_df = _latest_versions(pd.concat(frames, ignore_index=True))
+            frames = [day_df.drop(columns=[c for c in day_df.columns if c in excluded])]
+    else:
+        frames = _iter_feature_frames(bucket, keys, excluded_columns)
+
+    for df in frames:
+        if machine_ids:
+            df = df[df["machine_id"].isin(machine_ids)]
+        if not df.empty:
+            yield df
+
+
+def _iter_day_frames(
+    bucket: str,
+    date_obj: datetime.date,
+    files: List[Tuple[str, int, str]],
+    excluded_columns: Optional[List[str]] = None,
+    machine_ids: Optional[List[str]] = None,
+    use_cache: bool = SHARD_CACHE_ENABLED,
+    root: str = PROCESSED_PREFIX,
+) -> Iterator[pd.DataFrame]:
+    """
+    Devolve as linhas de features de um dia da origem root, já filtradas, em
+    blocos (no histórico de features, só a versão mais recente de cada janela).
+
+    Com o cache, o dia cujo fingerprint coincide com o do manifesto é lido do
+    shard consolidado (um GET); caso contrário, os arquivos de origem são
+    baixados e, enquanto são devolvidos, gravados em um novo shard (um row
+    group por arquivo, preservando os blocos da leitura direta). O manifesto
+    só é gravado depois do shard completo, e o shard anterior é removido.
+    """
+    keys = [key for key, _, _ in files]
+    latest_versions = root == FEATURE_HISTORY_PREFIX
+    if not use_cache:
+        yield from _iter_source_frames(bucket, keys, excluded_columns, machine_ids, latest_versions)
+        return
+
+    fingerprint = _shard_fingerprint(files, excluded_columns, machine_ids)
+    manifest = _read_shard_manifest(bucket, date_obj, root)
+    if manifest is not None and manifest.get("fingerprint") == fingerprint:
+        print(f"Dia {date_obj}: shard em cache com {manifest['rows']} linhas.")
+        if manifest.get("key"):
+            yield from _iter_parquet_row_groups(bucket, manifest["key"])
+        return
 
+    print(f"Dia {date_obj}: reconstruindo o shard a partir de {len(keys)} arquivo(s).")
+    shard_key = f"{_shard_prefix(date_obj, root)}{fingerprint}.parquet"
+    writer = None
+    try:
+        for df in _iter_source_frames(bucket, keys, excluded_columns, machine_ids, latest_versions):
+            if writer is None:
+                import pyarrow as pa
 
-def _upload_df_to_s3(df: pd.DataFrame, bucket: str, key: str):
-    """Salva DataFrame temporariamente como CSV e faz upload para S3."""
-    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".csv") as tmp:
-        df.to_csv(tmp.name, index=False)
-        tmp.flush()
-        s3_client.upload_file(tmp.name, bucket, key)
-    os.remove(tmp.name)
+                writer = TrainingSetWriter(
+                    bucket, shard_key, list(df.columns), pa.Schema.from_pandas(df, preserve_index=False)
+                )
+            writer.write(df)
+            yield df
+        if writer is not None:
+            writer.close()
+    except BaseException:
+        # Inclui o GeneratorExit de um consumidor que interrompe a leitura
+        if writer is not None:
+            writer.abort()
+        raise
+
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=_shard_prefix(date_obj, root) + SHARD_MANIFEST_FILE,
+        Body=json.dumps(
+            {
+                "fingerprint": fingerprint,
+                "key": shard_key if writer is not None else None,
+                "rows": writer.rows if writer is not None else 0,
+                "sources": len(keys),
+                "built_at": datetime.now(timezone.utc).isoformat(),
+            }
+        ).encode("utf-8"),
+        ContentType="application/json",
+    )
+    if manifest is not None and manifest.get("key") and manifest["key"] != shard_key:
+        s3_client.delete_object(Bucket=bucket, Key=manifest["key"])
+
+
+def _fetch_failures(table_name: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Falhas (machine_id, failure_time) em [start, end], com uma Query paginada
+    por dia no GSI time_bucket/timestamp_utc da tabela de falhas.
+    """
+    table = dynamodb_resource.Table(table_name)
+    items = []
+    day = start.astimezone(timezone.utc).date()
+    while day <= end.astimezone(timezone.utc).date():
+        query_kwargs = {
+            "IndexName": FAILURE_TIME_INDEX,
+            "KeyConditionExpression": Key("time_bucket").eq(day.isoformat())
+            & Key("timestamp_utc").between(start.isoformat(), end.isoformat()),
+            "ProjectionExpression": "machine_id, timestamp_utc",
+        }
+        response = table.query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        while "LastEvaluatedKey" in response:
+            response = table.query(ExclusiveStartKey=response["LastEvaluatedKey"], **query_kwargs)
+            items.extend(response.get("Items", []))
+        day += timedelta(days=1)
+
+    failures = pd.DataFrame(items, columns=["machine_id", "timestamp_utc"])
+    return pd.DataFrame(
+        {
+            "machine_id": failures["machine_id"].astype(str),
+            "failure_time": pd.to_datetime(
+                failures["timestamp_utc"], utc=True, format="ISO8601"
+            ).astype("datetime64[ns, UTC]"),
+        }
+    )
+
+
+class FailureLabeler:
+    """
+    Rotula o histórico de features para qualquer conjunto de horizontes:
+    label_falha_{h}h = 1 se a máquina tem uma falha em (timestamp_janela,
+    timestamp_janela + h], como add_predictive_label no processamento. A
+    próxima falha de cada linha vem de um único merge_asof vetorizado por
+    máquina e atende todos os horizontes.
+
+    Linhas cujo maior horizonte termina depois de labels_through são
+    descartadas, pois a falha que as rotularia ainda pode acontecer.
+    """
+
+    def __init__(self, failures: pd.DataFrame, horizons: List[int], labels_through: datetime):
+        # merge_asof exige chaves do mesmo tipo nos dois lados
+        self.failures = failures.astype(
+            {"machine_id": str, "failure_time": "datetime64[ns, UTC]"}
+        ).sort_values("failure_time", kind="stable").reset_index(drop=True)
+        self.horizons = sorted(horizons)
+        self.labels_through = pd.Timestamp(labels_through)
+        self.censored_rows = 0
+
+    def label(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Bloco com as colunas label_falha_{h}h, sem as linhas de horizonte incompleto."""
+        timestamps = pd.to_datetime(df["timestamp_janela"], utc=True)
+        complete = (timestamps + pd.Timedelta(hours=self.horizons[-1]) <= self.labels_through).to_numpy()
+        self.censored_rows += int((~complete).sum())
+        df = df[complete]
+        left = pd.DataFrame(
+            {
+                "machine_id": df["machine_id"].astype(str).reset_index(drop=True),
+                "window_time": timestamps[complete].astype("datetime64[ns, UTC]").reset_index(drop=True),
+                "row": np.arange(len(df)),
+            }
+        ).sort_values("window_time", kind="stable")
+        merged = pd.merge_asof(
+            left,
+            self.failures,
+            left_on="window_time",
+            right_on="failure_time",
+            by="machine_id",
+            direction="forward",
+            allow_exact_matches=False,
+        ).sort_values("row")
+        time_to_failure = (merged["failure_time"] - merged["window_time"]).to_numpy()
+
+        labeled = df.copy()
+        for horizon in self.horizons:
+            # NaT (sem falha posterior) resulta em False
+            labeled[f"label_falha_{horizon}h"] = (
+                time_to_failure <= np.timedelta64(horizon, "h")
+            ).astype("int8")
+        return labeled
+
+
+def _holdout_start(event: Dict) -> Optional[datetime]:
+    """Início do holdout temporal: HoldoutStart (ISO 8601) ou as últimas HoldoutHours horas."""
+    if event.get("HoldoutStart"):
+        start = datetime.fromisoformat(event["HoldoutStart"])
+        return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    hours = int(event.get("HoldoutHours", VALIDATION_HOLDOUT_HOURS))
+    if hours > 0:
+        return datetime.now(timezone.utc) - timedelta(hours=hours)
+    return None
 
 
 def _prepare_output_paths(bucket: str) -> Tuple[str, str, str]:
@@ -78,61 +682,142 @@ def lambda_handler(event, context):  # noqa: D401, ANN001
 
     Espera evento no formato: {
         "S3Bucket": "nome-bucket",
-        "DaysToProcess": 7
+        "DaysToProcess": 7,
+        "ExcludeColumns": ["timestamp_processamento"],  (opcional)
+        "MachineIds": ["PUMP-A01"],  (opcional: treina só com essas máquinas)
+        "SplitGroupKey": "machine_id,day",  (opcional, padrão SPLIT_GROUP_KEY)
+        "HoldoutStart": "2025-10-20T00:00:00+00:00" ou "HoldoutHours": 48  (opcional)
+        "UseShardCache": true  (opcional, padrão SHARD_CACHE_ENABLED)
+        "LabelHorizons": [6, 48]  (opcional: rotula o histórico de features)
+        "TargetHorizon": 6  (opcional: horizonte alvo do treino, padrão o
+                             primeiro de LabelHorizons ou 24)
     }
+
+    Com LabelHorizons, as linhas vêm do histórico de features sem labels
+    (processed/feature_history) e são rotuladas para esses horizontes a partir
+    da tabela de falhas (FailureLabeler), sem reprocessar o data lake; sem ele,
+    vêm de processed/training_data com as labels calculadas no processamento.
+    A coluna do horizonte alvo (label_falha_{h}h) volta em TargetColumn, que a
+    máquina de estados repassa ao treino como o hiperparâmetro target_column.
+
+    Cada dia é lido do shard em cache quando seus arquivos não mudaram desde a
+    última execução (ver _iter_day_frames): na execução diária, apenas o dia
+    corrente é baixado e consolidado. As linhas são divididas por grupo
+    (GroupHashSplitter) e embaralhadas em baldes em disco (ExternalShuffler)
+    antes de seguir para o S3.
     """
 
     bucket = event.get("S3Bucket")
     days_back = int(event.get("DaysToProcess", 1))
+    excluded_columns = event.get("ExcludeColumns", DEFAULT_EXCLUDED_COLUMNS)
+    machine_ids = event.get("MachineIds")
+    use_cache = str(event.get("UseShardCache", SHARD_CACHE_ENABLED)).lower() == "true"
+    label_horizons = [int(hours) for hours in event.get("LabelHorizons") or []]
+    target_horizon = int(
+        event.get("TargetHorizon") or (label_horizons[0] if label_horizons else DEFAULT_TARGET_HORIZON_HOURS)
+    )
+    root = FEATURE_HISTORY_PREFIX if label_horizons else PROCESSED_PREFIX
+    group_key = [
+        name.strip() for name in event.get("SplitGroupKey", SPLIT_GROUP_KEY).split(",") if name.strip()
+    ]
 
     if not bucket:
         raise ValueError("'S3Bucket' é obrigatório no evento de entrada.")
+    if label_horizons and not FAILURES_TABLE_NAME:
+        raise ValueError("FAILURES_TABLE_NAME é obrigatório para rotular o histórico (LabelHorizons).")
+    if label_horizons and target_horizon not in label_horizons:
+        raise ValueError(f"TargetHorizon {target_horizon} não está em LabelHorizons {label_horizons}.")
 
-    print(f"Iniciando preparação com days_back={days_back} no bucket={bucket}")
+    splitter = GroupHashSplitter(group_key, holdout_start=_holdout_start(event))
+    print(
+        f"Iniciando preparação com days_back={days_back} no bucket={bucket} "
+        f"(grupos: {group_key}, holdout a partir de {splitter.holdout_start})"
+    )
 
-    # 1. Identificar objetos CSV relevantes
-    keys: List[str] = []
+    # 1. Identificar objetos de features (Parquet ou CSV) relevantes
+    days: List[Tuple[datetime.date, List[Tuple[str, int, str]]]] = []
     for date_obj in _dates_to_process(days_back):
-        prefix = _build_prefix_for_date(date_obj)
-        day_keys = _list_csv_keys(bucket, prefix)
-        print(f"Encontrados {len(day_keys)} arquivos em {prefix}")
-        keys.extend(day_keys)
+        prefix = _build_prefix_for_date(date_obj, root)
+        day_files = _list_feature_keys(bucket, prefix, machine_ids)
+        print(f"Encontrados {len(day_files)} arquivos em {prefix}")
+        if day_files:
+            days.append((date_obj, day_files))
 
-    if not keys:
+    if not days:
         raise FileNotFoundError(
-            "Nenhum arquivo .csv encontrado no intervalo de datas especificado."
+            "Nenhum arquivo .parquet ou .csv encontrado no intervalo de datas especificado."
         )
+    total_bytes = sum(size for _, day_files in days for _, size, _ in day_files)
+    num_buckets = max(1, math.ceil(total_bytes / (SHUFFLE_BUCKET_MB * 1024 * 1024)))
 
-    # 2. Download e consolidação dos dados
-    dataframes: List[pd.DataFrame] = []
-    for key in keys:
-        df = _load_csv_from_s3(bucket, key)
-        dataframes.append(df)
+    labeler = None
+    if label_horizons:
+        first_day = min(date_obj for date_obj, _ in days)
+        labels_start = datetime(first_day.year, first_day.month, first_day.day, tzinfo=timezone.utc)
+        labels_through = datetime.now(timezone.utc)
+        failures = _fetch_failures(FAILURES_TABLE_NAME, labels_start, labels_through)
+        print(f"{len(failures)} falhas carregadas para os horizontes {label_horizons}.")
+        labeler = FailureLabeler(failures, label_horizons, labels_through)
 
-    full_df = pd.concat(dataframes, ignore_index=True)
-    print(
-        f"DataFrame consolidado contém {len(full_df)} linhas e {len(full_df.columns)} colunas."
-    )
+    shuffler = None
+    try:
+        # 2. Leitura de cada dia (shard em cache ou download concorrente), divisão
+        #    por grupo e distribuição das linhas nos baldes em disco (nada é
+        #    consolidado em memória)
+        for date_obj, day_files in days:
+            for df in _iter_day_frames(
+                bucket, date_obj, day_files, excluded_columns, machine_ids, use_cache, root
+            ):
+                if labeler is not None:
+                    df = labeler.label(df)
+                    if df.empty:
+                        continue
+                if shuffler is None:
+                    import pyarrow as pa
 
-    # 3. Embaralhar as linhas
-    full_df = full_df.sample(frac=1, random_state=42).reset_index(drop=True)
+                    shuffler = ExternalShuffler(num_buckets, pa.Schema.from_pandas(df, preserve_index=False))
+                is_validation = splitter.validation_mask(df)
+                shuffler.add("train", df[~is_validation])
+                shuffler.add("validation", df[is_validation])
 
-    # 4. Divisão treino/validação
-    train_df, val_df = train_test_split(
-        full_df, test_size=0.2, random_state=42, shuffle=False
-    )
+        if shuffler is None:
+            raise ValueError("Os arquivos de features encontrados não possuem linhas para o treino.")
+        for split in ("train", "validation"):
+            if not shuffler.rows.get(split):
+                raise ValueError(
+                    f"Nenhuma linha no conjunto '{split}' com os grupos {group_key}: "
+                    "aumente DaysToProcess ou ajuste SplitGroupKey/holdout."
+                )
 
-    # 5. Upload dos conjuntos para S3
-    train_key, val_key, train_uri, val_uri = _prepare_output_paths(bucket)
-    _upload_df_to_s3(train_df, bucket, train_key)
-    _upload_df_to_s3(val_df, bucket, val_key)
+        # 3. Cada balde é embaralhado em memória e enviado direto ao multipart upload
+        train_key, val_key, train_uri, val_uri = _prepare_output_paths(bucket)
+        for split, key in (("train", train_key), ("validation", val_key)):
+            writer = TrainingSetWriter(bucket, key, shuffler.schema.names, shuffler.schema)
+            try:
+                for df in shuffler.iter_shuffled(split):
+                    writer.write(df)
+                writer.close()
+            except Exception:
+                writer.abort()
+                raise
+    finally:
+        if shuffler is not None:
+            shuffler.cleanup()
+
+    print(
+        f"{shuffler.rows['train']} linhas de treino e {shuffler.rows['validation']} de validação "
+        f"gravadas a partir de {num_buckets} balde(s)."
+    )
+    if labeler is not None:
+        print(f"{labeler.censored_rows} linhas descartadas por horizonte de labels incompleto.")
 
     print("Upload concluído:")
     print(f"  Treino -> {train_uri}")
     print(f"  Validação -> {val_uri}")
 
-    # 6. Retornar URIs para o Step Functions
+    # 3. Retornar URIs para o Step Functions
     return {
         "TrainDataUri": train_uri,
         "ValidationDataUri": val_uri,
+        "TargetColumn": f"label_falha_{target_horizon}h",
     }
@@ -9,10 +9,12 @@ padrão de diretórios de entrada e saída.
 import argparse
 import json
 import os
+import time
 from pathlib import Path
 
 import joblib
 import pandas as pd
+import xgboost as xgb
 from sklearn.metrics import (
     accuracy_score,
     precision_score,
@@ -32,6 +34,26 @@ def parse_args():
     parser.add_argument("--n_estimators", type=int, default=200)
     parser.add_argument("--learning_rate", type=float, default=0.1)
 
+    # Coluna alvo: a label do horizonte escolhido na preparação (label_falha_{h}h)
+    parser.add_argument("--target_column", type=str, default="label_falha_24h")
+
+    # Desempenho do treinamento
+    parser.add_argument("--tree_method", type=str, default="hist")
+    # Threads do XGBoost (-1: todos os núcleos da instância)
+    parser.add_argument("--n_jobs", type=int, default=-1)
+    # Rodadas sem melhora da logloss de validação até parar (0 desativa)
+    parser.add_argument("--early_stopping_rounds", type=int, default=20)
+    # Lê os dados em blocos por um DataIter, com o cache de páginas em disco
+    parser.add_argument(
+        "--external_memory", type=lambda value: str(value).lower() == "true", default=False
+    )
+    # Linhas por bloco na leitura de CSV em memória externa (Parquet usa os row groups)
+    parser.add_argument("--chunk_rows", type=int, default=100_000)
+    # Cache de páginas da memória externa, no volume do training job
+    parser.add_argument(
+        "--cache_dir", type=str, default=os.environ.get("XGBOOST_CACHE_DIR", "/opt/ml/xgboost_cache")
+    )
+
     # Argumentos auxiliares (SageMaker injeta esses valores automaticamente)
     parser.add_argument(
         "--model-dir",
@@ -54,33 +76,176 @@ def parse_args():
     return parser.parse_args()
 
 
-def load_data(directory: str):
-    """Carrega um arquivo CSV chamado train.csv ou validation.csv no diretório dado."""
+def load_data(directory: str, excluded_columns: list = None):
+    """
+    Carrega o arquivo de dados (train/validation) do diretório dado, em
+    Parquet ou, como fallback, CSV, lendo só as colunas fora de excluded_columns.
+    """
+    excluded = set(excluded_columns or [])
+    parquet_files = sorted(Path(directory).glob("*.parquet"))
+    if parquet_files:
+        import pyarrow.parquet as pq
+
+        print(f"Carregando dados de {parquet_files[0]}")
+        parquet_file = pq.ParquetFile(parquet_files[0])
+        columns = [name for name in parquet_file.schema_arrow.names if name not in excluded]
+        return parquet_file.read(columns=columns).to_pandas()
+
     csv_files = list(Path(directory).glob("*.csv"))
     if not csv_files:
-        raise FileNotFoundError(f"Nenhum arquivo .csv encontrado em {directory}")
+        raise FileNotFoundError(f"Nenhum arquivo .parquet ou .csv encontrado em {directory}")
     # Assume o primeiro arquivo encontrado como entrada
     print(f"Carregando dados de {csv_files[0]}")
-    return pd.read_csv(csv_files[0])
+    return pd.read_csv(csv_files[0], usecols=lambda column: column not in excluded)
+
+
+def feature_columns(columns: list, target_col: str, feature_cols_to_drop: list) -> list:
+    """Colunas usadas como features: sem o alvo, as de identificação e as labels de outros horizontes."""
+    if target_col not in columns:
+        labels = [col for col in columns if col.startswith("label_falha_")]
+        raise ValueError(f"Coluna alvo {target_col} ausente dos dados (labels disponíveis: {labels})")
+    return [
+        col for col in columns
+        if col != target_col
+        and col not in feature_cols_to_drop
+        # Labels de outros horizontes (label_falha_{h}h) não podem entrar como features
+        and not col.startswith("label_falha_")
+    ]
 
 
 def separate_features_target(df: pd.DataFrame, target_col: str, feature_cols_to_drop: list):
     """Separa features e alvo, removendo colunas de identificação."""
     print(f"Removendo colunas que não são features: {feature_cols_to_drop}")
-    
-    # Valida se as colunas a serem dropadas existem no dataframe
-    cols_to_drop_existing = [col for col in feature_cols_to_drop if col in df.columns]
-    
-    X = df.drop(columns=[target_col] + cols_to_drop_existing)
+
+    X = df[feature_columns(list(df.columns), target_col, feature_cols_to_drop)]
     y = df[target_col]
     
     print(f"Features utilizadas para o treinamento: {list(X.columns)}")
     
     return X, y
 
-def train_model(X_train, y_train, args):
-    """Instancia e treina o XGBClassifier com hiperparâmetros fornecidos."""
+class ChunkedFileIter(xgb.DataIter):
+    """
+    Iterador de memória externa do XGBoost sobre os arquivos de um canal:
+    cada bloco é um row group dos arquivos Parquet ou chunk_rows linhas dos
+    CSV, e só um bloco fica em memória por vez. O XGBoost percorre o
+    iterador e guarda as páginas em cache_prefix, no disco.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        target_col: str,
+        feature_cols_to_drop: list,
+        cache_prefix: str,
+        chunk_rows: int = 100_000,
+    ):
+        self.parquet_files = sorted(Path(directory).glob("*.parquet"))
+        self.csv_files = [] if self.parquet_files else sorted(Path(directory).glob("*.csv"))
+        if not self.parquet_files and not self.csv_files:
+            raise FileNotFoundError(f"Nenhum arquivo .parquet ou .csv encontrado em {directory}")
+        self.target_col = target_col
+        self.chunk_rows = chunk_rows
+        self._frames = None
+        if self.parquet_files:
+            import pyarrow.parquet as pq
+
+            names = pq.ParquetFile(self.parquet_files[0]).schema_arrow.names
+        else:
+            names = list(pd.read_csv(self.csv_files[0], nrows=0).columns)
+        self.columns = feature_columns(names, target_col, feature_cols_to_drop)
+        os.makedirs(os.path.dirname(cache_prefix), exist_ok=True)
+        super().__init__(cache_prefix=cache_prefix)
+
+    def _iter_frames(self):
+        if self.parquet_files:
+            import pyarrow.parquet as pq
+
+            for path in self.parquet_files:
+                parquet_file = pq.ParquetFile(path)
+                for row_group in range(parquet_file.num_row_groups):
+                    yield parquet_file.read_row_group(
+                        row_group, columns=self.columns + [self.target_col]
+                    ).to_pandas()
+        else:
+            for path in self.csv_files:
+                yield from pd.read_csv(
+                    path, usecols=self.columns + [self.target_col], chunksize=self.chunk_rows
+                )
+
+    def next(self, input_data) -> bool:
+        if self._frames is None:
+            self._frames = self._iter_frames()
+        df = next(self._frames, None)
+        if df is None:
+            return False
+        input_data(data=df[self.columns], label=df[self.target_col])
+        return True
+
+    def reset(self) -> None:
+        self._frames = None
+
+
+def external_memory_matrix(iterator: ChunkedFileIter, ref=None):
+    """
+    DMatrix de memória externa para o método hist: ExtMemQuantileDMatrix
+    (XGBoost >= 3.0) ou DMatrix sobre o iterador nas versões anteriores.
+    """
+    if hasattr(xgb, "ExtMemQuantileDMatrix"):
+        return xgb.ExtMemQuantileDMatrix(iterator, ref=ref)
+    return xgb.DMatrix(iterator)
+
+
+class RoundTimer(xgb.callback.TrainingCallback):
+    """Mede a duração de cada rodada de boosting (inclui a avaliação na validação)."""
+
+    def __init__(self):
+        super().__init__()
+        self.round_seconds = []
+        self._last = None
+
+    def before_training(self, model):
+        self._last = time.perf_counter()
+        return model
+
+    def after_iteration(self, model, epoch, evals_log) -> bool:
+        now = time.perf_counter()
+        self.round_seconds.append(now - self._last)
+        self._last = now
+        return False
+
+    def throughput(self, train_rows: int) -> dict:
+        """
+        Vazão do treinamento: rows_per_second conta cada linha uma vez por
+        rodada (linhas x rodadas / segundos de boosting).
+        """
+        rounds = len(self.round_seconds)
+        seconds = sum(self.round_seconds)
+        return {
+            "train_rows": train_rows,
+            "boosting_rounds": rounds,
+            "training_seconds": seconds,
+            "seconds_per_round": seconds / rounds if rounds else 0.0,
+            "max_seconds_per_round": max(self.round_seconds, default=0.0),
+            "rows_per_second": train_rows * rounds / seconds if seconds else 0.0,
+        }
+
+
+def _n_threads(n_jobs: int) -> int:
+    """Threads do XGBoost: n_jobs, ou todos os núcleos com n_jobs <= 0."""
+    if n_jobs is None or n_jobs <= 0:
+        return os.cpu_count() or 1
+    return n_jobs
+
+
+def train_model(X_train, y_train, args, X_val=None, y_val=None, callbacks: list = None):
+    """
+    Instancia e treina o XGBClassifier com hiperparâmetros fornecidos, com o
+    tree_method e as threads de args e, com o conjunto de validação, parada
+    antecipada pela logloss de validação.
+    """
     print("Treinando modelo XGBoost...")
+    early_stopping = args.early_stopping_rounds if X_val is not None else 0
     model = XGBClassifier(
         max_depth=args.max_depth,
         n_estimators=args.n_estimators,
@@ -88,9 +253,44 @@ def train_model(X_train, y_train, args):
         objective="binary:logistic",
         use_label_encoder=False,
         eval_metric="logloss",
+        tree_method=args.tree_method,
+        n_jobs=_n_threads(args.n_jobs),
+        early_stopping_rounds=early_stopping or None,
+        callbacks=callbacks,
+    )
+    eval_set = [(X_val, y_val)] if X_val is not None else None
+    model.fit(X_train, y_train, eval_set=eval_set, verbose=False)
+    print(f"Treinamento concluído ({model.get_booster().num_boosted_rounds()} rodadas).")
+    return model
+
+
+def train_model_external_memory(dtrain, dval, args, callbacks: list = None):
+    """
+    Treina com a API nativa sobre DMatrix de memória externa, com os mesmos
+    hiperparâmetros de train_model, e devolve o modelo como XGBClassifier
+    (o mesmo artefato do treinamento em memória).
+    """
+    print("Treinando modelo XGBoost em memória externa...")
+    params = {
+        "max_depth": args.max_depth,
+        "learning_rate": args.learning_rate,
+        "objective": "binary:logistic",
+        "eval_metric": "logloss",
+        "tree_method": args.tree_method,
+        "nthread": _n_threads(args.n_jobs),
+    }
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=args.n_estimators,
+        evals=[(dval, "validation")],
+        early_stopping_rounds=args.early_stopping_rounds or None,
+        callbacks=callbacks,
+        verbose_eval=False,
     )
-    model.fit(X_train, y_train)
-    print("Treinamento concluído.")
+    print(f"Treinamento concluído ({booster.num_boosted_rounds()} rodadas).")
+    model = XGBClassifier()
+    model.load_model(booster.save_raw("json"))
     return model
 
 
@@ -98,6 +298,21 @@ def evaluate_model(model, X_val, y_val):
     """Avalia o modelo nas métricas padrão e retorna um dicionário."""
     print("Avaliando modelo...")
     probs = model.predict_proba(X_val)[:, 1]
+    return classification_metrics(y_val, probs)
+
+
+def evaluate_model_external_memory(model, dval):
+    """Avalia o modelo sobre a DMatrix de validação (memória externa)."""
+    print("Avaliando modelo...")
+    booster = model.get_booster()
+    best_iteration = getattr(booster, "best_iteration", None)
+    iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+    probs = booster.predict(dval, iteration_range=iteration_range)
+    return classification_metrics(dval.get_label(), probs)
+
+
+def classification_metrics(y_val, probs) -> dict:
+    """Métricas padrão a partir das probabilidades da classe positiva."""
     preds = (probs >= 0.5).astype(int)
 
     metrics = {
@@ -114,11 +329,17 @@ def evaluate_model(model, X_val, y_val):
     return metrics
 
 
-def save_metrics(metrics: dict, output_path: str):
-    """Salva métricas em formato JSON compatível com SageMaker."""
+def save_metrics(metrics: dict, output_path: str, throughput: dict = None):
+    """
+    Salva métricas em formato JSON compatível com SageMaker, com a vazão do
+    treinamento (ver RoundTimer.throughput) em "throughput".
+    """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    report = {"metrics": metrics}
+    if throughput is not None:
+        report["throughput"] = throughput
     with open(output_path, "w") as f:
-        json.dump({"metrics": metrics}, f)
+        json.dump(report, f)
     print(f"Métricas salvas em {output_path}")
 
 
@@ -135,25 +356,63 @@ if __name__ == "__main__":
 
     print("Iniciando processo de treinamento...")
 
-    # 1. Carregamento dos dados
-    train_df = load_data(args.train)
-    val_df = load_data(args.validation)
+    target_column = args.target_column
+    id_columns_to_drop = ["machine_id", "timestamp_janela", "timestamp_processamento"]
 
-    # 2. Pré-processamento
-    target_column = "falha_nas_proximas_24h"
-    id_columns_to_drop = ["machine_id", "timestamp_processamento"] 
-    
-    X_train, y_train = separate_features_target(train_df, target_column, id_columns_to_drop)
-    X_val, y_val = separate_features_target(val_df, target_column, id_columns_to_drop)
+    timer = RoundTimer()
+    if args.external_memory:
+        # 1-2. Os canais são lidos em blocos pelo DataIter (colunas de
+        #      identificação não são lidas), sem carregar o conjunto em memória
+        dtrain = external_memory_matrix(
+            ChunkedFileIter(
+                args.train,
+                target_column,
+                id_columns_to_drop,
+                os.path.join(args.cache_dir, "train"),
+                args.chunk_rows,
+            )
+        )
+        dval = external_memory_matrix(
+            ChunkedFileIter(
+                args.validation,
+                target_column,
+                id_columns_to_drop,
+                os.path.join(args.cache_dir, "validation"),
+                args.chunk_rows,
+            ),
+            ref=dtrain,
+        )
+        train_rows = dtrain.num_row()
 
-    # 3. Treinamento
-    model = train_model(X_train, y_train, args)
+        # 3. Treinamento
+        model = train_model_external_memory(dtrain, dval, args, callbacks=[timer])
 
-    # 4. Avaliação
-    metrics = evaluate_model(model, X_val, y_val)
+        # 4. Avaliação
+        metrics = evaluate_model_external_memory(model, dval)
+    else:
+        # 1. Carregamento dos dados (colunas de identificação não são lidas)
+        train_df = load_data(args.train, id_columns_to_drop)
+        val_df = load_data(args.validation, id_columns_to_drop)
+
+        # 2. Pré-processamento
+        X_train, y_train = separate_features_target(train_df, target_column, id_columns_to_drop)
+        X_val, y_val = separate_features_target(val_df, target_column, id_columns_to_drop)
+        train_rows = len(X_train)
+
+        # 3. Treinamento
+        model = train_model(X_train, y_train, args, X_val, y_val, callbacks=[timer])
+
+        # 4. Avaliação
+        metrics = evaluate_model(model, X_val, y_val)
+
+    throughput = timer.throughput(train_rows)
+    print(
+        f"Vazão: {throughput['rows_per_second']:.0f} linhas/s, "
+        f"{throughput['seconds_per_round']:.3f} s por rodada."
+    )
 
     # 5. Persistência
-    save_metrics(metrics, "/opt/ml/output/data/evaluation.json")
+    save_metrics(metrics, "/opt/ml/output/data/evaluation.json", throughput)
     save_model(model, args.model_dir)
 
     print("Pipeline concluído com sucesso.")
@@ -143,8 +143,9 @@ module "processing" {
 module "training_pipeline" {
   source = "./modules/training_pipeline"
 
-  project_name   = var.project_name
-  s3_bucket_name = var.s3_bucket_name
+  project_name             = var.project_name
+  s3_bucket_name           = var.s3_bucket_name
+  label_history_table_name = module.ingestion.label_history_table_name
 
   # Camadas centralizadas
   numpy_layer_arn   = module.lambda_layers.numpy_layer_arn
@@ -78,6 +78,20 @@ resource "aws_dynamodb_table" "label_history" {
     type = "S"
   }
 
+  attribute {
+    name = "time_bucket"
+    type = "S"
+  }
+
+  # Falhas por dia (time_bucket) em ordem de tempo: o processamento consulta
+  # apenas os dias da janela de labels em vez de varrer a tabela
+  global_secondary_index {
+    name            = "time_bucket-timestamp_utc-index"
+    hash_key        = "time_bucket"
+    range_key       = "timestamp_utc"
+    projection_type = "KEYS_ONLY"
+  }
+
   tags = merge(var.tags, {
     Name    = "${var.project_name}-${var.label_history_table_name}"
     Purpose = "Label history for self-labeling"
@@ -288,8 +302,11 @@ resource "aws_lambda_function" "ingestion" {
 
   environment {
     variables = {
-      S3_BUCKET_NAME = aws_s3_bucket.data_lake.bucket
-      S3_PREFIX_ROOT = "raw"
+      S3_BUCKET_NAME        = aws_s3_bucket.data_lake.bucket
+      S3_PREFIX_ROOT        = "raw"
+      BATCH_MAX_RECORDS     = var.ingestion_batch_max_records
+      BATCH_MAX_BYTES       = var.ingestion_batch_max_bytes
+      BATCH_MAX_AGE_SECONDS = var.ingestion_batch_max_age_seconds
     }
   }
 
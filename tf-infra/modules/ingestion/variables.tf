@@ -49,6 +49,26 @@ variable "lambda_memory_size" {
   default     = 256
 }
 
+# --- CONFIGURAÇÕES DE INGESTÃO EM LOTE ---
+
+variable "ingestion_batch_max_records" {
+  description = "Número máximo de registros por objeto JSONL no modo em lote"
+  type        = number
+  default     = 5000
+}
+
+variable "ingestion_batch_max_bytes" {
+  description = "Tamanho máximo em bytes de cada objeto JSONL no modo em lote"
+  type        = number
+  default     = 8388608
+}
+
+variable "ingestion_batch_max_age_seconds" {
+  description = "Idade máxima em segundos de um buffer antes de ser gravado no S3"
+  type        = number
+  default     = 60
+}
+
 # --- CONFIGURAÇÕES DE TABELAS DYNAMODB ---
 
 variable "machine_state_table_name" {
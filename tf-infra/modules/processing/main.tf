@@ -26,6 +26,23 @@ resource "aws_dynamodb_table" "realtime_features" {
   })
 }
 
+# --- TABELA DYNAMODB PARA O ESTADO DAS MÁQUINAS ENTRE EXECUÇÕES ---
+
+resource "aws_dynamodb_table" "feature_state" {
+  name         = "${var.project_name}-${var.feature_state_table_name}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "machine_id"
+
+  attribute {
+    name = "machine_id"
+    type = "S"
+  }
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-${var.feature_state_table_name}"
+    Type = "Feature State"
+  })
+}
 
 # --- SSM PARAMETER STORE PARA GERENCIAMENTO DE ESTADO ---
 
@@ -100,12 +117,23 @@ resource "aws_iam_role_policy" "processing_lambda_policy" {
         Action = [
           "s3:PutObject"
         ]
-        Resource = "arn:aws:s3:::${var.s3_bucket_name}/processed/*"
+        Resource = [
+          "arn:aws:s3:::${var.s3_bucket_name}/processed/*",
+          "arn:aws:s3:::${var.s3_bucket_name}/compacted/*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:DeleteObject"
+        ]
+        Resource = "arn:aws:s3:::${var.s3_bucket_name}/processed/pending_labels/*"
       },
       {
         Effect = "Allow"
         Action = [
           "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
           "dynamodb:BatchWriteItem",
           "dynamodb:GetItem",
           "dynamodb:Query",
@@ -116,9 +144,21 @@ resource "aws_iam_role_policy" "processing_lambda_policy" {
       {
         Effect = "Allow"
         Action = [
+          "dynamodb:Query",
           "dynamodb:Scan"
         ]
-        Resource = "arn:aws:dynamodb:*:*:table/${var.label_history_table_name}"
+        Resource = [
+          "arn:aws:dynamodb:*:*:table/${var.label_history_table_name}",
+          "arn:aws:dynamodb:*:*:table/${var.label_history_table_name}/index/*"
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem"
+        ]
+        Resource = aws_dynamodb_table.feature_state.arn
       },
       {
         Effect = "Allow"
@@ -156,13 +196,33 @@ resource "aws_lambda_function" "processing_lambda" {
 
   environment {
     variables = {
-      DATA_LAKE_BUCKET             = var.s3_bucket_name
-      DYNAMODB_TABLE_NAME          = aws_dynamodb_table.realtime_features.name
-      DYNAMODB_LABEL_HISTORY_TABLE = var.label_history_table_name
-      SSM_PARAMETER_NAME           = aws_ssm_parameter.processing_state.name
-      TIME_WINDOW                  = var.time_window_hours
-      PREDICTION_HORIZON_HOURS     = var.prediction_horizon_hours
-      PROCESSING_LAG_HOURS         = var.processing_lag_hours
+      DATA_LAKE_BUCKET                   = var.s3_bucket_name
+      DYNAMODB_TABLE_NAME                = aws_dynamodb_table.realtime_features.name
+      DYNAMODB_LABEL_HISTORY_TABLE       = var.label_history_table_name
+      SSM_PARAMETER_NAME                 = aws_ssm_parameter.processing_state.name
+      TIME_WINDOW                        = var.time_window_hours
+      PREDICTION_HORIZON_HOURS           = var.prediction_horizon_hours
+      LABEL_HORIZONS_HOURS               = join(",", var.label_horizons_hours)
+      FEATURES_OUTPUT_FORMAT             = var.features_output_format
+      PROCESSING_LAG_HOURS               = var.processing_lag_hours
+      MERGE_ENGINE                       = var.merge_engine
+      FEATURE_ENGINE                     = var.feature_engine
+      VIB_EMA_ALPHA                      = var.vib_ema_alpha
+      FEATURE_STATE_TABLE                = aws_dynamodb_table.feature_state.name
+      CATCH_UP_MAX_WINDOWS               = var.catch_up_max_windows
+      CATCH_UP_PIPELINED                 = var.catch_up_pipelined
+      CATCH_UP_QUEUE_DEPTH               = var.catch_up_queue_depth
+      PROFILE_MODE                       = var.profile_mode
+      CHUNK_SIZE_EVENTS                  = var.chunk_size_events
+      CHUNK_MAX_WINDOWS_IN_MEMORY        = var.chunk_max_windows_in_memory
+      ADAPTIVE_WINDOW                    = var.adaptive_window
+      WINDOW_MIN_HOURS                   = var.window_min_hours
+      WINDOW_MAX_HOURS                   = var.window_max_hours
+      FEATURE_STORE_SOURCE               = var.enable_streaming_features ? "stream" : "batch"
+      WATERMARK_ENABLED                  = var.watermark_enabled
+      WATERMARK_DEFAULT_LATENESS_MINUTES = var.watermark_default_lateness_minutes
+      WATERMARK_MAX_LATENESS_HOURS       = var.watermark_max_lateness_hours
+      FEATURE_HISTORY_ENABLED            = var.feature_history_enabled
     }
   }
 
@@ -176,6 +236,134 @@ resource "aws_lambda_function" "processing_lambda" {
   ]
 }
 
+# --- FUNÇÃO LAMBDA DE COMPACTAÇÃO DO DATA LAKE BRUTO ---
+# Reutiliza o mesmo pacote da Lambda de processamento (compaction.py)
+
+resource "aws_lambda_function" "compaction_lambda" {
+  function_name = "${var.project_name}-compaction-lambda"
+  role          = aws_iam_role.processing_lambda_role.arn
+  handler       = "compaction.lambda_handler"
+  runtime       = "python3.12"
+
+  filename         = data.archive_file.processing_lambda_zip.output_path
+  source_code_hash = data.archive_file.processing_lambda_zip.output_base64sha256
+
+  timeout     = var.lambda_timeout
+  memory_size = var.lambda_memory_size
+
+  layers = [var.numpy_layer_arn, var.pandas_layer_arn]
+
+  environment {
+    variables = {
+      DATA_LAKE_BUCKET          = var.s3_bucket_name
+      COMPACTION_GRACE_MINUTES  = var.compaction_grace_minutes
+      COMPACTION_LOOKBACK_HOURS = var.compaction_lookback_hours
+    }
+  }
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-compaction-lambda"
+    Type = "Lambda Function"
+  })
+
+  depends_on = [
+    aws_iam_role_policy.processing_lambda_policy
+  ]
+}
+
+resource "aws_cloudwatch_event_rule" "compaction_schedule" {
+  name                = "${var.project_name}-compaction-schedule"
+  description         = "Trigger compaction lambda for closed raw hours"
+  schedule_expression = var.compaction_schedule_expression
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-compaction-schedule"
+  })
+}
+
+resource "aws_cloudwatch_event_target" "compaction_target" {
+  rule      = aws_cloudwatch_event_rule.compaction_schedule.name
+  target_id = "CompactionLambdaTarget"
+  arn       = aws_lambda_function.compaction_lambda.arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_compaction" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.compaction_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compaction_schedule.arn
+}
+
+# --- FUNÇÃO LAMBDA DE FEATURES EM STREAMING ---
+# Reutiliza o mesmo pacote da Lambda de processamento (streaming_features.py).
+# Atualiza a Feature Store a cada mensagem de telemetria; com ela ativa, a
+# Lambda de processamento em lote deixa de gravar na Feature Store.
+
+resource "aws_lambda_function" "streaming_features_lambda" {
+  count = var.enable_streaming_features ? 1 : 0
+
+  function_name = "${var.project_name}-streaming-features-lambda"
+  role          = aws_iam_role.processing_lambda_role.arn
+  handler       = "streaming_features.lambda_handler"
+  runtime       = "python3.12"
+
+  filename         = data.archive_file.processing_lambda_zip.output_path
+  source_code_hash = data.archive_file.processing_lambda_zip.output_base64sha256
+
+  timeout     = var.streaming_lambda_timeout
+  memory_size = var.streaming_lambda_memory_size
+
+  layers = [var.numpy_layer_arn, var.pandas_layer_arn]
+
+  environment {
+    variables = {
+      DYNAMODB_TABLE_NAME = aws_dynamodb_table.realtime_features.name
+      FEATURE_STATE_TABLE = aws_dynamodb_table.feature_state.name
+      DATA_LAKE_BUCKET    = var.s3_bucket_name
+      VIB_EMA_ALPHA       = var.vib_ema_alpha
+    }
+  }
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-streaming-features-lambda"
+    Type = "Lambda Function"
+  })
+
+  depends_on = [
+    aws_iam_role_policy.processing_lambda_policy
+  ]
+}
+
+resource "aws_iot_topic_rule" "streaming_features_rule" {
+  count = var.enable_streaming_features ? 1 : 0
+
+  name        = "${var.project_name}_streaming_features_rule"
+  description = "Rule to invoke streaming feature updates from MQTT telemetry topics"
+  enabled     = true
+
+  sql         = "SELECT * FROM '${var.streaming_topic_filter}'"
+  sql_version = "2016-03-23"
+
+  lambda {
+    function_arn = aws_lambda_function.streaming_features_lambda[0].arn
+  }
+
+  tags = merge(var.tags, {
+    Name = "${var.project_name}-streaming-features-rule"
+  })
+}
+
+resource "aws_lambda_permission" "allow_iot_streaming_features" {
+  count = var.enable_streaming_features ? 1 : 0
+
+  statement_id  = "AllowExecutionFromIoTStreaming"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.streaming_features_lambda[0].function_name
+  principal     = "iot.amazonaws.com"
+  source_arn    = aws_iot_topic_rule.streaming_features_rule[0].arn
+}
+
 # --- EVENTBRIDGE SCHEDULER ---
 
 resource "aws_cloudwatch_event_rule" "processing_schedule" {
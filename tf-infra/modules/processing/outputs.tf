@@ -12,6 +12,21 @@ output "processing_lambda_function_name" {
   value       = aws_lambda_function.processing_lambda.function_name
 }
 
+output "feature_state_table_name" {
+  description = "Nome da tabela DynamoDB com o estado das máquinas"
+  value       = aws_dynamodb_table.feature_state.name
+}
+
+output "compaction_lambda_function_name" {
+  description = "Nome da função Lambda de compactação do Data Lake bruto"
+  value       = aws_lambda_function.compaction_lambda.function_name
+}
+
+output "streaming_features_lambda_function_name" {
+  description = "Nome da função Lambda de features em streaming (vazio se desativada)"
+  value       = var.enable_streaming_features ? aws_lambda_function.streaming_features_lambda[0].function_name : ""
+}
+
 output "realtime_features_table_name" {
   description = "Nome da tabela DynamoDB para Feature Store"
   value       = aws_dynamodb_table.realtime_features.name
@@ -23,6 +23,12 @@ variable "realtime_features_table_name" {
   default     = "RealtimeFeatures"
 }
 
+variable "feature_state_table_name" {
+  description = "Nome da tabela DynamoDB com o estado das máquinas entre execuções do processamento"
+  type        = string
+  default     = "FeatureState"
+}
+
 variable "lambda_timeout" {
   description = "Timeout da função Lambda em segundos"
   type        = number
@@ -70,12 +76,162 @@ variable "prediction_horizon_hours" {
   default     = 24
 }
 
+variable "features_output_format" {
+  description = "Formato dos arquivos de features em processed/training_data (parquet ou csv)"
+  type        = string
+  default     = "parquet"
+}
+
+variable "catch_up_max_windows" {
+  description = "Máximo de janelas atrasadas processadas por invocação (1 desativa o catch-up)"
+  type        = number
+  default     = 24
+}
+
+variable "catch_up_pipelined" {
+  description = "Sobrepõe extração, transformação e carga das janelas no catch-up"
+  type        = bool
+  default     = false
+}
+
+variable "catch_up_queue_depth" {
+  description = "Janelas pré-buscadas e gravações pendentes em cada fila do catch-up em pipeline"
+  type        = number
+  default     = 1
+}
+
+variable "profile_mode" {
+  description = "Perfil da execução gravado no log: vazio (desativado), cprofile ou tracemalloc"
+  type        = string
+  default     = ""
+}
+
+variable "chunk_size_events" {
+  description = "Eventos por bloco no modo chunked do processamento (0 processa a janela em memória)"
+  type        = number
+  default     = 0
+}
+
+variable "chunk_max_windows_in_memory" {
+  description = "No modo chunked, janelas mantidas em memória antes do spill para /tmp"
+  type        = number
+  default     = 500000
+}
+
+variable "adaptive_window" {
+  description = "Escolhe o tamanho de cada janela pelo volume estimado das partições (em vez de time_window_hours)"
+  type        = bool
+  default     = false
+}
+
+variable "window_min_hours" {
+  description = "Menor janela adaptativa em horas"
+  type        = number
+  default     = 1
+}
+
+variable "window_max_hours" {
+  description = "Maior janela adaptativa em horas"
+  type        = number
+  default     = 24
+}
+
+variable "watermark_enabled" {
+  description = "Processa as janelas pelo watermark de tempo de evento (estatísticas de chegada da compactação) em vez do processing_lag fixo"
+  type        = bool
+  default     = false
+}
+
+variable "watermark_default_lateness_minutes" {
+  description = "Atraso assumido no watermark quando não há manifestos recentes com estatísticas de chegada"
+  type        = number
+  default     = 60
+}
+
+variable "watermark_max_lateness_hours" {
+  description = "Maior atraso considerado no watermark; leituras mais atrasadas são tratadas por recálculo"
+  type        = number
+  default     = 6
+}
+
+variable "enable_streaming_features" {
+  description = "Atualiza a Feature Store a cada mensagem de telemetria (Lambda de streaming) em vez de a cada execução em lote"
+  type        = bool
+  default     = false
+}
+
+variable "streaming_topic_filter" {
+  description = "Filtro de tópicos MQTT consumidos pela Lambda de features em streaming"
+  type        = string
+  default     = "industrial/machine/+/+"
+}
+
+variable "streaming_lambda_memory_size" {
+  description = "Memória em MB da Lambda de features em streaming"
+  type        = number
+  default     = 256
+}
+
+variable "streaming_lambda_timeout" {
+  description = "Timeout em segundos da Lambda de features em streaming; no primeiro uso de uma máquina ela relê do data lake as leituras posteriores ao estado do lote"
+  type        = number
+  default     = 60
+}
+
+variable "label_horizons_hours" {
+  description = "Horizontes (em horas) das labels label_falha_{h}h geradas em uma única passada"
+  type        = list(number)
+  default     = [24]
+}
+
 variable "processing_lag_hours" {
   description = "Lag de processamento em horas para garantir dados completos"
   type        = number
   default     = 24
 }
 
+variable "merge_engine" {
+  description = "Implementação do merge de eventos na Lambda de processamento (python, vectorized ou columnar)"
+  type        = string
+  default     = "columnar"
+}
+
+variable "feature_engine" {
+  description = "Implementação do cálculo de features na Lambda de processamento (python ou vectorized)"
+  type        = string
+  default     = "vectorized"
+}
+
+variable "vib_ema_alpha" {
+  description = "Fator de suavização da média móvel exponencial de vibração (vib_media_5h)"
+  type        = number
+  default     = 0.01
+}
+
+variable "compaction_schedule_expression" {
+  description = "Expressão de agendamento da compactação das partições raw/"
+  type        = string
+  default     = "cron(15 * * * ? *)"
+}
+
+variable "compaction_grace_minutes" {
+  description = "Minutos de carência após o fim da hora antes de compactá-la"
+  type        = number
+  default     = 10
+}
+
+variable "compaction_lookback_hours" {
+  description = "Quantidade de horas encerradas verificadas a cada execução da compactação"
+  type        = number
+  default     = 3
+}
+
+variable "feature_history_enabled" {
+  description = "Acrescenta um snapshot sem labels de cada gravação de features ao histórico (processed/feature_history) usado pela preparação do treino"
+  type        = bool
+  default     = true
+}
+
 variable "tags" {
   description = "Tags adicionais para os recursos"
   type        = map(string)
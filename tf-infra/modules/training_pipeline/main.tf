@@ -65,12 +65,27 @@ resource "aws_iam_role_policy" "pipeline_lambda_policy" {
       },
       {
         Effect = "Allow",
-        Action = ["s3:GetObject", "s3:PutObject", "s3:ListBucket"],
+        Action = ["s3:GetObject", "s3:PutObject", "s3:ListBucket", "s3:AbortMultipartUpload"],
         Resource = [
           "arn:aws:s3:::${var.s3_bucket_name}",
           "arn:aws:s3:::${var.s3_bucket_name}/*"
         ]
       },
+      {
+        # Falhas usadas para rotular o histórico de features (LabelHorizons)
+        Effect = "Allow",
+        Action = ["dynamodb:Query"],
+        Resource = [
+          "arn:aws:dynamodb:*:*:table/${var.label_history_table_name}",
+          "arn:aws:dynamodb:*:*:table/${var.label_history_table_name}/index/*"
+        ]
+      },
+      {
+        # Remoção dos shards substituídos no cache de consolidação diária do data_prep
+        Effect   = "Allow",
+        Action   = ["s3:DeleteObject"],
+        Resource = "arn:aws:s3:::${var.s3_bucket_name}/sagemaker/shard-cache/*"
+      },
       {
         Effect   = "Allow",
         Action   = ["sagemaker:CreateModelPackage"],
@@ -91,11 +106,25 @@ resource "aws_lambda_function" "data_prep" {
 
   timeout     = var.lambda_timeout
   memory_size = var.lambda_memory_size
-  layers      = [var.numpy_layer_arn, var.pandas_layer_arn, var.sklearn_layer_arn]
+  layers      = [var.numpy_layer_arn, var.pandas_layer_arn]
+
+  # Baldes do embaralhamento externo em /tmp (SHUFFLE_DIR)
+  ephemeral_storage {
+    size = var.data_prep_ephemeral_storage_mb
+  }
 
   environment {
     variables = {
-      S3_BUCKET_NAME = var.s3_bucket_name
+      S3_BUCKET_NAME             = var.s3_bucket_name
+      TRAINING_DATA_FORMAT       = var.training_data_format
+      DATA_PREP_DOWNLOAD_WORKERS = var.data_prep_download_workers
+      MULTIPART_PART_SIZE_MB     = var.multipart_part_size_mb
+      SPLIT_GROUP_KEY            = var.split_group_key
+      VALIDATION_FRACTION        = var.validation_fraction
+      VALIDATION_HOLDOUT_HOURS   = var.validation_holdout_hours
+      SHUFFLE_BUCKET_MB          = var.shuffle_bucket_mb
+      SHARD_CACHE_ENABLED        = var.shard_cache_enabled
+      FAILURES_TABLE_NAME        = var.label_history_table_name
     }
   }
 
@@ -214,7 +243,14 @@ locals {
       DataPrep = {
         Type     = "Task",
         Resource = aws_lambda_function.data_prep.arn,
-        Next     = "TrainModel"
+        Next     = "TrainingHyperParameters"
+      },
+      # Hiperparâmetros fixos mais a label do horizonte preparado (TargetColumn do data_prep)
+      TrainingHyperParameters = {
+        Type       = "Pass",
+        Parameters = merge(var.training_hyperparameters, { "target_column.$" = "$.TargetColumn" }),
+        ResultPath = "$.HyperParameters",
+        Next       = "TrainModel"
       },
       TrainModel = {
         Type     = "Task",
@@ -242,8 +278,8 @@ locals {
             InstanceType   = "ml.m5.large"
             VolumeSizeInGB = 30
           }
-          StoppingCondition = { MaxRuntimeInSeconds = 3600 }
-          HyperParameters   = var.training_hyperparameters
+          StoppingCondition   = { MaxRuntimeInSeconds = 3600 }
+          "HyperParameters.$" = "$.HyperParameters"
         },
         ResultPath = "$.TrainingJob",
         Next       = "EvaluateModel"
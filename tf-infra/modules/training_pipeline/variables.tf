@@ -8,6 +8,11 @@ variable "s3_bucket_name" {
   type        = string
 }
 
+variable "label_history_table_name" {
+  description = "Nome da tabela DynamoDB de histórico de falhas, usada para rotular o histórico de features"
+  type        = string
+}
+
 variable "numpy_layer_arn" {
   description = "ARN da camada Lambda numpy (criada pelo módulo lambda_layers)"
   type        = string
@@ -42,11 +47,65 @@ variable "training_image_uri" {
 }
 
 variable "training_hyperparameters" {
-  description = "Mapa de hiperparâmetros a serem passados ao Training Job"
+  description = "Mapa de hiperparâmetros a serem passados ao Training Job (target_column vem do TargetColumn do data_prep)"
   type        = map(string)
   default     = { "max_depth" : "6", "n_estimators" : "100", "learning_rate" : "0.1" }
 }
 
+variable "training_data_format" {
+  description = "Formato dos conjuntos de treino/validação gerados pelo data_prep (parquet ou csv)"
+  type        = string
+  default     = "parquet"
+}
+
+variable "data_prep_download_workers" {
+  description = "Threads que baixam os arquivos de features em paralelo no data_prep"
+  type        = number
+  default     = 8
+}
+
+variable "multipart_part_size_mb" {
+  description = "Tamanho (MB, mínimo 5) das partes do multipart upload dos conjuntos de treino/validação"
+  type        = number
+  default     = 8
+}
+
+variable "split_group_key" {
+  description = "Chave dos grupos que vão inteiros para treino ou validação (colunas, 'day' ou 'hour')"
+  type        = string
+  default     = "machine_id,day"
+}
+
+variable "validation_fraction" {
+  description = "Fração dos grupos destinada à validação"
+  type        = number
+  default     = 0.2
+}
+
+variable "validation_holdout_hours" {
+  description = "Holdout temporal: linhas das últimas N horas vão para a validação (0 desativa)"
+  type        = number
+  default     = 0
+}
+
+variable "shuffle_bucket_mb" {
+  description = "Tamanho (MB nos arquivos de origem) de cada balde do embaralhamento externo do data_prep"
+  type        = number
+  default     = 64
+}
+
+variable "shard_cache_enabled" {
+  description = "Reutiliza os shards diários consolidados (sagemaker/shard-cache) dos dias cujos arquivos de features não mudaram"
+  type        = bool
+  default     = true
+}
+
+variable "data_prep_ephemeral_storage_mb" {
+  description = "Armazenamento efêmero (/tmp) da Lambda data_prep, usado pelos baldes do embaralhamento"
+  type        = number
+  default     = 4096
+}
+
 variable "sagemaker_training_role_arn" {
   description = "ARN da IAM Role que o SageMaker usará no Training Job"
   type        = string